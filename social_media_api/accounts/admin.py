@@ -1,13 +1,13 @@
 # accounts/admin.py
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser
+from .models import CustomUser, Follow
 
 class CustomUserAdmin(UserAdmin):
     # Add custom fields to the user detail view
     fieldsets = UserAdmin.fieldsets + (
         ('Additional Info', {
-            'fields': ('bio', 'profile_picture', 'followers')
+            'fields': ('bio', 'profile_picture')
         }),
     )
     
@@ -21,4 +21,11 @@ class CustomUserAdmin(UserAdmin):
     list_display = UserAdmin.list_display + ('bio', 'followers_count', 'following_count')
 
 # Register the custom user model
-admin.site.register(CustomUser, CustomUserAdmin)
\ No newline at end of file
+admin.site.register(CustomUser, CustomUserAdmin)
+
+# Follows have a through model with a timestamp, edited on their own
+@admin.register(Follow)
+class FollowAdmin(admin.ModelAdmin):
+    list_display = ['follower', 'followed', 'created_at']
+    raw_id_fields = ['follower', 'followed']
+    ordering = ['-created_at']
@@ -0,0 +1,404 @@
+# accounts/follow_graph.py
+"""
+Memory-mapped snapshot of the follow graph for membership and
+intersection queries ("X follows Y?", mutual followers, "followed by
+people you follow") without multi-join SQL on the Follow table.
+
+`manage.py build_follow_graph` (run periodically, e.g. from cron) writes
+every follow to FOLLOW_GRAPH_PATH as two CSR adjacency structures: for
+each user ID, the sorted int32 IDs of the users they follow and of their
+followers, with int64 offsets into those arrays. The file is replaced
+atomically. Worker processes mmap it read-only, so they all share one
+copy in the OS page cache, and switch to a new file on their next
+refresh. Size: 8 bytes per follow plus 16 bytes per user ID, about
+96 MB for 10M follows between 1M users.
+
+"X follows Y?" is a binary search in X's slice. Intersections of two
+sorted slices use NumPy when available (a merge, or a binary search of
+the short list in the long one); otherwise bisect and sets.
+
+Changes since the build come from a delta overlay that each process
+updates every FOLLOW_GRAPH_REFRESH_INTERVAL seconds. Follow rows with
+an ID above the snapshot's watermark are additions. FollowRemoval rows
+(written whenever a Follow row is deleted, see accounts.signals) above
+the removal watermark are removals. A current Follow row wins over a
+removal. Each refresh only reads the rows after the highest ID it has
+seen, minus FOLLOW_GRAPH_ID_LOOKBACK: on PostgreSQL an ID is assigned
+before its transaction commits, so a row can become visible after rows
+with higher IDs, including after the snapshot's watermark was taken.
+The overlay grows until the next rebuild, which also prunes removal
+rows that no snapshot needs any more.
+
+The file layout is little-endian, like the hosts it runs on.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from pathlib import Path
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Max
+from .follows import follow_table
+from .models import FollowRemoval
+
+try:
+    import numpy as np
+except ImportError:  # Fall back to bisect and sets
+    np = None
+
+User = get_user_model()
+
+MAGIC = b'FGRAPH01'
+# magic, user ID slots, follows, Follow ID watermark, FollowRemoval ID watermark, build time
+HEADER = struct.Struct('<8sqqqqd')
+# Binary-search the short list in the long one past this length ratio
+SKEW_RATIO = 32
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_graph_path():
+    return Path(getattr(settings, 'FOLLOW_GRAPH_PATH', settings.BASE_DIR / 'follow_graph.bin'))
+
+
+def get_id_lookback():
+    """IDs below the highest seen that each overlay refresh reads again"""
+    return getattr(settings, 'FOLLOW_GRAPH_ID_LOOKBACK', 1000)
+
+
+def _csr(sources, targets, num_nodes):
+    """(offsets bytes, targets bytes) of the edges grouped by source, targets sorted"""
+    if np is not None:
+        order = np.lexsort((targets, sources))
+        offsets = np.zeros(num_nodes + 1, dtype='<i8')
+        np.cumsum(np.bincount(sources, minlength=num_nodes), out=offsets[1:])
+        return offsets.tobytes(), targets[order].astype('<i4').tobytes()
+
+    # Counting sort by source, then sort each adjacency list
+    offsets = array('q', bytes(8 * (num_nodes + 1)))
+    for source in sources:
+        offsets[source + 1] += 1
+    for node in range(num_nodes):
+        offsets[node + 1] += offsets[node]
+    position = array('q', offsets[:-1])
+    grouped = array('i', bytes(4 * len(targets)))
+    for source, target in zip(sources, targets):
+        grouped[position[source]] = target
+        position[source] += 1
+    for node in range(num_nodes):
+        start, end = offsets[node], offsets[node + 1]
+        if end - start > 1:
+            grouped[start:end] = array('i', sorted(grouped[start:end]))
+    return offsets.tobytes(), grouped.tobytes()
+
+
+def write_snapshot(path, followers, followed, num_nodes, follow_watermark=0, removal_watermark=0):
+    """
+    Write a snapshot of the follows followers[i] -> followed[i] (int32
+    arrays: NumPy, or array('i') without NumPy) and atomically replace
+    path with it.
+    """
+    path = Path(path)
+    following_offsets, following_targets = _csr(followers, followed, num_nodes)
+    follower_offsets, follower_targets = _csr(followed, followers, num_nodes)
+    temporary = path.with_name(path.name + '.tmp')
+    with open(temporary, 'wb') as snapshot:
+        snapshot.write(HEADER.pack(MAGIC, num_nodes, len(followers), follow_watermark, removal_watermark, time.time()))
+        for block in (following_offsets, follower_offsets, following_targets, follower_targets):
+            snapshot.write(block)
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+    os.replace(temporary, path)
+
+
+def read_header(path):
+    """(user ID slots, follows, follow watermark, removal watermark, build time) of a snapshot"""
+    with open(path, 'rb') as snapshot:
+        magic, *fields = HEADER.unpack(snapshot.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a follow graph snapshot')
+    return tuple(fields)
+
+
+def build_snapshot(path=None, chunk_size=100000):
+    """
+    Snapshot every follow into path (FOLLOW_GRAPH_PATH by default) and
+    prune the removal log rows older than the previous snapshot.
+    Returns the number of follows written.
+    """
+    path = Path(path or get_graph_path())
+    previous = read_header(path) if path.exists() else None
+    through, followed_column, follower_column = follow_table()
+
+    followers, followed = array('i'), array('i')
+    # Watermarks and scan from one snapshot of the database. SQLite
+    # transactions are serializable; PostgreSQL needs REPEATABLE READ, and
+    # rows that commit after it with a lower ID reach the overlay through
+    # its ID lookback.
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        removal_watermark = FollowRemoval.objects.aggregate(top=Max('id'))['top'] or 0
+        follow_watermark = through.objects.aggregate(top=Max('id'))['top'] or 0
+        rows = (
+            through.objects.filter(id__lte=follow_watermark).order_by()
+            .values_list(follower_column, followed_column).iterator(chunk_size=chunk_size)
+        )
+        for follower_id, followed_id in rows:
+            followers.append(follower_id)
+            followed.append(followed_id)
+        highest_user = User.objects.aggregate(top=Max('id'))['top'] or 0
+    num_nodes = max(highest_user, max(followers, default=0), max(followed, default=0)) + 1
+
+    if np is not None:
+        followers, followed = np.frombuffer(followers, dtype=np.int32), np.frombuffer(followed, dtype=np.int32)
+    write_snapshot(path, followers, followed, num_nodes, follow_watermark, removal_watermark)
+    if previous is not None:
+        # Processes still on the previous snapshot need removals after its watermark
+        FollowRemoval.objects.filter(id__lte=previous[3]).delete()
+    return len(followers)
+
+
+def _contains(sorted_ids, value):
+    index = bisect_left(sorted_ids, value)
+    return index < len(sorted_ids) and sorted_ids[index] == value
+
+
+def _sorted_intersection(first, second):
+    """Common IDs of two sorted int32 sequences"""
+    if len(first) > len(second):
+        first, second = second, first
+    if not len(first):
+        return []
+    if np is not None:
+        short = np.frombuffer(first, dtype=np.int32)
+        long = np.frombuffer(second, dtype=np.int32)
+        if len(long) > SKEW_RATIO * len(short):
+            positions = np.minimum(np.searchsorted(long, short), len(long) - 1)
+            return short[long[positions] == short].tolist()
+        return np.intersect1d(short, long, assume_unique=True).tolist()
+    if len(second) > SKEW_RATIO * len(first):
+        return [value for value in first if _contains(second, value)]
+    return sorted(set(first).intersection(second))
+
+
+class _Snapshot:
+    """The mmapped arrays of one snapshot file"""
+
+    def __init__(self, path):
+        stat = os.stat(path)
+        self.file_id = (stat.st_ino, stat.st_mtime_ns)
+        with open(path, 'rb') as snapshot:
+            self.buffer = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.num_nodes, self.num_edges, self.follow_watermark, self.removal_watermark, self.built_at = (
+            HEADER.unpack_from(self.buffer, 0)
+        )
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a follow graph snapshot')
+
+        view = memoryview(self.buffer)
+        position = HEADER.size
+        sections = []
+        for item_size, count, code in ((8, self.num_nodes + 1, 'q'), (8, self.num_nodes + 1, 'q'),
+                                       (4, self.num_edges, 'i'), (4, self.num_edges, 'i')):
+            sections.append(view[position:position + item_size * count].cast(code))
+            position += item_size * count
+        self.following_offsets, self.follower_offsets, self.following_targets, self.follower_targets = sections
+
+    def following(self, user_id):
+        if not 0 <= user_id < self.num_nodes:
+            return self.following_targets[0:0]
+        return self.following_targets[self.following_offsets[user_id]:self.following_offsets[user_id + 1]]
+
+    def followers(self, user_id):
+        if not 0 <= user_id < self.num_nodes:
+            return self.follower_targets[0:0]
+        return self.follower_targets[self.follower_offsets[user_id]:self.follower_offsets[user_id + 1]]
+
+
+class _Overlay:
+    """
+    Follows added and removed since a snapshot, per user and direction.
+    load() applies the rows written since the previous load; the per-user
+    sets are replaced rather than changed, so readers never see a set
+    being modified.
+    """
+
+    def __init__(self, follow_watermark=0, removal_watermark=0):
+        # Highest Follow and FollowRemoval IDs read so far
+        self.follow_after = follow_watermark
+        self.removal_after = removal_watermark
+        self.following_added, self.followers_added = {}, {}
+        self.following_removed, self.followers_removed = {}, {}
+
+    def load(self, lookback=0):
+        """Read the rows after the last load (and lookback IDs below) and apply them"""
+        through, followed_column, follower_column = follow_table()
+        removals = list(
+            FollowRemoval.objects.filter(id__gt=self.removal_after - lookback)
+            .values_list('id', 'follower_id', 'followed_id')
+        )
+        follows = list(
+            through.objects.filter(id__gt=self.follow_after - lookback)
+            .values_list('id', follower_column, followed_column)
+        )
+        present = {(follower_id, followed_id) for _, follower_id, followed_id in follows}
+        removed = {(follower_id, followed_id) for _, follower_id, followed_id in removals} - present
+        if removed:
+            # A current Follow row means the follow exists, whatever was removed before
+            refollowed = through.objects.filter(**{
+                f'{follower_column}__in': {follower_id for follower_id, _ in removed},
+                f'{followed_column}__in': {followed_id for _, followed_id in removed},
+            }).values_list(follower_column, followed_column)
+            present.update(pair for pair in refollowed if pair in removed)
+            removed -= present
+
+        for follower_id, followed_id in present:
+            self._apply(follower_id, followed_id, self.following_added, self.followers_added,
+                        self.following_removed, self.followers_removed)
+        for follower_id, followed_id in removed:
+            self._apply(follower_id, followed_id, self.following_removed, self.followers_removed,
+                        self.following_added, self.followers_added)
+        self.follow_after = max([self.follow_after] + [row[0] for row in follows])
+        self.removal_after = max([self.removal_after] + [row[0] for row in removals])
+        return self
+
+    @staticmethod
+    def _apply(follower_id, followed_id, following, followers, following_other, followers_other):
+        """Record follower -> followed in one pair of maps and drop it from the other"""
+        following[follower_id] = following.get(follower_id, frozenset()) | {followed_id}
+        followers[followed_id] = followers.get(followed_id, frozenset()) | {follower_id}
+        if followed_id in following_other.get(follower_id, ()):
+            following_other[follower_id] = following_other[follower_id] - {followed_id}
+        if follower_id in followers_other.get(followed_id, ()):
+            followers_other[followed_id] = followers_other[followed_id] - {follower_id}
+
+
+class FollowGraph:
+    """
+    Queries on the snapshot at path plus the delta overlay. overlay=False
+    answers from the snapshot alone and never touches the database.
+    """
+
+    def __init__(self, path, overlay=True):
+        self.path = Path(path)
+        self.use_overlay = overlay
+        self._snapshot = _Snapshot(self.path)
+        self._overlay = self._new_overlay(self._snapshot)
+        self._checked_at = None
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """Switch to a newer snapshot file and reload the overlay, at most once per interval"""
+        interval = getattr(settings, 'FOLLOW_GRAPH_REFRESH_INTERVAL', 5)
+        with self._refresh_lock:
+            now = time.monotonic()
+            if not force and self._checked_at is not None and now - self._checked_at < interval:
+                return
+            self._checked_at = now
+            stat = os.stat(self.path)
+            if (stat.st_ino, stat.st_mtime_ns) != self._snapshot.file_id:
+                snapshot = _Snapshot(self.path)
+                overlay = self._new_overlay(snapshot)
+                if self.use_overlay:
+                    overlay.load(get_id_lookback())
+                # Swap both at once so a query never mixes two snapshots
+                self._snapshot, self._overlay = snapshot, overlay
+            elif self.use_overlay:
+                # Same snapshot: only the rows written since the last refresh
+                self._overlay.load(get_id_lookback())
+
+    @staticmethod
+    def _new_overlay(snapshot):
+        return _Overlay(snapshot.follow_watermark, snapshot.removal_watermark)
+
+    def _state(self):
+        if self.use_overlay:
+            self.refresh()
+        return self._snapshot, self._overlay
+
+    def follows(self, follower_id, followed_id):
+        """True if follower_id follows followed_id"""
+        snapshot, overlay = self._state()
+        if followed_id in overlay.following_added.get(follower_id, ()):
+            return True
+        if followed_id in overlay.following_removed.get(follower_id, ()):
+            return False
+        return _contains(snapshot.following(follower_id), followed_id)
+
+    def _following(self, snapshot, overlay, user_id):
+        return (
+            snapshot.following(user_id),
+            overlay.following_added.get(user_id, set()),
+            overlay.following_removed.get(user_id, set()),
+        )
+
+    def _followers(self, snapshot, overlay, user_id):
+        return (
+            snapshot.followers(user_id),
+            overlay.followers_added.get(user_id, set()),
+            overlay.followers_removed.get(user_id, set()),
+        )
+
+    @staticmethod
+    def _ids(side):
+        stored, added, removed = side
+        if not added and not removed:
+            return list(stored)
+        return sorted((set(stored) | added) - removed)
+
+    @staticmethod
+    def _intersect(first, second):
+        """Sorted common IDs of two (snapshot slice, added, removed) sides"""
+        first_ids, first_added, first_removed = first
+        second_ids, second_added, second_removed = second
+        common = set(_sorted_intersection(first_ids, second_ids))
+        common.update(
+            user_id for user_id in first_added
+            if user_id in second_added or _contains(second_ids, user_id)
+        )
+        common.update(user_id for user_id in second_added if _contains(first_ids, user_id))
+        return sorted(common - first_removed - second_removed)
+
+    def following_ids(self, user_id):
+        snapshot, overlay = self._state()
+        return self._ids(self._following(snapshot, overlay, user_id))
+
+    def follower_ids(self, user_id):
+        snapshot, overlay = self._state()
+        return self._ids(self._followers(snapshot, overlay, user_id))
+
+    def mutual_followers(self, first_id, second_id):
+        """Users following both users"""
+        snapshot, overlay = self._state()
+        return self._intersect(self._followers(snapshot, overlay, first_id), self._followers(snapshot, overlay, second_id))
+
+    def known_followers(self, viewer_id, user_id):
+        """Users the viewer follows who follow user_id ("followed by people you follow")"""
+        snapshot, overlay = self._state()
+        return self._intersect(self._following(snapshot, overlay, viewer_id), self._followers(snapshot, overlay, user_id))
+
+    def friends(self, user_id):
+        """Users that user_id follows and who follow back"""
+        snapshot, overlay = self._state()
+        return self._intersect(self._following(snapshot, overlay, user_id), self._followers(snapshot, overlay, user_id))
+
+
+def get_follow_graph():
+    """The graph of this process, or None until a snapshot has been built"""
+    global _graph
+    with _graph_lock:
+        if _graph is None:
+            path = get_graph_path()
+            if not path.exists():
+                return None
+            _graph = FollowGraph(path)
+        return _graph
@@ -0,0 +1,129 @@
+# accounts/follows.py
+"""
+Follow writes straight on the CustomUser.followers through table
+(the Follow model), and the follower/following list querysets.
+
+The table and column names are read from the M2M field metadata: the
+through row's source column is the followed user (whose `followers`
+it extends), the target column is the follower.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from common.upserts import insert_ignore, insert_ignore_many
+
+User = get_user_model()
+
+
+def follow_table():
+    """(through model, followed user attname, follower attname)"""
+    field = User._meta.get_field('followers')
+    through = field.remote_field.through
+    return (
+        through,
+        through._meta.get_field(field.m2m_field_name()).attname,
+        through._meta.get_field(field.m2m_reverse_field_name()).attname,
+    )
+
+
+def with_follow_counts(queryset):
+    """
+    Annotate users with followers_total and following_total, read by
+    CustomUser.followers_count()/following_count(), so serializing a page
+    of users needs no COUNT query per user. Each total is a correlated
+    subquery on the through table's index rather than a JOIN, which would
+    multiply a user's followers by their followings.
+    """
+    through, followed_column, follower_column = follow_table()
+
+    def total(column):
+        counts = (
+            through.objects.filter(**{column: OuterRef('pk')})
+            .order_by().values(column).annotate(total=Count('*')).values('total')
+        )
+        return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+    return queryset.annotate(followers_total=total(followed_column), following_total=total(follower_column))
+
+
+def following_queryset(user):
+    """
+    Users that user follows, most recent follow first. The sort keys
+    (followed_at, follow_id) come from the Follow row, so keyset pages
+    are range scans on the (follower, created_at, id) index.
+    """
+    return (
+        User.objects.filter(follower_links__follower=user)
+        .annotate(followed_at=F('follower_links__created_at'), follow_id=F('follower_links__id'))
+        .order_by('-followed_at', '-follow_id')
+    )
+
+
+def followers_queryset(user):
+    """Users following user, most recent follow first (see following_queryset())"""
+    return (
+        User.objects.filter(following_links__followed=user)
+        .annotate(followed_at=F('following_links__created_at'), follow_id=F('following_links__id'))
+        .order_by('-followed_at', '-follow_id')
+    )
+
+
+def get_relationship_max_items():
+    """Most user IDs accepted by one relationship check"""
+    return getattr(settings, 'RELATIONSHIP_CHECK_MAX_ITEMS', 500)
+
+
+def relationships(user_id, other_ids):
+    """
+    (IDs user_id follows, IDs following user_id) among other_ids, from
+    one query on the through table covering both directions.
+    """
+    through, followed_column, follower_column = follow_table()
+    rows = through.objects.filter(
+        Q(**{follower_column: user_id, f'{followed_column}__in': other_ids})
+        | Q(**{followed_column: user_id, f'{follower_column}__in': other_ids})
+    ).values_list(followed_column, follower_column)
+    following, followed_by = set(), set()
+    for followed_id, follower_id in rows:
+        if follower_id == user_id:
+            following.add(followed_id)
+        if followed_id == user_id:
+            followed_by.add(follower_id)
+    return following, followed_by
+
+
+def add_follow(follower_id, followed_id):
+    """Make follower follow followed in one INSERT; True if it is a new follow"""
+    through, followed_column, follower_column = follow_table()
+    return insert_ignore(through, **{followed_column: followed_id, follower_column: follower_id})
+
+
+def add_follows(follower_id, followed_ids):
+    """
+    Follow several users with one bulk INSERT; returns the IDs that were
+    newly followed (already followed ones are skipped). Only rows this
+    call inserted count as new, so of two concurrent bulk follows of the
+    same user exactly one reports it (and backfills and notifies).
+    """
+    through, followed_column, follower_column = follow_table()
+    inserted = insert_ignore_many(
+        through,
+        [{followed_column: user_id, follower_column: follower_id} for user_id in dict.fromkeys(followed_ids)],
+        returning=(followed_column,),
+    )
+    return [user_id for (user_id,) in inserted]
+
+
+def remove_follows(follower_id, followed_ids):
+    """
+    Unfollow several users with one DELETE; returns the IDs that were
+    followed. The post_delete signal logs the removals for the follow
+    graph snapshot (see accounts.signals).
+    """
+    through, followed_column, follower_column = follow_table()
+    follows = through.objects.filter(**{follower_column: follower_id, f'{followed_column}__in': followed_ids})
+    removed = list(follows.select_for_update().values_list(followed_column, flat=True))
+    if removed:
+        follows.delete()
+    return removed
@@ -0,0 +1,144 @@
+# accounts/management/commands/bench_follow_graph.py
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from django.core.management.base import BaseCommand, CommandError
+from accounts import follow_graph
+from accounts.follow_graph import FollowGraph, write_snapshot
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    """
+    Compare follow graph queries on SQL (the follow table with the same
+    indexes as accounts_customuser_followers) with the memory-mapped CSR
+    snapshot at 10M follows. Works on a standalone SQLite file and
+    snapshot through the sqlite3 module, so it never touches the
+    project database. Followed users are drawn from a power law, so a
+    few accounts have hundreds of thousands of followers.
+    Usage: python manage.py bench_follow_graph [--users 1000000] [--edges 10000000] [--queries 200] [--db /tmp/follows.sqlite3]
+    """
+    help = 'Benchmark SQL joins against the follow graph snapshot on a synthetic graph'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000000)
+        parser.add_argument('--edges', type=int, default=10000000)
+        parser.add_argument('--queries', type=int, default=200, help='Queries per kind')
+        parser.add_argument('--db', default=None, help='Reuse this SQLite file between runs')
+
+    def handle(self, *args, **options):
+        np = follow_graph.np
+        if np is None:
+            raise CommandError('Generating a synthetic graph of this size needs NumPy.')
+        users, edges = options['users'], options['edges']
+        path = options['db'] or os.path.join(tempfile.gettempdir(), f'bench_follow_graph_{edges}.sqlite3')
+        db = sqlite3.connect(path)
+        exists = db.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'follows'").fetchone()[0]
+        if not exists or db.execute('SELECT COUNT(*) FROM follows').fetchone()[0] < edges * 0.9:
+            self.generate(db, users, edges, np)
+
+        # Snapshot straight from the table, as build_follow_graph does
+        started = time.perf_counter()
+        rows = np.array(db.execute('SELECT follower, followed FROM follows').fetchall(), dtype=np.int32)
+        snapshot_path = path + '.graph'
+        write_snapshot(snapshot_path, np.ascontiguousarray(rows[:, 0]), np.ascontiguousarray(rows[:, 1]), users + 1)
+        total = len(rows)
+        del rows
+        self.stdout.write(
+            f'Snapshot of {total} follows built in {time.perf_counter() - started:.1f}s, '
+            f'{os.path.getsize(snapshot_path) / 2 ** 20:.0f} MiB'
+        )
+        graph = FollowGraph(snapshot_path, overlay=False)
+
+        rng = random.Random(7)
+        popular = [row[0] for row in db.execute(
+            'SELECT followed FROM follows GROUP BY followed ORDER BY COUNT(*) DESC LIMIT 200'
+        )]
+        active = [row[0] for row in db.execute(
+            'SELECT follower FROM follows GROUP BY follower HAVING COUNT(*) >= 20 LIMIT 5000'
+        )]
+
+        def random_user():
+            return rng.randint(1, users)
+
+        kinds = {
+            'X follows Y?': (
+                lambda: (random_user(), rng.choice(popular + [random_user()])),
+                lambda x, y: db.execute(
+                    'SELECT 1 FROM follows WHERE followed = ? AND follower = ?', (y, x)
+                ).fetchone() is not None,
+                graph.follows,
+            ),
+            'mutual followers': (
+                lambda: (rng.choice(popular), rng.choice(popular)),
+                lambda x, y: db.execute(
+                    'SELECT a.follower FROM follows a JOIN follows b ON b.follower = a.follower '
+                    'WHERE a.followed = ? AND b.followed = ? ORDER BY a.follower', (x, y)
+                ).fetchall(),
+                graph.mutual_followers,
+            ),
+            'known followers': (
+                lambda: (rng.choice(active), rng.choice(popular)),
+                lambda x, y: db.execute(
+                    'SELECT mine.followed FROM follows mine JOIN follows theirs ON theirs.follower = mine.followed '
+                    'WHERE mine.follower = ? AND theirs.followed = ? ORDER BY mine.followed', (x, y)
+                ).fetchall(),
+                graph.known_followers,
+            ),
+        }
+        self.stdout.write(f"{'query':>16}  {'SQL p50':>9}  {'SQL p95':>9}  {'CSR p50':>9}  {'CSR p95':>9}  (ms)")
+        for label, (pick, sql, csr) in kinds.items():
+            sql_ms, csr_ms = [], []
+            for _ in range(options['queries']):
+                first, second = pick()
+                started = time.perf_counter()
+                expected = sql(first, second)
+                sql_ms.append((time.perf_counter() - started) * 1000)
+                started = time.perf_counter()
+                answer = csr(first, second)
+                csr_ms.append((time.perf_counter() - started) * 1000)
+                if isinstance(answer, list) and answer != [row[0] for row in expected]:
+                    raise CommandError(f'{label} mismatch for {first}, {second}')
+                if isinstance(answer, bool) and answer != expected:
+                    raise CommandError(f'{label} mismatch for {first}, {second}')
+            self.stdout.write(
+                f'{label:>16}  {_percentile(sql_ms, 0.5):9.3f}  {_percentile(sql_ms, 0.95):9.3f}  '
+                f'{_percentile(csr_ms, 0.5):9.3f}  {_percentile(csr_ms, 0.95):9.3f}'
+            )
+        db.close()
+        self.stdout.write(f'Database kept at {path}, snapshot at {snapshot_path}')
+
+    def generate(self, db, users, edges, np):
+        """Random follows: followers uniform, followed users drawn from a power law"""
+        self.stdout.write(f'Generating {edges} follows between {users} users...')
+        started = time.perf_counter()
+        rng = np.random.default_rng(42)
+        weights = 1.0 / np.arange(1, users + 1) ** 0.9
+        weights /= weights.sum()
+        # A few extra to make up for self-follows and duplicates
+        count = int(edges * 1.05)
+        followed = rng.choice(users, size=count, p=weights).astype(np.int64) + 1
+        followers = rng.integers(1, users + 1, size=count, dtype=np.int64)
+        keys = np.unique(followed * (users + 1) + followers)
+        keys = keys[keys // (users + 1) != keys % (users + 1)]
+        keys = rng.permutation(keys)[:edges]
+        pairs = zip((keys // (users + 1)).tolist(), (keys % (users + 1)).tolist())
+
+        # Same columns and indexes as the accounts_customuser_followers table
+        db.executescript('''
+            DROP TABLE IF EXISTS follows;
+            CREATE TABLE follows (id INTEGER PRIMARY KEY, followed INTEGER NOT NULL, follower INTEGER NOT NULL);
+        ''')
+        db.executemany('INSERT INTO follows (followed, follower) VALUES (?, ?)', pairs)
+        db.executescript('''
+            CREATE UNIQUE INDEX follows_followed_follower ON follows (followed, follower);
+            CREATE INDEX follows_follower ON follows (follower);
+        ''')
+        db.commit()
+        self.stdout.write(f'Generated in {time.perf_counter() - started:.1f}s')
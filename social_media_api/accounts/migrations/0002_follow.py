@@ -0,0 +1,54 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Turn the auto-created followers M2M table into the Follow model.
+    The table and its rows stay where they are: the model is first added
+    to the migration state only, then created_at and the page indexes are
+    added for real. Existing follows get the migration time as created_at.
+    """
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='Follow',
+                    fields=[
+                        ('id', models.AutoField(primary_key=True, serialize=False)),
+                        ('followed', models.ForeignKey(db_column='from_customuser_id', on_delete=django.db.models.deletion.CASCADE, related_name='follower_links', to=settings.AUTH_USER_MODEL)),
+                        ('follower', models.ForeignKey(db_column='to_customuser_id', on_delete=django.db.models.deletion.CASCADE, related_name='following_links', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'accounts_customuser_followers',
+                        'unique_together': {('followed', 'follower')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='customuser',
+                    name='followers',
+                    field=models.ManyToManyField(blank=True, related_name='following', through='accounts.Follow', through_fields=('followed', 'follower'), to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='follow',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['followed', '-created_at', '-id'], name='accounts_followers_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['follower', '-created_at', '-id'], name='accounts_following_page_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 # accounts/models.py
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 class CustomUser(AbstractUser):
     bio = models.TextField(max_length=500, blank=True, help_text="Tell us about yourself")
@@ -14,7 +15,9 @@ class CustomUser(AbstractUser):
         'self',
         symmetrical=False,
         blank=True,
-        related_name='following'
+        related_name='following',
+        through='Follow',
+        through_fields=('followed', 'follower')
     )
     
     def __str__(self):
@@ -22,8 +25,75 @@ class CustomUser(AbstractUser):
     
     def followers_count(self):
         """Returns the number of followers this user has"""
+        # Already loaded by querysets built with accounts.follows.with_follow_counts()
+        if hasattr(self, 'followers_total'):
+            return self.followers_total
         return self.followers.count()
     
     def following_count(self):
         """Returns the number of users this user is following"""
-        return self.following.count()
\ No newline at end of file
+        if hasattr(self, 'following_total'):
+            return self.following_total
+        return self.following.count()
+
+
+class Follow(models.Model):
+    """
+    One user following another: the through model of CustomUser.followers.
+    It keeps the table and columns of the former auto-created M2M table
+    (from_customuser is the followed user, to_customuser the follower)
+    and adds the follow time, the sort key of the follower lists.
+    """
+    id = models.AutoField(primary_key=True)  # Integer key of the former M2M table
+    followed = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        db_column='from_customuser_id',
+        related_name='follower_links'
+    )
+    follower = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        db_column='to_customuser_id',
+        related_name='following_links'
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'accounts_customuser_followers'
+        unique_together = ('followed', 'follower')
+        indexes = [
+            # Newest-first follower/following pages are one range scan each
+            models.Index(fields=['followed', '-created_at', '-id'], name='accounts_followers_page_idx'),
+            models.Index(fields=['follower', '-created_at', '-id'], name='accounts_following_page_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.follower_id} follows {self.followed_id}"
+
+
+class FollowRemoval(models.Model):
+    """
+    Log of deleted follows, written by the Follow post_delete signal
+    (accounts.signals), so unfollows, admin deletes and the follows of
+    deleted accounts are all logged. The follow graph snapshot (see
+    accounts.follow_graph) reads the rows newer than its build as
+    removals; each rebuild prunes the old ones. No FK constraints: the
+    rows of a deleted account must outlive it until the next rebuild.
+    """
+    followed = models.ForeignKey(
+        CustomUser,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    follower = models.ForeignKey(
+        CustomUser,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.follower_id} unfollowed {self.followed_id}"
@@ -0,0 +1,10 @@
+# accounts/signals.py
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import Follow, FollowRemoval
+
+
+@receiver(post_delete, sender=Follow)
+def log_follow_removal(sender, instance, **kwargs):
+    """Log every deleted follow for the follow graph overlay (see accounts.follow_graph)"""
+    FollowRemoval.objects.create(followed_id=instance.followed_id, follower_id=instance.follower_id)
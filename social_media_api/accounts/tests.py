@@ -1,3 +1,239 @@
-from django.test import TestCase
+import os
+import tempfile
+from array import array
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from rest_framework.test import APITestCase
+from notifications.models import Notification
+from . import follow_graph
+from .follows import add_follow
+from .models import Follow, FollowRemoval
 
-# Create your tests here.
+User = get_user_model()
+
+
+class UserListQueryCountTests(APITestCase):
+    """
+    User lists must run a constant number of queries whatever the number
+    of users: follower/following totals come from the page query.
+    """
+
+    def setUp(self):
+        self.viewer = User.objects.create_user(username='viewer')
+        self.others = [User.objects.create_user(username=f'user{i}') for i in range(5)]
+        for user in self.others:
+            self.viewer.following.add(user)
+            user.following.add(self.viewer)
+        self.others[0].following.add(self.others[1])
+        self.client.force_authenticate(self.viewer)
+
+    def test_user_list_query_count(self):
+        # COUNT for the paginator + the page
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/accounts/users/')
+        counts = {user['username']: (user['followers_count'], user['following_count']) for user in response.data['results']}
+        self.assertEqual(counts['viewer'], (5, 5))
+        self.assertEqual(counts['user0'], (1, 2))
+        self.assertEqual(counts['user1'], (2, 1))
+
+    def test_following_and_followers_query_count(self):
+        for url in ('/api/accounts/following/', '/api/accounts/followers/'):
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(len(response.data['results']), 5)
+        totals = {user['username']: user['followers_count'] for user in response.data['results']}
+        self.assertEqual(totals['user1'], 2)
+
+
+class FollowListPaginationTests(APITestCase):
+    """Follower/following lists are keyset-paginated by follow time"""
+
+    def setUp(self):
+        self.viewer = User.objects.create_user(username='viewer')
+        self.others = [User.objects.create_user(username=f'user{i}') for i in range(5)]
+        # Follow in reverse creation order so follow time and user ID disagree
+        for user in reversed(self.others):
+            self.viewer.following.add(user)
+            user.following.add(self.viewer)
+        self.client.force_authenticate(self.viewer)
+
+    def walk(self, url):
+        usernames, response = [], self.client.get(url, {'page_size': 2, 'count': 'true'})
+        self.assertEqual(response.data['count'], 5)
+        while True:
+            self.assertLessEqual(len(response.data['results']), 2)
+            usernames += [user['username'] for user in response.data['results']]
+            if not response.data['links']['next']:
+                return usernames
+            response = self.client.get(response.data['links']['next'])
+
+    def test_pages_follow_the_follow_time(self):
+        latest_first = [f'user{i}' for i in range(5)]
+        self.assertEqual(self.walk('/api/accounts/following/'), latest_first)
+        self.assertEqual(self.walk('/api/accounts/followers/'), latest_first)
+        # Oversized page sizes are clamped to max_page_size
+        response = self.client.get('/api/accounts/following/', {'page_size': 10000})
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(self.client.get('/api/accounts/following/', {'cursor': 'bogus'}).status_code, 404)
+
+    @override_settings(FOLLOW_LIST_LEGACY_RESPONSE=True)
+    def test_legacy_response_is_a_bare_list(self):
+        response = self.client.get('/api/accounts/followers/', {'page_size': 2})
+        self.assertEqual([user['username'] for user in response.data], [f'user{i}' for i in range(5)])
+
+
+class RelationshipCheckTests(APITestCase):
+    """One request and one query answer following/followed-by for many users"""
+
+    def setUp(self):
+        self.viewer = User.objects.create_user(username='viewer')
+        self.friend, self.fan, self.idol, self.stranger = [
+            User.objects.create_user(username=name) for name in ('friend', 'fan', 'idol', 'stranger')
+        ]
+        self.viewer.following.add(self.friend, self.idol)
+        self.friend.following.add(self.viewer)
+        self.fan.following.add(self.viewer)
+        self.client.force_authenticate(self.viewer)
+
+    def test_batch_relationships(self):
+        ids = [self.friend.id, self.fan.id, self.idol.id, self.stranger.id, 999999]
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/accounts/relationships/', {'user_ids': ids}, format='json')
+        flags = {item['user_id']: (item['following'], item['followed_by']) for item in response.data['results']}
+        self.assertEqual(flags, {
+            self.friend.id: (True, True),
+            self.fan.id: (False, True),
+            self.idol.id: (True, False),
+            self.stranger.id: (False, False),
+            999999: (False, False),
+        })
+
+        response = self.client.get('/api/accounts/relationships/', {'user_ids': f'{self.fan.id},{self.idol.id}'})
+        self.assertEqual([item['user_id'] for item in response.data['results']], [self.fan.id, self.idol.id])
+        with override_settings(RELATIONSHIP_CHECK_MAX_ITEMS=2):
+            response = self.client.post('/api/accounts/relationships/', {'user_ids': ids}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class FollowGraphTests(APITestCase):
+    """The follow graph snapshot plus its overlay agree with the Follow table"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'follow_graph.bin')
+        self.settings_override = override_settings(FOLLOW_GRAPH_PATH=self.path, FOLLOW_GRAPH_REFRESH_INTERVAL=0)
+        self.settings_override.enable()
+        follow_graph._graph = None
+        self.viewer, self.alice, self.bob, self.carol, self.star = [
+            User.objects.create_user(username=name) for name in ('viewer', 'alice', 'bob', 'carol', 'star')
+        ]
+        self.viewer.following.add(self.alice, self.bob, self.carol)
+        self.alice.following.add(self.star, self.viewer)
+        self.bob.following.add(self.star)
+        self.client.force_authenticate(self.viewer)
+
+    def tearDown(self):
+        follow_graph._graph = None
+        self.settings_override.disable()
+        self.directory.cleanup()
+
+    def known(self):
+        response = self.client.get(f'/api/accounts/users/{self.star.id}/known-followers/')
+        return response.data['count'], [user['username'] for user in response.data['results']]
+
+    def test_snapshot_and_overlay(self):
+        # Without a snapshot the endpoint answers from SQL
+        self.assertIsNone(follow_graph.get_follow_graph())
+        self.assertEqual(self.known(), (2, ['alice', 'bob']))
+
+        self.assertEqual(follow_graph.build_snapshot(), 6)
+        graph = follow_graph.get_follow_graph()
+        self.assertTrue(graph.follows(self.alice.id, self.star.id))
+        self.assertFalse(graph.follows(self.star.id, self.alice.id))
+        self.assertFalse(graph.follows(999999, self.alice.id))
+        self.assertEqual(graph.mutual_followers(self.alice.id, self.bob.id), [self.viewer.id])
+        self.assertEqual(graph.friends(self.viewer.id), [self.alice.id])
+        self.assertEqual(self.known(), (2, ['alice', 'bob']))
+
+        # Changes after the build come from the overlay
+        self.carol.following.add(self.star)
+        self.client.post(f'/api/accounts/unfollow/{self.alice.id}/')
+        self.assertEqual(self.known(), (2, ['bob', 'carol']))
+        self.assertEqual(graph.follower_ids(self.star.id), [self.alice.id, self.bob.id, self.carol.id])
+        self.assertFalse(graph.follows(self.viewer.id, self.alice.id))
+        # Following again after an unfollow wins over the logged removal
+        self.viewer.following.add(self.alice)
+        self.assertTrue(graph.follows(self.viewer.id, self.alice.id))
+
+        # Each rebuild prunes the removals the previous snapshot already had
+        self.assertEqual(follow_graph.build_snapshot(), 7)
+        self.assertEqual(FollowRemoval.objects.count(), 1)
+        follow_graph.build_snapshot()
+        self.assertEqual(FollowRemoval.objects.count(), 0)
+        self.assertEqual(graph.known_followers(self.viewer.id, self.star.id), [self.alice.id, self.bob.id, self.carol.id])
+
+    def test_admin_and_cascade_deletes_reach_the_overlay(self):
+        follow_graph.build_snapshot()
+        graph = follow_graph.get_follow_graph()
+        # Deleted outside remove_follows(): the admin, and a deleted account
+        Follow.objects.filter(follower=self.bob, followed=self.star).delete()
+        self.carol.delete()
+        self.assertEqual(graph.follower_ids(self.star.id), [self.alice.id])
+        self.assertEqual(graph.following_ids(self.viewer.id), [self.alice.id, self.bob.id])
+        self.assertEqual(FollowRemoval.objects.count(), 2)
+
+    def test_late_commits_and_incremental_refresh(self):
+        # A follow whose ID was assigned before the build but committed after
+        # it: the snapshot lacks it although its ID is below the watermark
+        self.carol.following.add(self.star)
+        late = Follow.objects.get(follower=self.carol, followed=self.star)
+        rows = list(Follow.objects.exclude(id=late.id).values_list('follower_id', 'followed_id'))
+        columns = [array('i', column) for column in zip(*rows)]
+        if follow_graph.np is not None:
+            columns = [follow_graph.np.frombuffer(column, dtype=follow_graph.np.int32) for column in columns]
+        follow_graph.write_snapshot(self.path, *columns, self.star.id + 1, follow_watermark=late.id)
+        graph = follow_graph.get_follow_graph()
+        self.assertTrue(graph.follows(self.carol.id, self.star.id))
+
+        # Later refreshes read only the rows after the last one seen
+        with override_settings(FOLLOW_GRAPH_ID_LOOKBACK=0):
+            self.bob.following.add(self.carol)
+            self.assertTrue(graph.follows(self.bob.id, self.carol.id))
+            self.assertEqual(graph._overlay.follow_after, Follow.objects.latest('id').id)
+            with self.assertNumQueries(2):
+                graph.refresh(force=True)
+
+
+class FollowIdempotencyTests(APITestCase):
+    """Following twice stores one follow and sends one notification"""
+
+    def setUp(self):
+        self.fan = User.objects.create_user(username='fan')
+        self.idol = User.objects.create_user(username='idol')
+        self.client.force_authenticate(self.fan)
+
+    def test_duplicate_follow_writes_nothing(self):
+        self.assertTrue(add_follow(self.fan.id, self.idol.id))
+        self.assertFalse(add_follow(self.fan.id, self.idol.id))
+        self.assertEqual(Follow.objects.filter(follower=self.fan, followed=self.idol).count(), 1)
+        Follow.objects.all().delete()
+
+        for _ in range(2):
+            response = self.client.post(f'/api/accounts/follow/{self.idol.id}/')
+            self.assertEqual(response.status_code, 200)
+        self.assertIn('already following', response.data['message'])
+        self.assertEqual(Follow.objects.filter(follower=self.fan, followed=self.idol).count(), 1)
+        self.assertEqual(self.idol.followers_count(), 1)
+        self.assertEqual(Notification.objects.filter(recipient=self.idol, actor=self.fan).count(), 1)
+
+    def test_bulk_follow_reports_only_rows_it_inserted(self):
+        other = User.objects.create_user(username='other')
+        # A concurrent request followed idol first
+        add_follow(self.fan.id, self.idol.id)
+        response = self.client.post(
+            '/api/accounts/bulk-follow/', {'user_ids': [self.idol.id, other.id]}, format='json'
+        )
+        statuses = {item['user_id']: item['status'] for item in response.data['results']}
+        self.assertEqual(statuses, {self.idol.id: 'already_following', other.id: 'followed'})
+        self.assertFalse(Notification.objects.filter(recipient=self.idol).exists())
+        self.assertEqual(Notification.objects.filter(recipient=other, actor=self.fan).count(), 1)
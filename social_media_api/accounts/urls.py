@@ -32,4 +32,8 @@ urlpatterns = [
     path('following/', views.following_list, name='following_list'),
     path('followers/', views.followers_list, name='followers_list'),
     path('check-following/<int:user_id>/', views.check_following, name='check_following'),
+    path('relationships/', views.check_relationships, name='check_relationships'),
+    path('users/<int:user_id>/known-followers/', views.known_followers, name='known_followers'),
+    path('bulk-follow/', views.bulk_follow_users, name='bulk_follow_users'),
+    path('bulk-unfollow/', views.bulk_unfollow_users, name='bulk_unfollow_users'),
 ]
\ No newline at end of file
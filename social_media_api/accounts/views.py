@@ -6,10 +6,20 @@ from rest_framework.authtoken.models import Token
 from rest_framework.permissions import AllowAny
 from django.contrib.auth import login, logout
 from django.contrib.auth import get_user_model
+from django.conf import settings
 from django.shortcuts import get_object_or_404
+from django.db import transaction
 from .models import CustomUser
+from .follow_graph import get_follow_graph
 from .serializers import UserSerializer, UserRegistrationSerializer, LoginSerializer
 from notifications.models import Notification
+from common.bulk import parse_id_list
+from common.pagination import FeedCursorPagination
+from posts.timeline import backfill_timeline, backfill_timeline_authors, purge_timeline, purge_timeline_authors
+from .follows import (
+    add_follow, add_follows, followers_queryset, following_queryset, get_relationship_max_items,
+    relationships, remove_follows, with_follow_counts,
+)
 
 # Import generics to satisfy checker requirement (even if not directly used in function-based views)
 from rest_framework import generics
@@ -101,6 +111,11 @@ class UserListView(generics.ListAPIView):
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        # Follower/following totals in the page query, not two COUNTs per user;
+        # ordered so pages are stable
+        return with_follow_counts(super().get_queryset()).order_by('id')
+
 # --- Follow/Unfollow Views ---
 
 @api_view(['POST'])
@@ -136,7 +151,10 @@ def unfollow_user(request, user_id):
     POST /api/accounts/unfollow/{user_id}/
     """
     user_to_unfollow = get_object_or_404(User, id=user_id)
-    request.user.following.remove(user_to_unfollow)
+    with transaction.atomic():
+        # Logged removal, so the follow graph snapshot sees it (see accounts.follow_graph)
+        remove_follows(request.user.id, [user_to_unfollow.id])
+    purge_timeline(request.user, user_to_unfollow)
 
     return Response(
         {
@@ -146,27 +164,54 @@ def unfollow_user(request, user_id):
         status=status.HTTP_200_OK
     )
 
+def follow_list_response(request, queryset):
+    """
+    Page a following/followers queryset.
+
+    Breaking change: these endpoints used to return a bare JSON list of
+    every user. They now return {links, cursors, results} pages. Until
+    all clients follow the cursors, FOLLOW_LIST_LEGACY_RESPONSE = True
+    restores the old unpaginated list.
+    """
+    if getattr(settings, 'FOLLOW_LIST_LEGACY_RESPONSE', False):
+        serializer = UserSerializer(with_follow_counts(queryset), many=True)
+        return Response(serializer.data)
+
+    # Keyset pagination on the follow time: one bounded query per page
+    paginator = FeedCursorPagination()
+    page = paginator.paginate_queryset(with_follow_counts(queryset), request)
+    serializer = UserSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def following_list(request):
     """
-    Get list of users that the current user is following
+    Get list of users that the current user is following, latest follows first
     GET /api/accounts/following/
+    Query Parameters:
+        - cursor=<cursor> (from links/cursors of the previous page)
+        - page_size=<n> (max 100)
+        - count=true (include the total number of users)
+    Returns {links, cursors, results}; see follow_list_response for the
+    old bare list.
     """
-    following = request.user.following.all()
-    serializer = UserSerializer(following, many=True)
-    return Response(serializer.data)
+    return follow_list_response(request, following_queryset(request.user))
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def followers_list(request):
     """
-    Get list of users following the current user
+    Get list of users following the current user, latest follows first
     GET /api/accounts/followers/
+    Query Parameters:
+        - cursor=<cursor> (from links/cursors of the previous page)
+        - page_size=<n> (max 100)
+        - count=true (include the total number of users)
+    Returns {links, cursors, results}; see follow_list_response for the
+    old bare list.
     """
-    followers = request.user.followers.all()
-    serializer = UserSerializer(followers, many=True)
-    return Response(serializer.data)
+    return follow_list_response(request, followers_queryset(request.user))
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
@@ -183,6 +228,63 @@ def check_following(request, user_id):
         'username': user.username,
         'is_following': is_following
     })
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def known_followers(request, user_id):
+    """
+    Users you follow who follow a user ("followed by people you follow")
+    GET /api/accounts/users/{user_id}/known-followers/
+    Query Parameters:
+        - limit=<n> (users returned with the total, default 3, max 50)
+    """
+    user = get_object_or_404(User, id=user_id)
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 3)), 50))
+    except ValueError:
+        return Response({'error': 'limit must be a number.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    graph = get_follow_graph()
+    if graph is not None:
+        # Intersection of two sorted adjacency lists from the snapshot
+        known_ids = graph.known_followers(request.user.id, user.id)
+        count = len(known_ids)
+        known = User.objects.filter(id__in=known_ids[:limit])
+    else:
+        # No snapshot built yet: two joins on the follow table
+        known = User.objects.filter(following_links__followed=user, follower_links__follower=request.user)
+        count = known.count()
+    known = with_follow_counts(known).order_by('id')[:limit]
+    serializer = UserSerializer(known, many=True)
+    return Response({'count': count, 'results': serializer.data})
+
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAuthenticated])
+def check_relationships(request):
+    """
+    Check the relationship with many users at once, e.g. every profile
+    card on a screen, instead of one check-following call per user.
+    GET /api/accounts/relationships/?user_ids=1,2,3
+    POST /api/accounts/relationships/
+    Body: {"user_ids": [1, 2, 3]} (up to RELATIONSHIP_CHECK_MAX_ITEMS)
+    Returns following / followed_by for each user; unknown IDs are false.
+    """
+    if request.method == 'GET':
+        raw_ids = request.query_params.get('user_ids', '')
+        data = {'user_ids': [value for value in raw_ids.split(',') if value.strip()]}
+    else:
+        data = request.data
+    user_ids, error = parse_id_list(data, 'user_ids', max_items=get_relationship_max_items())
+    if error:
+        return error
+
+    # One IN query on the follow table for both directions
+    following, followed_by = relationships(request.user.id, user_ids)
+    results = [
+        {'user_id': user_id, 'following': user_id in following, 'followed_by': user_id in followed_by}
+        for user_id in user_ids
+    ]
+    return Response({'results': results}, status=status.HTTP_200_OK)
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def follow_user(request, user_id):
@@ -198,29 +300,102 @@ def follow_user(request, user_id):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    with transaction.atomic():
+        # One INSERT ... ON CONFLICT DO NOTHING instead of exists() + add()
+        created = add_follow(request.user.id, user_to_follow.id)
+        if created:
+            # Copy the followed user's recent posts into our timeline
+            backfill_timeline(request.user, user_to_follow)
+
+            # --- Create Notification ---
+            # Use the helper method from the Notification model
+            Notification.create_notification(
+                recipient=user_to_follow, # The user being followed receives the notification
+                actor=request.user,       # The user doing the following
+                verb='started following you' # The action description
+                # No target object needed for follow/unfollow
+            )
+            # --- End Create Notification ---
+
     # Check if already following
-    if request.user.following.filter(id=user_id).exists():
-         return Response(
+    if not created:
+        return Response(
             {'message': f'You are already following {user_to_follow.username}'},
             status=status.HTTP_200_OK
         )
 
-    request.user.following.add(user_to_follow)
-
-    # --- Create Notification ---
-    # Use the helper method from the Notification model
-    Notification.create_notification(
-        recipient=user_to_follow, # The user being followed receives the notification
-        actor=request.user,       # The user doing the following
-        verb='started following you' # The action description
-        # No target object needed for follow/unfollow
-    )
-    # --- End Create Notification ---
-
     return Response(
         {
             'message': f'You are now following {user_to_follow.username}',
             'following': UserSerializer(user_to_follow).data
         },
         status=status.HTTP_200_OK # Changed to 200 OK as it's a state change
-    )
\ No newline at end of file
+    )
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_follow_users(request):
+    """
+    Follow several users at once, e.g. follows queued by an offline client.
+    POST /api/accounts/bulk-follow/
+    Body: {"user_ids": [1, 2, 3]}
+    Returns a status per user: followed, already_following, not_found or self.
+    """
+    user_ids, error = parse_id_list(request.data, 'user_ids')
+    if error:
+        return error
+
+    found = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+    candidates = [user_id for user_id in user_ids if user_id in found and user_id != request.user.id]
+    with transaction.atomic():
+        followed = set(add_follows(request.user.id, candidates))
+        if followed:
+            backfill_timeline_authors(request.user, followed)
+            Notification.objects.bulk_create([
+                Notification(recipient_id=user_id, actor=request.user, verb='started following you')
+                for user_id in followed
+            ])
+
+    results = []
+    for user_id in user_ids:
+        if user_id == request.user.id:
+            item_status = 'self'
+        elif user_id not in found:
+            item_status = 'not_found'
+        elif user_id in followed:
+            item_status = 'followed'
+        else:
+            item_status = 'already_following'
+        results.append({'user_id': user_id, 'status': item_status})
+    return Response({'results': results}, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_unfollow_users(request):
+    """
+    Unfollow several users at once.
+    POST /api/accounts/bulk-unfollow/
+    Body: {"user_ids": [1, 2, 3]}
+    Returns a status per user: unfollowed, not_following or not_found.
+    """
+    user_ids, error = parse_id_list(request.data, 'user_ids')
+    if error:
+        return error
+
+    found = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+    with transaction.atomic():
+        unfollowed = set(remove_follows(request.user.id, [user_id for user_id in user_ids if user_id in found]))
+        if unfollowed:
+            purge_timeline_authors(request.user, unfollowed)
+
+    results = []
+    for user_id in user_ids:
+        if user_id not in found:
+            item_status = 'not_found'
+        elif user_id in unfollowed:
+            item_status = 'unfollowed'
+        else:
+            item_status = 'not_following'
+        results.append({'user_id': user_id, 'status': item_status})
+    return Response({'results': results}, status=status.HTTP_200_OK)
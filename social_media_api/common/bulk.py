@@ -0,0 +1,37 @@
+# common/bulk.py
+"""
+Helpers shared by the bulk action endpoints (bulk like/unlike in
+posts.views, bulk follow/unfollow and the relationship check in
+accounts.views). Each batch is applied with a fixed number of queries per table it touches, and the
+response reports a status for every requested ID.
+"""
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def get_bulk_max_items():
+    """Largest number of IDs accepted by one bulk request"""
+    return getattr(settings, 'BULK_ACTION_MAX_ITEMS', 100)
+
+
+def parse_id_list(data, key, max_items=None):
+    """
+    (ids, None) from a request body like {"post_ids": [1, 2]}, or
+    (None, error Response). Duplicates are dropped, order is kept.
+    max_items defaults to BULK_ACTION_MAX_ITEMS.
+    """
+    max_items = max_items or get_bulk_max_items()
+    ids = data.get(key)
+    if not isinstance(ids, list) or not ids:
+        return None, Response({'error': f'{key} must be a non-empty list of IDs.'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > max_items:
+        return None, Response(
+            {'error': f'At most {max_items} IDs per request.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        ids = [int(value) for value in ids]
+    except (TypeError, ValueError):
+        return None, Response({'error': f'{key} must only contain integers.'}, status=status.HTTP_400_BAD_REQUEST)
+    return list(dict.fromkeys(ids)), None
@@ -0,0 +1,152 @@
+# common/pagination.py
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+class FeedCursorPagination(BasePagination):
+    """
+    Keyset pagination for feeds ordered newest first.
+
+    The queryset must be ordered by two descending keys, a timestamp
+    and a unique tie-breaker, e.g. ('-created_at', '-id'). Each page
+    is fetched with a WHERE on those keys instead of OFFSET, so deep
+    pages cost the same as the first one and posts inserted between
+    requests cannot shift rows into or out of the next page.
+
+    Query Parameters:
+        - cursor=<opaque> (position returned in the previous response)
+        - page_size=<n> (capped at max_page_size)
+        - count=true (also return the total, which costs a COUNT query)
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+    time_field = 'created_at'
+    id_field = 'id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        fetch = self.queryset_fetch(queryset)
+        return self.paginate_fetch(fetch, request, count=queryset.count)
+
+    def queryset_fetch(self, queryset):
+        """Build a paginate_fetch() page source from an ordered queryset"""
+        time_field, id_field = [field.lstrip('-') for field in queryset.query.order_by]
+        self.time_field, self.id_field = time_field, id_field
+
+        def fetch(position, reverse, limit):
+            if position is None:
+                return list(queryset[:limit])
+            created_at, pk = position
+            if reverse:
+                page = queryset.filter(
+                    Q(**{f'{time_field}__gt': created_at})
+                    | Q(**{time_field: created_at, f'{id_field}__gt': pk})
+                ).order_by(time_field, id_field)
+            else:
+                page = queryset.filter(
+                    Q(**{f'{time_field}__lt': created_at})
+                    | Q(**{time_field: created_at, f'{id_field}__lt': pk})
+                )
+            return list(page[:limit])
+
+        return fetch
+
+    def paginate_fetch(self, fetch, request, count=None):
+        """
+        Paginate any page source, not just a queryset.
+        fetch(position, reverse, limit) must return up to limit objects
+        strictly after position ((created_at, id) or None), newest first,
+        or oldest first when reverse is True. Cursors are read from the
+        objects' time_field and id_field attributes.
+        """
+        self.request = request
+        # Only the first request pays for the total
+        self.base_url = remove_query_param(request.build_absolute_uri(), self.count_query_param)
+        self.page_size = self.get_page_size(request)
+
+        self.count = None
+        if count is not None and request.query_params.get(self.count_query_param, '').lower() == 'true':
+            self.count = count()
+
+        position, reverse = self.decode_cursor(request)
+
+        # Fetch one extra row to know whether there is another page
+        results = fetch(position, reverse, self.page_size + 1)
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.page = results
+        if reverse:
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (ValueError, TypeError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        """Return ((created_at, id), reverse) or (None, False) without a cursor"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            decoded = urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            direction, created_at, pk = decoded.split('|')
+            return (datetime.fromisoformat(created_at), int(pk)), direction == 'p'
+        except (ValueError, TypeError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj, reverse=False):
+        created_at = getattr(obj, self.time_field)
+        pk = getattr(obj, self.id_field)
+        raw = f"{'p' if reverse else 'n'}|{created_at.isoformat()}|{pk}"
+        return urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def get_next_cursor(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_cursor(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        next_cursor = self.get_next_cursor()
+        previous_cursor = self.get_previous_cursor()
+        response = {
+            'links': {
+                'next': self.get_link(next_cursor),
+                'previous': self.get_link(previous_cursor)
+            },
+            'cursors': {
+                'next': next_cursor,
+                'previous': previous_cursor
+            },
+        }
+        if self.count is not None:
+            response['count'] = self.count
+        response['results'] = data
+        return Response(response)
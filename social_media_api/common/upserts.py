@@ -0,0 +1,97 @@
+# common/upserts.py
+"""
+Idempotent single-statement inserts.
+
+get_or_create() and ManyRelatedManager.add() check for an existing row
+and then insert, which costs two round trips and still races: two
+concurrent requests can both see no row, and the loser gets an
+IntegrityError. insert_ignore() sends one INSERT that the database
+skips on a unique conflict (ON CONFLICT DO NOTHING on PostgreSQL and
+SQLite, INSERT IGNORE on MySQL) and reports whether a row was added,
+so callers only create notifications or bump counters for new rows.
+
+insert_ignore_many() does the same for a batch with INSERT ... ON
+CONFLICT DO NOTHING RETURNING, which returns only the rows the database
+really wrote. A SELECT of the existing rows before a
+bulk_create(ignore_conflicts=True) is not enough: two concurrent
+batches both see the row as missing and both count it as new.
+"""
+from django.db import connections, router
+from django.db.models.constants import OnConflict
+
+
+def insert_ignore(model, **values):
+    """
+    INSERT one model row unless it conflicts with a unique constraint.
+    values are field names (or attnames such as user_id); other fields
+    get their defaults. Returns True if the row was inserted.
+    """
+    using = router.db_for_write(model)
+    connection = connections[using]
+    meta = model._meta
+    obj = model(**values)
+    fields = [field for field in meta.concrete_fields if field is not meta.auto_field]
+    params = [
+        field.get_db_prep_save(field.pre_save(obj, add=True), connection=connection)
+        for field in fields
+    ]
+
+    ops = connection.ops
+    sql = '{} {} ({}) VALUES ({}) {}'.format(
+        ops.insert_statement(on_conflict=OnConflict.IGNORE),
+        ops.quote_name(meta.db_table),
+        ', '.join(ops.quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+        ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        # 0 when the database skipped a duplicate
+        return cursor.rowcount == 1
+
+
+def insert_ignore_many(model, rows, returning):
+    """
+    INSERT many rows (dicts of values, as for insert_ignore()), skipping
+    those that conflict with a unique constraint. Returns a tuple of the
+    `returning` attnames for every row really inserted; each name must be
+    one of the values given. One statement per batch of rows; databases
+    without INSERT ... RETURNING fall back to one insert_ignore() per row.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    using = router.db_for_write(model)
+    connection = connections[using]
+    if not connection.features.can_return_rows_from_bulk_insert:
+        return [tuple(values[name] for name in returning) for values in rows if insert_ignore(model, **values)]
+
+    meta = model._meta
+    objs = [model(**values) for values in rows]
+    fields = [field for field in meta.concrete_fields if field is not meta.auto_field]
+    ops = connection.ops
+    returned = [meta.get_field(name) for name in returning]
+    batch_size = max(ops.bulk_batch_size(fields, objs), 1)
+    row_sql = '({})'.format(', '.join(['%s'] * len(fields)))
+
+    inserted = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(objs), batch_size):
+            batch = objs[start:start + batch_size]
+            params = [
+                field.get_db_prep_save(field.pre_save(obj, add=True), connection=connection)
+                for obj in batch
+                for field in fields
+            ]
+            sql = '{} {} ({}) VALUES {} {} RETURNING {}'.format(
+                ops.insert_statement(on_conflict=OnConflict.IGNORE),
+                ops.quote_name(meta.db_table),
+                ', '.join(ops.quote_name(field.column) for field in fields),
+                ', '.join([row_sql] * len(batch)),
+                ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None),
+                ', '.join(ops.quote_name(field.column) for field in returned),
+            )
+            cursor.execute(sql, params)
+            # Skipped duplicates return no row
+            inserted.extend(tuple(row) for row in cursor.fetchall())
+    return inserted
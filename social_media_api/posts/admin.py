@@ -1,6 +1,6 @@
 # posts/admin.py
 from django.contrib import admin
-from .models import Post, Comment
+from .models import Post, Comment, PostDuplicateFlag
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
@@ -14,4 +14,10 @@ class CommentAdmin(admin.ModelAdmin):
     list_display = ['post', 'author', 'created_at']
     list_filter = ['created_at', 'author']
     search_fields = ['content']
-    ordering = ['-created_at']
\ No newline at end of file
+    ordering = ['-created_at']
+
+@admin.register(PostDuplicateFlag)
+class PostDuplicateFlagAdmin(admin.ModelAdmin):
+    list_display = ['post', 'duplicate_of', 'created_at']
+    raw_id_fields = ['post', 'duplicate_of']
+    ordering = ['-created_at']
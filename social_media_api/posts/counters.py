@@ -0,0 +1,170 @@
+# posts/counters.py
+"""
+Denormalized Post.likes_count and Post.comments_count.
+
+The like/unlike views and CommentViewSet adjust them with atomic F()
+updates in the same transaction as the Like/Comment write, so reading a
+total never needs a COUNT query. Rows removed some other way (cascading
+user deletes, the admin, raw SQL) make them drift; reconcile_counters()
+recomputes them from the source tables (see the reconcile_post_counters
+command).
+
+Hot posts: every like of a post updates the same row, so concurrent
+likes of a viral post queue on that row's lock. A post liked more than
+LIKE_SHARD_RATE_THRESHOLD times within a minute is promoted to
+LIKE_COUNTER_SHARDS LikeCounterShard rows; from then on each like
+updates a random shard and the like total is likes_count plus the sum
+of the shards (see like_total()).
+"""
+import random
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from .models import Comment, Like, LikeCounterShard, Post
+from .trending import record_engagement
+
+LIKE_RATE_KEY = 'likes:rate:{}:{}'
+
+
+def get_shard_settings():
+    """(likes per minute before a post is sharded, shards per hot post)"""
+    return (
+        getattr(settings, 'LIKE_SHARD_RATE_THRESHOLD', 120),
+        getattr(settings, 'LIKE_COUNTER_SHARDS', 16),
+    )
+
+
+def adjust_counter(post_id, field, delta):
+    """Atomically add delta to one counter column of a post"""
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        # Never go below zero if the counter has drifted
+        posts = posts.filter(**{f'{field}__gte': -delta})
+    posts.update(**{field: F(field) + delta})
+
+
+def adjust_likes(post, delta):
+    """
+    Add delta to the like total of post (a Post instance, for its
+    like_shards). Call inside the transaction that writes the Like row.
+    Also counts the like in the post's trending bucket.
+    """
+    if post.like_shards:
+        shard = random.randrange(post.like_shards)
+        LikeCounterShard.objects.filter(post_id=post.id, shard=shard).update(count=F('count') + delta)
+        record_engagement([post.id], likes=delta, shard=shard)
+        return
+    adjust_counter(post.id, 'likes_count', delta)
+    record_engagement([post.id], likes=delta)
+    if delta > 0 and _like_rate(post.id, delta) > get_shard_settings()[0]:
+        promote_to_sharded(post.id)
+
+
+def adjust_likes_many(posts, delta):
+    """
+    adjust_likes() for many posts with the same delta: one UPDATE for the
+    plain counters and one for the shards, whatever the number of posts.
+    """
+    plain_ids = [post.id for post in posts if not post.like_shards]
+    sharded = [post for post in posts if post.like_shards]
+    if plain_ids:
+        counters = Post.objects.filter(id__in=plain_ids)
+        if delta < 0:
+            counters = counters.filter(likes_count__gte=-delta)
+        counters.update(likes_count=F('likes_count') + delta)
+        record_engagement(plain_ids, likes=delta)
+        if delta > 0:
+            threshold = get_shard_settings()[0]
+            for post_id in plain_ids:
+                if _like_rate(post_id, delta) > threshold:
+                    promote_to_sharded(post_id)
+    if sharded:
+        # One shard index valid for every post in the batch
+        shard = random.randrange(min(post.like_shards for post in sharded))
+        sharded_ids = [post.id for post in sharded]
+        LikeCounterShard.objects.filter(post_id__in=sharded_ids, shard=shard).update(count=F('count') + delta)
+        record_engagement(sharded_ids, likes=delta, shard=shard)
+
+
+def _like_rate(post_id, delta=1):
+    """Count delta more likes of post_id in the current minute; returns the total"""
+    key = LIKE_RATE_KEY.format(post_id, int(time.time() // 60))
+    cache.add(key, 0, 120)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:  # Evicted between add() and incr()
+        return 0
+
+
+def promote_to_sharded(post_id, shards=None):
+    """
+    Switch a post to sharded like counting; returns False if it already
+    was. The shards start at zero, likes_count keeps the total so far.
+    """
+    shards = shards or get_shard_settings()[1]
+    with transaction.atomic():
+        if not Post.objects.filter(pk=post_id, like_shards=0).update(like_shards=shards):
+            return False
+        LikeCounterShard.objects.bulk_create(
+            [LikeCounterShard(post_id=post_id, shard=shard) for shard in range(shards)],
+            ignore_conflicts=True
+        )
+    return True
+
+
+def sharded_likes():
+    """
+    Sum of the like shards of each post, for annotate(). CASE skips the
+    subquery for the (vast majority of) posts that are not sharded.
+    """
+    totals = (
+        LikeCounterShard.objects.filter(post=OuterRef('pk')).order_by()
+        .values('post').annotate(total=Sum('count')).values('total')
+    )
+    return Case(
+        When(like_shards=0, then=Value(0)),
+        default=Coalesce(Subquery(totals, output_field=IntegerField()), Value(0)),
+        output_field=IntegerField()
+    )
+
+
+def like_total(post):
+    """Like total of a post, using the sharded_likes annotation if loaded"""
+    shard_total = getattr(post, 'sharded_likes', None)
+    if shard_total is None:
+        shard_total = 0
+        if post.like_shards:
+            shard_total = post.like_counter_shards.aggregate(total=Sum('count'))['total'] or 0
+    return post.likes_count + shard_total
+
+
+def _actual_total(model):
+    """Correlated COUNT of model rows per post, for annotate()/update()"""
+    totals = (
+        model.objects.filter(post=OuterRef('pk')).order_by()
+        .values('post').annotate(total=Count('id')).values('total')
+    )
+    return Coalesce(Subquery(totals, output_field=IntegerField()), Value(0))
+
+
+def reconcile_counters(post_ids):
+    """
+    Fix the counters of the given posts; returns how many had drifted.
+    Each row is rewritten by a single UPDATE ... SET col = (SELECT COUNT(*)),
+    so increments made concurrently by the views are not lost. For sharded
+    posts likes_count is set to what the shards do not already account for.
+    """
+    likes = Greatest(_actual_total(Like) - sharded_likes(), Value(0))
+    comments = _actual_total(Comment)
+    drifted = list(
+        Post.objects.filter(id__in=post_ids)
+        .annotate(actual_likes=likes, actual_comments=comments)
+        .filter(~Q(likes_count=F('actual_likes')) | ~Q(comments_count=F('actual_comments')))
+        .values_list('id', flat=True)
+    )
+    if drifted:
+        Post.objects.filter(id__in=drifted).update(likes_count=likes, comments_count=comments)
+    return len(drifted)
@@ -0,0 +1,76 @@
+# posts/feed_cache.py
+"""
+Cached first feed page.
+
+The first page is by far the most requested one, so its post IDs are
+cached per user and feed version (see posts.feed_sync). Any change to
+the feed bumps the version, which makes the old entry unreachable, so
+entries never need explicit invalidation and can be (re)built at any
+time, e.g. by the precompute_feeds command right after a deploy. Feed
+versions are stored in the database, so every process keys the same
+feed state the same way; with a per-process cache each web process just
+keeps its own pages, and precompute_feeds refuses to run.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from .feed_sync import read_feed_state
+from .merge_feed import merge_read_path_enabled, merge_entries, recent_entries
+from common.pagination import FeedCursorPagination
+from .timeline import feed_queryset
+
+FIRST_PAGE_KEY = 'feed:first_page:{}:{}'
+
+
+def get_first_page_timeout():
+    """How long a cached first page is kept (seconds)"""
+    return getattr(settings, 'FEED_FIRST_PAGE_TIMEOUT', 3600)
+
+
+def first_page_size():
+    """Enough IDs to serve a first page of any allowed page_size"""
+    return FeedCursorPagination.max_page_size + 1
+
+
+def store_first_page(user_id, version, post_ids, complete):
+    """complete=True means post_ids is the whole feed"""
+    cache.set(FIRST_PAGE_KEY.format(user_id, version), (post_ids, complete), get_first_page_timeout())
+
+
+def with_cached_first_page(fetch, queryset, user, version):
+    """
+    Wrap a paginate_fetch() page source so first-page requests are
+    served from the cache. Cached IDs are hydrated through queryset,
+    which must expose the same sort keys as the wrapped fetch.
+    Misses are fetched normally and written back.
+    """
+    key = FIRST_PAGE_KEY.format(user.id, version)
+
+    def cached_fetch(position, reverse, limit):
+        if position is not None or reverse:
+            return fetch(position, reverse, limit)
+
+        cached = cache.get(key)
+        if cached is not None:
+            post_ids, complete = cached
+            if complete or limit <= len(post_ids):
+                return list(queryset.filter(id__in=post_ids[:limit]))
+
+        results = fetch(position, reverse, limit)
+        store_first_page(user.id, version, [post.id for post in results], len(results) < limit)
+        return results
+
+    return cached_fetch
+
+
+def precompute_first_page(user):
+    """Build and cache the first feed page of user; returns the page length"""
+    version, celebrities = read_feed_state(user)
+    size = first_page_size()
+    if merge_read_path_enabled():
+        author_ids = list(user.following.values_list('id', flat=True))
+        entries = recent_entries(author_ids).values() if author_ids else []
+        post_ids = [post_id for _, post_id in merge_entries(entries, limit=size)]
+    else:
+        post_ids = list(feed_queryset(user, celebrities).values_list('id', flat=True)[:size])
+    store_first_page(user.id, version, post_ids, len(post_ids) < size)
+    return len(post_ids)
@@ -0,0 +1,82 @@
+# posts/feed_sync.py
+"""
+Cheap "did my feed change?" markers for incremental feed polling.
+
+Every event that can add or remove posts in a user's feed increments a
+counter on their FeedState row, shared by every process: fan-out bumps
+each follower, follow/unfollow bumps the user, and deleting a post bumps
+the author's followers. A post by a celebrity author (pulled on read,
+not fanned out) bumps that author's author_version instead.
+
+A user's feed version is a hash of their own counter and the
+author_version of every celebrity they follow, read with the list of
+those celebrities in a single query (see read_feed_state()). It is only
+ever compared for equality.
+"""
+import hashlib
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from django.db.models import F, Q
+from .models import FeedState
+
+
+def bump_feed_versions(user_ids):
+    """Mark the feeds of the given users as changed"""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    bumped = FeedState.objects.filter(user_id__in=user_ids).update(version=F('version') + 1)
+    if bumped < len(user_ids):
+        # First change for some users: create their rows, then bump them too
+        FeedState.objects.bulk_create([FeedState(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+        FeedState.objects.filter(user_id__in=user_ids, version=0).update(version=F('version') + 1)
+
+
+def bump_author_version(author_id):
+    """Mark every feed pulling this author's posts as changed"""
+    FeedState.objects.filter(user_id=author_id).update(author_version=F('author_version') + 1)
+
+
+def combine_versions(own_version, author_versions):
+    """One 63-bit feed version from the user's counter and (author, counter) pairs"""
+    raw = repr((own_version, sorted(author_versions))).encode('ascii')
+    return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), 'little') >> 1
+
+
+def read_feed_state(user):
+    """
+    (feed version, IDs of the celebrity authors user follows) from one
+    query: the user's own FeedState row plus those of followed celebrities.
+    """
+    rows = FeedState.objects.filter(
+        Q(user_id=user.id) | Q(is_celebrity=True, user__in=user.following.values('id'))
+    ).values_list('user_id', 'version', 'author_version', 'is_celebrity')
+    own_version, author_versions = 0, []
+    for user_id, version, author_version, is_celebrity in rows:
+        if user_id == user.id:
+            own_version = version
+        if is_celebrity and user_id != user.id:
+            author_versions.append((user_id, author_version))
+    return combine_versions(own_version, author_versions), [user_id for user_id, _ in author_versions]
+
+
+def encode_since(position, version):
+    """Opaque since-token: newest seen (created_at, id) plus the feed version"""
+    created_at, pk = position if position is not None else ('', '')
+    if created_at:
+        created_at = created_at.isoformat()
+    raw = f'{created_at}|{pk}|{version}'
+    return urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+
+def decode_since(token):
+    """Return (position or None, version); raises ValueError if malformed"""
+    try:
+        raw = urlsafe_b64decode(token.encode('ascii')).decode('ascii')
+    except UnicodeError:
+        raise ValueError('Invalid since token')
+    created_at, pk, version = raw.split('|')
+    position = None
+    if created_at:
+        position = (datetime.fromisoformat(created_at), int(pk))
+    return position, int(version)
@@ -0,0 +1,26 @@
+# posts/filters.py
+from rest_framework import filters
+from .search import get_search_backend
+
+
+class PostSearchFilter(filters.SearchFilter):
+    """
+    ?search= through the full-text index (see posts.search) instead of
+    an icontains scan over search_fields. Results come best match first.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return get_search_backend().search(queryset, terms)
+
+
+class PostOrderingFilter(filters.OrderingFilter):
+    """OrderingFilter that keeps search results in relevance order unless ?ordering= is given"""
+
+    def get_ordering(self, request, queryset, view):
+        searching = request.query_params.get(filters.api_settings.SEARCH_PARAM)
+        if searching and not request.query_params.get(self.ordering_param):
+            return None
+        return super().get_ordering(request, queryset, view)
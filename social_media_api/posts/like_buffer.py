@@ -0,0 +1,273 @@
+# posts/like_buffer.py
+"""
+Write-behind buffer for likes (LIKE_WRITE_MODE = 'buffered').
+
+like_post only appends (user, post) to this process's buffer and answers
+202 Accepted straight away. A background thread flushes the buffer every
+LIKE_BUFFER_FLUSH_INTERVAL seconds: one bulk_create(ignore_conflicts=True)
+of the new Like rows, one counter update per post and one bulk_create of
+the notifications, all in a single transaction.
+
+Crash recovery: every buffered like is first appended to a per-buffer
+log file in LIKE_BUFFER_DIR. A flush rotates the log into a segment
+file and deletes the segment only once the transaction has committed,
+so at any time the files on disk hold every like that may not be in the
+database yet. After a crash, `manage.py replay_like_buffer` flushes the
+leftover files. Replaying is idempotent: likes already stored are
+skipped. Without LIKE_BUFFER_FSYNC the log survives a process crash but
+not a power loss.
+
+File names carry a name unique to each buffer (PID plus a random
+suffix), so a restarted process that reuses a PID never touches the
+files of its predecessor. Each buffer holds an flock() on its
+likes-<name>.lock file while it runs; the lock is released by the OS
+when the process dies, which is how the replay tells orphaned files
+from those of a running process.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import Counter, defaultdict
+from pathlib import Path
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from notifications.models import Notification
+from common.upserts import insert_ignore_many
+from .counters import adjust_likes_many
+from .models import Like, Post
+
+try:
+    import fcntl
+except ImportError:  # No flock(): replay_like_buffer then needs --all
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def buffered_likes_enabled():
+    """True when like_post should buffer instead of writing synchronously"""
+    return getattr(settings, 'LIKE_WRITE_MODE', 'sync') == 'buffered'
+
+
+def get_buffer_dir():
+    return Path(getattr(settings, 'LIKE_BUFFER_DIR', settings.BASE_DIR / 'like_buffer'))
+
+
+def get_like_buffer():
+    """The buffer of this process, created (and its flusher started) on first use"""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None or _buffer.pid != os.getpid():
+            if _buffer is not None:
+                # Inherited over fork: keep the parent's lock only in the parent
+                _buffer._lock_file.close()
+            _buffer = LikeBuffer(
+                get_buffer_dir(),
+                interval=getattr(settings, 'LIKE_BUFFER_FLUSH_INTERVAL', 0.25),
+                fsync=getattr(settings, 'LIKE_BUFFER_FSYNC', False),
+            )
+            atexit.register(_buffer.stop)
+        return _buffer
+
+
+def load_liked_posts(post_ids):
+    """in_bulk() of the posts with just the columns store_likes() needs"""
+    return Post.objects.only('id', 'author_id', 'like_shards').order_by().in_bulk(post_ids)
+
+
+def store_likes(pairs, posts=None):
+    """
+    Write (user_id, post_id) likes to the database in one transaction and
+    return the pairs that were new. Likes of deleted posts and likes that
+    already exist are skipped, so the same pairs can be stored twice.
+    posts is load_liked_posts() of the liked posts, if already loaded.
+    The number of queries does not depend on the number of pairs.
+
+    "New" means inserted by this call (INSERT ... RETURNING), so two
+    flushes or replays storing the same like at once count it and
+    notify about it only once.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return []
+    with transaction.atomic():
+        if posts is None:
+            posts = load_liked_posts({post_id for _, post_id in pairs})
+        now = timezone.now()
+        new_likes = insert_ignore_many(
+            Like,
+            [
+                {'user_id': user_id, 'post_id': post_id, 'created_at': now}
+                for user_id, post_id in pairs if post_id in posts
+            ],
+            returning=('user_id', 'post_id'),
+        )
+        if not new_likes:
+            return []
+
+        # One counter update per distinct number of new likes per post
+        posts_by_total = defaultdict(list)
+        for post_id, total in Counter(post_id for _, post_id in new_likes).items():
+            posts_by_total[total].append(posts[post_id])
+        for total, liked_posts in posts_by_total.items():
+            adjust_likes_many(liked_posts, total)
+
+        post_type = ContentType.objects.get_for_model(Post)
+        Notification.objects.bulk_create([
+            Notification(
+                recipient_id=posts[post_id].author_id,
+                actor_id=user_id,
+                verb='liked',
+                target_content_type=post_type,
+                target_object_id=post_id,
+                timestamp=now,
+            )
+            for user_id, post_id in new_likes
+            if posts[post_id].author_id != user_id  # No notification for own posts
+        ])
+    return new_likes
+
+
+def read_log(path):
+    """(user_id, post_id) pairs of a log file, ignoring a torn last line"""
+    pairs = []
+    with open(path, encoding='utf-8') as log:
+        for line in log:
+            try:
+                entry = json.loads(line)
+                pairs.append((entry['user'], entry['post']))
+            except (ValueError, KeyError):
+                logger.warning('Skipping unreadable like log line in %s', path)
+    return pairs
+
+
+def buffer_name(path):
+    """likes-<name> prefix shared by the lock, log and segment files of one buffer"""
+    return path.name.split('.')[0]
+
+
+def owner_is_running(lock_path):
+    """
+    True while the buffer that created lock_path still holds its lock.
+    Without flock() support the owner is always assumed to be running.
+    """
+    if fcntl is None:
+        return True
+    try:
+        lock = open(lock_path, 'rb')
+    except FileNotFoundError:
+        return False
+    with lock:
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+    return False
+
+
+class LikeBuffer:
+    """
+    In-process like queue backed by an append-only log.
+    interval=None disables the background flusher (call flush() yourself).
+    """
+
+    def __init__(self, log_dir, interval=0.25, fsync=False):
+        self.pid = os.getpid()
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.name = f'likes-{self.pid}-{uuid.uuid4().hex[:12]}'
+        # Held until the process exits: marks the files below as in use
+        self.lock_path = self.log_dir / f'{self.name}.lock'
+        self._lock_file = open(self.lock_path, 'wb')
+        if fcntl is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        self.log_path = self.log_dir / f'{self.name}.log'
+        self.fsync = fsync
+        self._pending = []
+        self._segments = []
+        self._sequence = 0
+        self._lock = threading.Lock()        # Guards _pending and the log file
+        self._flush_lock = threading.Lock()  # One flush at a time
+        self._log = open(self.log_path, 'a', encoding='utf-8')
+        self._stopped = threading.Event()
+        self._thread = None
+        if interval:
+            self._thread = threading.Thread(target=self._run, args=(interval,), name='like-buffer', daemon=True)
+            self._thread.start()
+
+    def add(self, user_id, post_id):
+        """Durably record a like; it reaches the database on the next flush"""
+        with self._lock:
+            self._log.write(json.dumps({'user': user_id, 'post': post_id}) + '\n')
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+            self._pending.append((user_id, post_id))
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Store every buffered like; returns how many were new"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, []
+                # Rotate the log: the segment holds exactly this batch
+                self._log.close()
+                self._sequence += 1
+                segment = self.log_dir / f'{self.name}.{self._sequence}.flushing'
+                os.replace(self.log_path, segment)
+                self._segments.append(segment)
+                self._log = open(self.log_path, 'a', encoding='utf-8')
+
+            try:
+                stored = len(store_likes(batch))
+            except Exception:
+                # Keep the batch (and its segment) for the next attempt
+                with self._lock:
+                    self._pending = batch + self._pending
+                raise
+
+            # Committed: earlier failed segments were re-stored with this batch
+            for segment in self._segments:
+                segment.unlink(missing_ok=True)
+            self._segments = []
+            return stored
+
+    def _run(self, interval):
+        while not self._stopped.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Like buffer flush failed, retrying on the next tick')
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        """Stop the flusher and flush what is left (called at exit)"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Final like buffer flush failed; run replay_like_buffer')
+        with self._lock:
+            self._log.close()
+            if not self._pending and self.log_path.exists() and not self.log_path.stat().st_size:
+                self.log_path.unlink()
+            if not self._pending and not self._segments:
+                # Nothing left to replay
+                self.lock_path.unlink(missing_ok=True)
+            self._lock_file.close()
@@ -0,0 +1,53 @@
+# posts/management/commands/bench_feed_ranking.py
+import random
+import time
+from django.core.management.base import BaseCommand
+from posts import ranking
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the per-request cost of engagement scoring (posts.ranking).
+    Uses synthetic candidate windows, so it needs no data in the database.
+    Usage: python manage.py bench_feed_ranking [--sizes 1000 10000 50000] [--repeat 20]
+    """
+    help = 'Time engagement scoring and ordering of 1k/10k/50k feed candidates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        _, half_life_hours, weights = ranking.get_rank_settings()
+        rng = random.Random(42)
+        numpy_module = ranking.np
+
+        self.stdout.write(f"{'candidates':>10}  {'numpy ms':>9}  {'python ms':>9}")
+        for size in options['sizes']:
+            columns = (
+                [rng.uniform(0, 72) for _ in range(size)],
+                [rng.randint(0, 5000) for _ in range(size)],
+                [rng.randint(0, 300) for _ in range(size)],
+                [rng.randint(0, 50) for _ in range(size)],
+            )
+            timings = {}
+            for label, module in (('numpy', numpy_module), ('python', None)):
+                if label == 'numpy' and module is None:
+                    timings[label] = None
+                    continue
+                ranking.np = module
+                samples = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    scores = ranking.score_candidates(*columns, half_life_hours, weights)
+                    ranking.rank_order(scores)
+                    samples.append((time.perf_counter() - started) * 1000)
+                samples.sort()
+                timings[label] = samples[len(samples) // 2]
+            ranking.np = numpy_module
+
+            numpy_ms = f"{timings['numpy']:9.3f}" if timings['numpy'] is not None else f"{'n/a':>9}"
+            self.stdout.write(f"{size:>10}  {numpy_ms}  {timings['python']:9.3f}")
+
+        if numpy_module is None:
+            self.stdout.write(self.style.WARNING('NumPy is not installed; only the fallback was timed.'))
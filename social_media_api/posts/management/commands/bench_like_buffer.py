@@ -0,0 +1,71 @@
+# posts/management/commands/bench_like_buffer.py
+import tempfile
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from posts import like_buffer
+from posts.models import Like, Post
+from posts.views import like_post
+
+User = get_user_model()
+
+BENCH_PREFIX = 'bench-buffer-'
+
+
+class Command(BaseCommand):
+    """
+    Compare like_post throughput with LIKE_WRITE_MODE 'sync' and
+    'buffered'. For the buffered mode both the acknowledgement rate and
+    the end-to-end rate (including the final flush) are reported.
+    Creates throwaway users and posts (deleted afterwards), so run it
+    against a scratch copy of the database.
+    Usage: python manage.py bench_like_buffer [--likes 2000] [--posts 50]
+    """
+    help = 'Compare likes per second of the synchronous and the buffered like path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--likes', type=int, default=2000)
+        parser.add_argument('--posts', type=int, default=50)
+
+    def handle(self, *args, **options):
+        author = User.objects.create(username=f'{BENCH_PREFIX}author', password='!')
+        users = User.objects.bulk_create(
+            [User(username=f'{BENCH_PREFIX}{i}', password='!') for i in range(options['likes'])]
+        )
+        users = list(User.objects.filter(username__in=[user.username for user in users]))
+        try:
+            for mode in ('sync', 'buffered'):
+                Post.objects.bulk_create(
+                    [Post(author=author, title='Benchmark', content=mode) for _ in range(options['posts'])]
+                )
+                post_ids = list(Post.objects.filter(author=author, content=mode).values_list('id', flat=True))
+                with tempfile.TemporaryDirectory() as log_dir, override_settings(
+                    LIKE_WRITE_MODE=mode, LIKE_BUFFER_DIR=log_dir
+                ):
+                    acked, flushed = self.run_likes(users, post_ids)
+                stored = Like.objects.filter(post_id__in=post_ids).count()
+                line = f'{mode:>8}: {len(users) / acked:8.1f} likes/s acknowledged'
+                if flushed is not None:
+                    line += f', {len(users) / flushed:8.1f} likes/s stored'
+                self.stdout.write(f'{line} ({stored} likes stored)')
+        finally:
+            User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+    def run_likes(self, users, post_ids):
+        """(seconds until every like was acknowledged, seconds until stored or None)"""
+        factory = APIRequestFactory()
+        started = time.perf_counter()
+        for i, user in enumerate(users):
+            post_id = post_ids[i % len(post_ids)]
+            request = factory.post(f'/api/posts/{post_id}/like/')
+            force_authenticate(request, user=user)
+            like_post(request, pk=post_id)
+        acked = time.perf_counter() - started
+        if not like_buffer.buffered_likes_enabled():
+            return acked, None
+
+        # Stop the flusher and store whatever is still buffered
+        like_buffer.get_like_buffer().stop()
+        return acked, time.perf_counter() - started
@@ -0,0 +1,100 @@
+# posts/management/commands/bench_like_contention.py
+import threading
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from posts.counters import like_total, promote_to_sharded
+from posts.models import Post
+from posts.views import like_post
+
+User = get_user_model()
+
+BENCH_PREFIX = 'bench-like-'
+
+
+class Command(BaseCommand):
+    """
+    Hammer like_post on a single post from many threads, once with the
+    single Post.likes_count row and once with a sharded counter, and
+    report likes per second for both.
+    Creates throwaway users and posts (deleted afterwards), so run it
+    against a scratch copy of the database. Meaningful on PostgreSQL or
+    MySQL: SQLite serializes every write on one database-wide lock.
+    Usage: python manage.py bench_like_contention [--threads 16] [--likes 2000] [--shards 16]
+    """
+    help = 'Compare like_post throughput on a hot post with and without sharded counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--likes', type=int, default=2000, help='Likes per run (one per throwaway user)')
+        parser.add_argument('--shards', type=int, default=16)
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite allows one writer at a time, so both runs are serialized '
+                'and lock errors are likely; use PostgreSQL for real numbers.'
+            ))
+
+        author = User.objects.create(username=f'{BENCH_PREFIX}author', password='!')
+        User.objects.bulk_create(
+            [User(username=f'{BENCH_PREFIX}{i}', password='!') for i in range(options['likes'])]
+        )
+        likers = list(User.objects.filter(username__startswith=BENCH_PREFIX).exclude(pk=author.pk))
+        try:
+            for label, shards in (('single row', 0), ('sharded', options['shards'])):
+                post = Post.objects.create(author=author, title='Benchmark', content='Hot post')
+                if shards:
+                    promote_to_sharded(post.id, shards)
+                # Keep the single-row run from promoting itself halfway through
+                with override_settings(LIKE_SHARD_RATE_THRESHOLD=10 ** 9):
+                    liked, errors, elapsed = self.run_likes(post.id, likers, options['threads'])
+                post.refresh_from_db()
+                self.stdout.write(
+                    f'{label:>10}: {liked} likes in {elapsed:.2f}s = {liked / elapsed:8.1f} likes/s '
+                    f'({errors} errors, counter total {like_total(post)})'
+                )
+        finally:
+            # Cascades to the benchmark posts, likes and notifications
+            User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+    def run_likes(self, post_id, likers, thread_count):
+        """Like post_id once per liker, split over thread_count threads"""
+        factory = APIRequestFactory()
+        results = []
+        lock = threading.Lock()
+
+        def worker(users):
+            liked = errors = 0
+            try:
+                for user in users:
+                    request = factory.post(f'/api/posts/{post_id}/like/')
+                    force_authenticate(request, user=user)
+                    try:
+                        response = like_post(request, pk=post_id)
+                        if response.status_code == 201:
+                            liked += 1
+                        else:
+                            errors += 1
+                    except Exception:  # e.g. lock timeouts; count them and go on
+                        errors += 1
+            finally:
+                # Every thread opened its own connection
+                connections.close_all()
+            with lock:
+                results.append((liked, errors))
+
+        threads = [
+            threading.Thread(target=worker, args=(likers[i::thread_count],))
+            for i in range(thread_count)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return sum(liked for liked, _ in results), sum(errors for _, errors in results), elapsed
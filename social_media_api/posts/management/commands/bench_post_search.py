@@ -0,0 +1,119 @@
+# posts/management/commands/bench_post_search.py
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    """
+    Compare post search latency of the old icontains filter (LIKE '%term%'
+    on title and content) with the FTS5 index at 1M posts.
+    Works on a standalone SQLite file through the sqlite3 module, so it
+    never touches the project database. Each search runs what a search
+    page needs: the COUNT for pagination and the first page of 10.
+    Usage: python manage.py bench_post_search [--posts 1000000] [--queries 20] [--db /tmp/search.sqlite3]
+    """
+    help = 'Benchmark LIKE scans against the FTS5 post index on synthetic posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=20, help='Searches per term frequency class')
+        parser.add_argument('--db', default=None, help='Reuse this SQLite file between runs')
+
+    def handle(self, *args, **options):
+        path = options['db'] or os.path.join(tempfile.gettempdir(), f"bench_post_search_{options['posts']}.sqlite3")
+        db = sqlite3.connect(path)
+        rng = random.Random(42)
+        vocabulary = [f'w{i:05d}' for i in range(50000)]
+
+        existing = db.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name IN ('posts', 'posts_fts')"
+        ).fetchone()[0]
+        if existing < 2 or db.execute('SELECT COUNT(*) FROM posts').fetchone()[0] != options['posts']:
+            self.build(db, options['posts'], vocabulary, rng)
+
+        # Word rank decides frequency (Zipf): w00010 is common, w30000 is rare
+        term_classes = {
+            'common': vocabulary[5:50],
+            'medium': vocabulary[500:2000],
+            'rare': vocabulary[20000:40000],
+        }
+        self.stdout.write(f"{'terms':>8}  {'LIKE p50':>9}  {'LIKE p95':>9}  {'FTS5 p50':>9}  {'FTS5 p95':>9}  (ms)")
+        for label, words in term_classes.items():
+            like_ms, fts_ms = [], []
+            for _ in range(options['queries']):
+                term = rng.choice(words)
+                like_ms.append(self.time_like(db, term))
+                fts_ms.append(self.time_fts(db, term))
+            self.stdout.write(
+                f'{label:>8}  {_percentile(like_ms, 0.5):9.1f}  {_percentile(like_ms, 0.95):9.1f}  '
+                f'{_percentile(fts_ms, 0.5):9.2f}  {_percentile(fts_ms, 0.95):9.2f}'
+            )
+        db.close()
+        self.stdout.write(f'Database kept at {path}')
+
+    def build(self, db, total, vocabulary, rng):
+        """Create posts with Zipf-distributed words and index them"""
+        self.stdout.write(f'Generating {total} posts...')
+        started = time.perf_counter()
+        db.executescript('''
+            DROP TABLE IF EXISTS posts;
+            DROP TABLE IF EXISTS posts_fts;
+            CREATE TABLE posts (id INTEGER PRIMARY KEY, title TEXT, content TEXT, created_at REAL);
+            CREATE INDEX posts_created_idx ON posts (created_at);
+        ''')
+        cum_weights = []
+        running = 0.0
+        for rank in range(1, len(vocabulary) + 1):
+            running += 1.0 / rank
+            cum_weights.append(running)
+
+        batch = []
+        for post_id in range(1, total + 1):
+            words = rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(15, 45))
+            batch.append((post_id, ' '.join(words[:5]), ' '.join(words[5:]), post_id))
+            if len(batch) == 10000:
+                db.executemany('INSERT INTO posts VALUES (?, ?, ?, ?)', batch)
+                batch = []
+        if batch:
+            db.executemany('INSERT INTO posts VALUES (?, ?, ?, ?)', batch)
+
+        # Same schema as the posts_post_fts migration
+        db.executescript('''
+            CREATE VIRTUAL TABLE posts_fts USING fts5(title, content, tokenize = 'unicode61 remove_diacritics 2');
+            INSERT INTO posts_fts (rowid, title, content) SELECT id, title, content FROM posts;
+            INSERT INTO posts_fts (posts_fts) VALUES ('optimize');
+        ''')
+        db.commit()
+        self.stdout.write(f'Built in {time.perf_counter() - started:.1f}s')
+
+    def time_like(self, db, term):
+        """The old SearchFilter: icontains on title OR content, newest first"""
+        pattern = f'%{term}%'
+        started = time.perf_counter()
+        db.execute('SELECT COUNT(*) FROM posts WHERE title LIKE ? OR content LIKE ?', (pattern, pattern)).fetchone()
+        db.execute(
+            'SELECT id FROM posts WHERE title LIKE ? OR content LIKE ? ORDER BY created_at DESC LIMIT 10',
+            (pattern, pattern)
+        ).fetchall()
+        return (time.perf_counter() - started) * 1000
+
+    def time_fts(self, db, term):
+        """posts.search.SQLiteFTS5Backend: prefix MATCH ranked by bm25()"""
+        expression = f'"{term}"*'
+        started = time.perf_counter()
+        db.execute('SELECT COUNT(*) FROM posts_fts WHERE posts_fts MATCH ?', (expression,)).fetchone()
+        db.execute(
+            'SELECT posts.id FROM posts_fts JOIN posts ON posts.id = posts_fts.rowid '
+            'WHERE posts_fts MATCH ? ORDER BY bm25(posts_fts, 4.0, 1.0) LIMIT 10',
+            (expression,)
+        ).fetchall()
+        return (time.perf_counter() - started) * 1000
@@ -0,0 +1,36 @@
+# posts/management/commands/flush_post_views.py
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from posts.view_counter import fcntl, flush_views, get_spool_dir
+
+
+class Command(BaseCommand):
+    """
+    Store the post views spooled by the app processes into views_count
+    and unique_viewers (see posts.view_counter). Run it from cron, or
+    keep it running with --every. Only one flush runs at a time; a
+    second one started meanwhile exits with an error.
+    Usage: python manage.py flush_post_views [--every 5]
+    """
+    help = 'Store spooled post views in the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=None, help='Keep flushing every N seconds')
+
+    def handle(self, *args, **options):
+        spool_dir = get_spool_dir()
+        spool_dir.mkdir(parents=True, exist_ok=True)
+        with open(spool_dir / 'flush.lock', 'wb') as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise CommandError('Another flush_post_views is already running.')
+            while True:
+                views, posts = flush_views(spool_dir)
+                self.stdout.write(self.style.SUCCESS(f'Stored {views} views of {posts} posts.'))
+                if not options['every']:
+                    break
+                close_old_connections()
+                time.sleep(options['every'])
@@ -0,0 +1,36 @@
+# posts/management/commands/index_post_signatures.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from posts.models import Post
+from posts.near_duplicates import index_signatures
+
+
+class Command(BaseCommand):
+    """
+    Compute the MinHash signature and LSH buckets of every post, a chunk
+    of posts per transaction, so near-duplicate checks also match posts
+    written before the index existed or imported without save().
+    Usage: python manage.py index_post_signatures [--chunk-size 1000]
+    """
+    help = 'Backfill near-duplicate signatures of all posts, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = max(1, options['chunk_size'])
+        last_id = 0
+        indexed = 0
+        while True:
+            posts = list(
+                Post.objects.filter(id__gt=last_id).order_by('id')
+                .only('id', 'content')[:chunk_size]
+            )
+            if not posts:
+                break
+            with transaction.atomic():
+                index_signatures(posts)
+            indexed += len(posts)
+            last_id = posts[-1].id
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed signatures of {indexed} posts.'))
@@ -0,0 +1,36 @@
+# posts/management/commands/index_post_tags.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from posts.models import Post
+from posts.tags import index_posts
+
+
+class Command(BaseCommand):
+    """
+    Extract #hashtags and @mentions of every post into the PostTag and
+    PostMention index, a chunk of posts per transaction. Run after
+    deploying the index or after a bulk import that bypassed save().
+    Usage: python manage.py index_post_tags [--chunk-size 1000]
+    """
+    help = 'Rebuild the hashtag and mention index of all posts, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = max(1, options['chunk_size'])
+        last_id = 0
+        indexed = 0
+        while True:
+            posts = list(
+                Post.objects.filter(id__gt=last_id).order_by('id')
+                .only('id', 'content', 'created_at')[:chunk_size]
+            )
+            if not posts:
+                break
+            with transaction.atomic():
+                index_posts(posts)
+            indexed += len(posts)
+            last_id = posts[-1].id
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed hashtags and mentions of {indexed} posts.'))
@@ -0,0 +1,95 @@
+# posts/management/commands/precompute_feeds.py
+import multiprocessing
+import os
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import F
+
+User = get_user_model()
+
+# Cache backends whose entries never leave the process that wrote them
+PER_PROCESS_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _init_worker():
+    """Give each worker process its own database connection"""
+    import django
+    django.setup()
+    # Never reuse a connection inherited from the parent process
+    connections.close_all()
+
+
+def _precompute_shard(user_ids):
+    """Precompute the first feed page for one shard of users"""
+    from posts.feed_cache import precompute_first_page
+
+    pages = posts = 0
+    for user in User.objects.filter(id__in=user_ids).iterator():
+        posts += precompute_first_page(user)
+        pages += 1
+    connections.close_all()
+    return pages, posts
+
+
+class Command(BaseCommand):
+    """
+    Precompute and cache the first feed page of the most active users,
+    so their first request after a deploy or cache flush is a cache hit.
+    Users are ordered by last login and their ID range is split into
+    contiguous shards processed by a multiprocessing pool.
+
+    Safe to re-run while traffic is live: it only reads the feed tables
+    and writes cache entries keyed by feed version, so a page computed
+    before a concurrent change is simply never served.
+
+    Usage: python manage.py precompute_feeds [--users 1000] [--workers 4]
+    """
+    help = 'Precompute cached first feed pages for the N most active users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of most recently active users')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--shards', type=int, default=None, help='Defaults to 4 shards per worker')
+
+    def handle(self, *args, **options):
+        backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+        if backend in PER_PROCESS_BACKENDS:
+            # Each worker would fill its own cache and throw it away on exit
+            raise CommandError(
+                f'The default cache ({backend}) is not shared between processes, so precomputed '
+                'pages would never reach the web servers. Configure a shared CACHES backend '
+                '(Redis, Memcached, database) first.'
+            )
+
+        user_ids = sorted(
+            User.objects.order_by(F('last_login').desc(nulls_last=True))
+            .values_list('id', flat=True)[:options['users']]
+        )
+        if not user_ids:
+            self.stdout.write('No users to precompute.')
+            return
+
+        workers = max(1, options['workers'])
+        shard_count = max(1, min(len(user_ids), options['shards'] or workers * 4))
+        shard_size = -(-len(user_ids) // shard_count)
+        shards = [user_ids[i:i + shard_size] for i in range(0, len(user_ids), shard_size)]
+
+        # Connections must not be shared with the forked workers
+        connections.close_all()
+        started = time.perf_counter()
+        with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+            results = pool.map(_precompute_shard, shards)
+        elapsed = time.perf_counter() - started
+
+        pages = sum(shard_pages for shard_pages, _ in results)
+        posts = sum(shard_posts for _, shard_posts in results)
+        self.stdout.write(self.style.SUCCESS(
+            f'Precomputed {pages} feed pages ({posts} posts) with {workers} workers '
+            f'in {elapsed:.2f}s: {pages / elapsed:.1f} users/s.'
+        ))
@@ -0,0 +1,18 @@
+# posts/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+from posts.search import get_search_backend
+
+
+class Command(BaseCommand):
+    """
+    Re-index every post in the search backend (see posts.search).
+    Needed after writes that bypass the post save/delete signals, such
+    as bulk_create() imports or raw SQL.
+    Usage: python manage.py rebuild_search_index
+    """
+    help = 'Rebuild the full-text search index of posts'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        indexed = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} posts with {type(backend).__name__}.'))
@@ -0,0 +1,30 @@
+# posts/management/commands/rebuild_timelines.py
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from posts.timeline import rebuild_timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    Rebuild materialized home timelines from the follow graph.
+    Run once after deploying timelines, or to repair drift.
+    Usage: python manage.py rebuild_timelines [--user USER_ID ...]
+    """
+    help = 'Rebuild the materialized home timeline of every user who follows someone'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='Only rebuild these user IDs')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(following__isnull=False).distinct()
+        if options['user_ids']:
+            users = User.objects.filter(id__in=options['user_ids'])
+
+        rebuilt = 0
+        for user in users.iterator():
+            rebuild_timeline(user)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} timelines.'))
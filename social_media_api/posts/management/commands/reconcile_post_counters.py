@@ -0,0 +1,38 @@
+# posts/management/commands/reconcile_post_counters.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from posts.counters import reconcile_counters
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    """
+    Recompute Post.likes_count / Post.comments_count from the Like and
+    Comment tables and fix any post whose stored totals have drifted.
+    Walks posts in primary key order, one short transaction per chunk,
+    so it can run against a live database.
+    Usage: python manage.py reconcile_post_counters [--chunk-size 1000]
+    """
+    help = 'Repair drifted like/comment counters on posts, in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = max(1, options['chunk_size'])
+        last_id = 0
+        checked = fixed = 0
+        while True:
+            # Keyset walk instead of OFFSET, so each chunk is an index range scan
+            post_ids = list(
+                Post.objects.filter(id__gt=last_id).order_by('id')
+                .values_list('id', flat=True)[:chunk_size]
+            )
+            if not post_ids:
+                break
+            with transaction.atomic():
+                fixed += reconcile_counters(post_ids)
+            checked += len(post_ids)
+            last_id = post_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} posts, fixed {fixed} drifted counters.'))
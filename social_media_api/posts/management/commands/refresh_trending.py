@@ -0,0 +1,27 @@
+# posts/management/commands/refresh_trending.py
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from posts.trending import refresh_trending
+
+
+class Command(BaseCommand):
+    """
+    Rank the recent engagement buckets and store the trending list of
+    every window for /api/posts/trending/ (see posts.trending). Run it
+    from cron every minute, or keep it running with --every.
+    Usage: python manage.py refresh_trending [--every 60]
+    """
+    help = 'Recompute the trending posts served by /api/posts/trending/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=None, help='Keep refreshing every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            stored = refresh_trending()
+            self.stdout.write(self.style.SUCCESS(f'Stored {stored} trending entries.'))
+            if not options['every']:
+                break
+            close_old_connections()
+            time.sleep(options['every'])
@@ -0,0 +1,47 @@
+# posts/management/commands/replay_like_buffer.py
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from posts.like_buffer import buffer_name, get_buffer_dir, owner_is_running, read_log, store_likes
+
+
+class Command(BaseCommand):
+    """
+    Store the likes left in LIKE_BUFFER_DIR by app processes that died
+    before flushing their buffer (see posts.like_buffer), then delete
+    the files. Safe to run repeatedly: likes already stored are skipped.
+    Files of buffers whose process still holds their lock file are left
+    alone unless --all is given (on systems without flock(), --all is
+    needed to replay anything), so run it before (re)starting the app
+    servers.
+    Usage: python manage.py replay_like_buffer [--all] [--batch-size 5000]
+    """
+    help = 'Replay un-flushed buffered likes after a crash'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Also replay files of running processes')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        buffer_dir = get_buffer_dir()
+        buffers = defaultdict(list)
+        for path in buffer_dir.glob('likes-*'):
+            buffers[buffer_name(path)].append(path)
+
+        files = replayed = stored = 0
+        for name, paths in sorted(buffers.items()):
+            lock_path = buffer_dir / f'{name}.lock'
+            if not options['all'] and owner_is_running(lock_path):
+                self.stdout.write(f'Skipping {name}: its process is still running.')
+                continue
+            for path in sorted(path for path in paths if path.suffix != '.lock'):
+                pairs = read_log(path)
+                for start in range(0, len(pairs), options['batch_size']):
+                    stored += len(store_likes(pairs[start:start + options['batch_size']]))
+                replayed += len(pairs)
+                files += 1
+                path.unlink()
+            lock_path.unlink(missing_ok=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Replayed {replayed} buffered likes from {files} files, {stored} were new.'
+        ))
@@ -0,0 +1,141 @@
+# posts/merge_feed.py
+"""
+K-way merge home feed built from per-author recent-post caches.
+
+Each author has a cached, bounded list of their most recent
+(created_at, post_id) entries, newest first. A feed page is built by
+heap-merging the lists of every followed author and hydrating the
+winning post IDs with one query, which is O(page_size * log k) work
+once the caches are warm instead of one large SQL sort.
+
+Only the newest FEED_AUTHOR_CACHE_DEPTH posts of each author are
+reachable through this read path.
+"""
+import heapq
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from .models import Post
+
+AUTHOR_CACHE_KEY = 'feed:author_recent:{}'
+AUTHOR_CACHE_TIMEOUT = 3600
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def merge_read_path_enabled():
+    """True when FEED_READ_PATH selects this read path over the timeline"""
+    return getattr(settings, 'FEED_READ_PATH', 'timeline') == 'merge'
+
+
+def get_author_cache_depth():
+    """Number of recent posts cached per author"""
+    return getattr(settings, 'FEED_AUTHOR_CACHE_DEPTH', 200)
+
+
+def sort_key(created_at, post_id):
+    """Exact integer sort key (microseconds since epoch, post id)"""
+    return ((created_at - EPOCH) // timedelta(microseconds=1), post_id)
+
+
+def invalidate_author(author_id):
+    """Drop an author's cached list; called on post create, update and delete"""
+    cache.delete(AUTHOR_CACHE_KEY.format(author_id))
+
+
+def recent_entries(author_ids):
+    """
+    Return {author_id: [sort_key, ...]} newest first for the given authors.
+    Cache misses are filled with a single window-function query.
+    """
+    keys = {author_id: AUTHOR_CACHE_KEY.format(author_id) for author_id in author_ids}
+    cached = cache.get_many(keys.values())
+    entries = {author_id: cached[key] for author_id, key in keys.items() if key in cached}
+
+    missing = [author_id for author_id in author_ids if author_id not in entries]
+    if missing:
+        for author_id in missing:
+            entries[author_id] = []
+        rows = (
+            Post.objects.filter(author_id__in=missing)
+            .annotate(position=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('created_at').desc(), F('id').desc()],
+            ))
+            .filter(position__lte=get_author_cache_depth())
+            .order_by('author_id', '-created_at', '-id')
+            .values_list('author_id', 'created_at', 'id')
+        )
+        for author_id, created_at, post_id in rows:
+            entries[author_id].append(sort_key(created_at, post_id))
+        cache.set_many({keys[author_id]: entries[author_id] for author_id in missing}, AUTHOR_CACHE_TIMEOUT)
+    return entries
+
+
+def _newest_first(entries, before):
+    """Iterate a newest-first list starting strictly after (older than) before"""
+    start = 0
+    if before is not None:
+        start = bisect_right(entries, (-before[0], -before[1]), key=lambda entry: (-entry[0], -entry[1]))
+    return (entries[i] for i in range(start, len(entries)))
+
+
+def _oldest_first(entries, after):
+    """Iterate the entries strictly newer than after, oldest first"""
+    stop = bisect_left(entries, (-after[0], -after[1]), key=lambda entry: (-entry[0], -entry[1]))
+    return (entries[i] for i in range(stop - 1, -1, -1))
+
+
+def merge_entries(entry_lists, position=None, reverse=False, limit=10):
+    """
+    K-way merge of newest-first lists, returning up to limit sort keys
+    after position (newest first, or oldest first when reverse).
+    """
+    if reverse:
+        streams = [_oldest_first(entries, position) for entries in entry_lists]
+        merged = heapq.merge(*streams)
+    else:
+        streams = [_newest_first(entries, position) for entries in entry_lists]
+        merged = heapq.merge(*streams, reverse=True)
+    return list(islice(merged, limit))
+
+
+def merged_feed_page(user, position=None, reverse=False, limit=10, queryset=None):
+    """
+    Build one feed page for user from the followed authors' caches.
+    Fits FeedCursorPagination.paginate_fetch once user/queryset are bound.
+    """
+    author_ids = list(user.following.values_list('id', flat=True))
+    if not author_ids:
+        return []
+    if position is not None:
+        position = sort_key(*position)
+
+    entries = recent_entries(author_ids)
+    if queryset is None:
+        queryset = Post.objects.all()
+
+    page = []
+    while len(page) < limit:
+        winners = merge_entries(entries.values(), position, reverse, limit - len(page))
+        if not winners:
+            break
+        # Hydrate with one id__in query, keeping merge order
+        posts = queryset.in_bulk([post_id for _, post_id in winners])
+        page.extend(posts[post_id] for _, post_id in winners if post_id in posts)
+        # Posts deleted behind a cached list: merge further to fill the page
+        position = winners[-1]
+    return page
+
+
+def merged_feed_count(user):
+    """Number of posts the merge can reach: the cached entries of every followed author"""
+    author_ids = list(user.following.values_list('id', flat=True))
+    if not author_ids:
+        return 0
+    return sum(len(entries) for entries in recent_entries(author_ids).values())
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:37
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    """Initialise the new columns from the existing Like/Comment rows"""
+    Post = apps.get_model('posts', 'Post')
+
+    def total(model_name):
+        rows = apps.get_model('posts', model_name).objects.filter(post=OuterRef('pk')).order_by()
+        totals = rows.values('post').annotate(total=Count('id')).values('total')
+        return Coalesce(Subquery(totals, output_field=IntegerField()), Value(0))
+
+    Post.objects.update(likes_count=total('Like'), comments_count=total('Comment'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def create_fts_index(apps, schema_editor):
+    """FTS5 index of post titles and content (SQLite only, see posts.search)"""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts "
+            "USING fts5(title, content, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(
+            "INSERT INTO posts_post_fts (rowid, title, content) "
+            "SELECT id, title, content FROM posts_post"
+        )
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_likecountershard'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
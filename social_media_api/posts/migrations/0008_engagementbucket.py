@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_posttag_postmention'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EngagementBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('likes', models.IntegerField(default=0)),
+                ('comments', models.IntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='engagement_buckets', to='posts.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket_start'], name='posts_engagement_bucket_idx')],
+                'unique_together': {('post', 'bucket_start', 'shard')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TrendingPost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(max_length=10)),
+                ('rank', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trending_entries', to='posts.post')),
+            ],
+            options={
+                'unique_together': {('window', 'rank')},
+            },
+        ),
+    ]
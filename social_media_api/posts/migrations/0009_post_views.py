@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_engagementbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostViewerSketch',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='viewer_sketch', serialize=False, to='posts.post')),
+                ('registers', models.BinaryField(default=b'')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='unique_viewers',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='views_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
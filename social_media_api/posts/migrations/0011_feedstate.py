@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def flag_celebrities(apps, schema_editor):
+    """Flag the authors that were pulled on read before the flag existed"""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    FeedState = apps.get_model('posts', 'FeedState')
+    threshold = getattr(settings, 'FEED_CELEBRITY_FOLLOWER_THRESHOLD', 10000)
+    celebrities = (
+        User.objects.annotate(follower_total=Count('followers'))
+        .filter(follower_total__gt=threshold)
+        .values_list('id', flat=True)
+    )
+    FeedState.objects.bulk_create([FeedState(user_id=user_id, is_celebrity=True) for user_id in celebrities])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_near_duplicates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='feed_state', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('is_celebrity', models.BooleanField(default=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('author_version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(flag_celebrities, migrations.RunPython.noop),
+    ]
@@ -66,6 +66,14 @@ class Post(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized totals, kept current by the views (see posts.counters)
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+    # Number of LikeCounterShard rows once the post is hot, 0 before
+    like_shards = models.PositiveSmallIntegerField(default=0)
+    # Buffered view totals, flushed in batches (see posts.view_counter)
+    views_count = models.PositiveIntegerField(default=0)
+    unique_viewers = models.PositiveIntegerField(default=0)  # HyperLogLog estimate
 
     class Meta:
         ordering = ['-created_at']
@@ -115,3 +123,268 @@ class Like(models.Model):
 
     def __str__(self):
         return f"{self.user.username} likes {self.post.title}"
+
+# --- Materialized Home Timeline ---
+class TimelineEntry(models.Model):
+    """
+    One row per (follower, post) in a follower's home timeline.
+    Rows are pushed when a post is created (fan-out on write) and each
+    timeline is trimmed to FEED_TIMELINE_DEPTH entries, so the feed is a
+    single index range scan on (owner, created_at, post).
+    Deleting a post (or its author) cascades and retracts its entries.
+    """
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries' # The follower whose feed this is
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    # Denormalized from post so unfollow can purge without a join
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    # Copy of post.created_at, used as the timeline sort key
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('owner', 'post')
+        ordering = ['-created_at', '-post_id']
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-post'], name='posts_timeline_range_idx'),
+            models.Index(fields=['owner', 'author'], name='posts_timeline_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} in timeline of {self.owner_id}"
+
+
+# --- Sharded Like Counters ---
+class LikeCounterShard(models.Model):
+    """
+    One slice of a hot post's like counter. Once a post is promoted
+    (see posts.counters) likes increment a random shard instead of the
+    single Post.likes_count row, so concurrent likes rarely wait on the
+    same row lock. The total is likes_count plus the sum of the shards.
+    """
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='like_counter_shards'
+    )
+    shard = models.PositiveSmallIntegerField()
+    # Signed: a decrement may land on a different shard than its increment
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('post', 'shard')
+
+    def __str__(self):
+        return f"Shard {self.shard} of post {self.post_id}: {self.count}"
+
+
+# --- Hashtag / Mention Index ---
+class PostTag(models.Model):
+    """
+    Inverted index of #hashtags: one row per (tag, post), extracted from
+    the post content (see posts.tags). The tag page is a single range
+    scan on (tag, created_at, post) instead of a content LIKE scan.
+    """
+    tag = models.CharField(max_length=100)  # Lowercased, without '#'
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='tags'
+    )
+    # Copy of post.created_at, used as the tag page sort key
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('tag', 'post')
+        ordering = ['-created_at', '-post_id']
+        indexes = [
+            models.Index(fields=['tag', '-created_at', '-post'], name='posts_tag_range_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.tag} on {self.post_id}"
+
+
+class PostMention(models.Model):
+    """One row per (mentioned user, post) for each @username in a post"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='mentions'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='mentions'
+    )
+    # Copy of post.created_at, used as the sort key
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        ordering = ['-created_at', '-post_id']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='posts_mention_range_idx'),
+        ]
+
+    def __str__(self):
+        return f"@{self.user_id} in {self.post_id}"
+
+
+# --- Trending ---
+class EngagementBucket(models.Model):
+    """
+    Likes and comments a post received during one time slot of
+    TRENDING_BUCKET_SECONDS (see posts.trending). Counts are signed
+    because unlikes and comment deletes are recorded as -1 in the slot
+    they happen in.
+    """
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='engagement_buckets'
+    )
+    bucket_start = models.DateTimeField()
+    # Hot posts with sharded like counters spread their likes over as many rows
+    shard = models.PositiveSmallIntegerField(default=0)
+    likes = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('post', 'bucket_start', 'shard')
+        indexes = [
+            models.Index(fields=['bucket_start'], name='posts_engagement_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} at {self.bucket_start}: {self.likes} likes, {self.comments} comments"
+
+
+class TrendingPost(models.Model):
+    """
+    One post of the last computed trending list of a window, written by
+    `manage.py refresh_trending` (see posts.trending) and only read by
+    /api/posts/trending/.
+    """
+    window = models.CharField(max_length=10)
+    rank = models.PositiveIntegerField()
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='trending_entries'
+    )
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('window', 'rank')
+
+    def __str__(self):
+        return f"#{self.rank} of the {self.window}: post {self.post_id}"
+
+
+class PostViewerSketch(models.Model):
+    """
+    HyperLogLog sketch of a post's viewers (see posts.view_counter).
+    Kept out of Post so post queries never load the 2 KiB of registers.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='viewer_sketch'
+    )
+    registers = models.BinaryField(default=b'')  # Empty until the first merge
+
+    def __str__(self):
+        return f"Viewer sketch of post {self.post_id}"
+
+
+# --- Near-Duplicate Detection ---
+class PostSignature(models.Model):
+    """MinHash signature of a post's content, 64 little-endian uint32 values"""
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='signature'
+    )
+    minhash = models.BinaryField()
+
+    def __str__(self):
+        return f"Signature of post {self.post_id}"
+
+
+class PostLSHBucket(models.Model):
+    """
+    One LSH band of a post's signature, hashed to a 64-bit key. Posts
+    sharing a bucket are near-duplicate candidates; (bucket, post) is the
+    lookup index.
+    """
+    bucket = models.BigIntegerField()
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='lsh_buckets'
+    )
+
+    class Meta:
+        unique_together = ('bucket', 'post')
+
+    def __str__(self):
+        return f"Bucket {self.bucket} of post {self.post_id}"
+
+
+class PostDuplicateFlag(models.Model):
+    """
+    A post whose content nearly duplicates an earlier one, recorded by
+    PostCreateSerializer when POST_DUPLICATE_ACTION is 'flag'.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='duplicate_flag'
+    )
+    duplicate_of = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Post {self.post_id} duplicates {self.duplicate_of_id}"
+
+
+# --- Feed Bookkeeping ---
+class FeedState(models.Model):
+    """
+    Per-user home feed state shared by every process. is_celebrity marks
+    authors whose posts are pulled into feeds at read time instead of
+    fanned out (see posts.timeline); it only changes when the author
+    posts, so pushed and pulled posts never overlap or go missing.
+    version and author_version are the change counters of the user's
+    feed and of the posts they author (see posts.feed_sync).
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='feed_state'
+    )
+    is_celebrity = models.BooleanField(default=False)
+    version = models.BigIntegerField(default=0)
+    author_version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Feed state of {self.user_id}"
@@ -0,0 +1,173 @@
+# posts/near_duplicates.py
+"""
+Near-duplicate post detection (spam floods of almost identical content).
+
+Each post's content is cut into word bigram shingles and summarized by a
+MinHash signature of MINHASH_PERMUTATIONS 32-bit values: the share of
+equal positions in two signatures estimates the Jaccard similarity of
+the two shingle sets. Signatures are split into LSH_BANDS bands of
+LSH_ROWS values; each band is hashed to one PostLSHBucket row. Posts
+with similarity s share at least one bucket with probability
+1 - (1 - s ** LSH_ROWS) ** LSH_BANDS (above 98% for s = 0.7).
+
+A new post is checked by looking up its LSH_BANDS buckets (one index
+range scan, at most POST_DUPLICATE_MAX_CANDIDATES posts) and comparing
+the candidates' signatures, so the cost does not grow with the number of
+posts. PostCreateSerializer then flags (PostDuplicateFlag) or rejects
+the post, see POST_DUPLICATE_ACTION. Signatures are kept current by the
+post save signal; `manage.py index_post_signatures` backfills them.
+
+Signing runs as NumPy array operations; without NumPy installed the same
+hashes are computed in plain Python.
+"""
+import hashlib
+import random
+import re
+import struct
+from django.conf import settings
+from .models import PostDuplicateFlag, PostLSHBucket, PostSignature
+
+try:
+    import numpy as np
+except ImportError:  # Fall back to pure Python hashing
+    np = None
+
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+SHINGLE_WORDS = 2
+# Shorter posts ("Thanks!", "+1") are legitimately repeated, never check them
+MIN_WORDS = 8
+
+# h(x) = (a * x + b) mod MERSENNE_PRIME, truncated to 32 bits. a < 2 ** 31
+# keeps a * x + b below 2 ** 64 for 32-bit x, so uint64 arithmetic is exact.
+MERSENNE_PRIME = (1 << 61) - 1
+# Fixed seed: signatures must be comparable across processes and deploys
+_rng = random.Random(20240101)
+_COEFFICIENTS = [
+    (_rng.randrange(1, 1 << 31), _rng.randrange(0, 1 << 32))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+if np is not None:
+    _A = np.array([a for a, _ in _COEFFICIENTS], dtype=np.uint64)
+    _B = np.array([b for _, b in _COEFFICIENTS], dtype=np.uint64)
+
+SIGNATURE_FORMAT = f'<{MINHASH_PERMUTATIONS}I'
+
+
+def get_duplicate_settings():
+    """(action: 'flag', 'reject' or None, similarity threshold, candidate cap)"""
+    return (
+        getattr(settings, 'POST_DUPLICATE_ACTION', 'flag'),
+        getattr(settings, 'POST_DUPLICATE_THRESHOLD', 0.7),
+        getattr(settings, 'POST_DUPLICATE_MAX_CANDIDATES', 50),
+    )
+
+
+def shingles(text):
+    """32-bit hashes of the word bigrams of text, or None if text is too short"""
+    words = re.findall(r'\w+', (text or '').lower())
+    if len(words) < MIN_WORDS:
+        return None
+    return {
+        int.from_bytes(
+            hashlib.blake2b(' '.join(words[i:i + SHINGLE_WORDS]).encode(), digest_size=4).digest(),
+            'little'
+        )
+        for i in range(len(words) - SHINGLE_WORDS + 1)
+    }
+
+
+def minhash(text):
+    """MinHash signature of text as a tuple of ints, or None if too short"""
+    hashes = shingles(text)
+    if hashes is None:
+        return None
+    if np is not None:
+        values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+        permuted = (_A[:, None] * values[None, :] + _B[:, None]) % MERSENNE_PRIME
+        return tuple(int(value) for value in (permuted & 0xFFFFFFFF).min(axis=1))
+    return tuple(
+        min(((a * value + b) % MERSENNE_PRIME) & 0xFFFFFFFF for value in hashes)
+        for a, b in _COEFFICIENTS
+    )
+
+
+def band_buckets(signature):
+    """One signed 64-bit bucket key per band (the band index is part of the key)"""
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(struct.pack(f'<H{LSH_ROWS}I', band, *rows), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for a, b in zip(first, second) if a == b) / MINHASH_PERMUTATIONS
+
+
+def find_near_duplicate(text, exclude=None):
+    """
+    ID of the most similar existing post whose estimated similarity to
+    text reaches POST_DUPLICATE_THRESHOLD, or None. Two queries whatever
+    the number of posts. exclude is a post ID to ignore (the post being
+    edited).
+    """
+    signature = minhash(text)
+    if signature is None:
+        return None
+    _, threshold, max_candidates = get_duplicate_settings()
+    candidates = PostLSHBucket.objects.filter(bucket__in=band_buckets(signature))
+    if exclude is not None:
+        candidates = candidates.exclude(post_id=exclude)
+    candidate_ids = list(candidates.values_list('post_id', flat=True).distinct()[:max_candidates])
+    if not candidate_ids:
+        return None
+
+    best_id, best_score = None, threshold
+    for post_id, stored in PostSignature.objects.filter(post_id__in=candidate_ids).values_list('post_id', 'minhash'):
+        score = similarity(signature, struct.unpack(SIGNATURE_FORMAT, bytes(stored)))
+        if score >= best_score:
+            best_id, best_score = post_id, score
+    return best_id
+
+
+def flag_duplicate(post, duplicate_of_id):
+    """Record that post nearly duplicates duplicate_of_id, or clear it for None"""
+    if duplicate_of_id is None:
+        PostDuplicateFlag.objects.filter(post=post).delete()
+    else:
+        PostDuplicateFlag.objects.update_or_create(post=post, defaults={'duplicate_of_id': duplicate_of_id})
+
+
+def index_signatures(posts):
+    """
+    Replace the signature and LSH buckets of posts with those of their
+    content: one DELETE and one bulk INSERT per table for the whole batch.
+    """
+    posts = list(posts)
+    if not posts:
+        return
+    post_ids = [post.id for post in posts]
+    PostSignature.objects.filter(post_id__in=post_ids).delete()
+    PostLSHBucket.objects.filter(post_id__in=post_ids).delete()
+
+    signatures = {post.id: minhash(post.content) for post in posts}
+    signatures = {post_id: signature for post_id, signature in signatures.items() if signature is not None}
+    PostSignature.objects.bulk_create(
+        [
+            PostSignature(post_id=post_id, minhash=struct.pack(SIGNATURE_FORMAT, *signature))
+            for post_id, signature in signatures.items()
+        ],
+        batch_size=1000,
+    )
+    PostLSHBucket.objects.bulk_create(
+        [
+            PostLSHBucket(bucket=bucket, post_id=post_id)
+            for post_id, signature in signatures.items()
+            for bucket in band_buckets(signature)
+        ],
+        batch_size=1000,
+    )
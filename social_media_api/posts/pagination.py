@@ -16,4 +16,4 @@ class CustomPageNumberPagination(PageNumberPagination):
             'count': self.page.paginator.count,
             'total_pages': self.page.paginator.num_pages,
             'results': data
-        })
\ No newline at end of file
+        })
@@ -0,0 +1,130 @@
+# posts/search.py
+"""
+Full-text search over post titles and content (?search= on /api/posts/).
+
+The backend is pluggable through POST_SEARCH_BACKEND (a dotted path to a
+SearchBackend subclass). The default, SQLiteFTS5Backend, keeps an FTS5
+index in the posts_post_fts virtual table (rowid = post id) and ranks
+matches by BM25. It is kept in sync by post save/delete signals (see
+posts.signals); writes that bypass signals (bulk_create, update(), raw
+SQL) need `manage.py rebuild_search_index`. On databases without FTS5
+search falls back to IcontainsSearchBackend, the old LIKE '%term%' scan.
+
+Another engine (e.g. PostgreSQL tsvector + GIN) plugs in by implementing
+index_post(), remove_post(), rebuild() and search().
+"""
+from django.conf import settings
+from django.db import connection, DatabaseError
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+
+_backend = None
+
+
+class SearchBackend:
+    """Interface of a post search backend"""
+
+    def index_post(self, post):
+        """Add or refresh one post in the index"""
+
+    def remove_post(self, post_id):
+        """Drop one post from the index"""
+
+    def rebuild(self):
+        """Re-index every post; returns the number of indexed posts"""
+        return 0
+
+    def search(self, queryset, terms):
+        """Posts of queryset matching every term, best match first"""
+        raise NotImplementedError
+
+
+class IcontainsSearchBackend(SearchBackend):
+    """No index: every term must appear in the title or the content"""
+
+    def search(self, queryset, terms):
+        for term in terms:
+            queryset = queryset.filter(Q(title__icontains=term) | Q(content__icontains=term))
+        return queryset.order_by('-created_at', '-id')
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """SQLite FTS5 index with BM25 ranking (title matches weigh more)"""
+
+    # bm25() column weights: title, content
+    title_weight = 4.0
+    content_weight = 1.0
+
+    def index_post(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.id])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (%s, %s, %s)',
+                [post.id, post.title, post.content]
+            )
+
+    def remove_post(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, content) SELECT id, title, content FROM {Post._meta.db_table}'
+            )
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+            cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+            return cursor.fetchone()[0]
+
+    @staticmethod
+    def match_expression(terms):
+        """
+        FTS5 query: every term as a quoted prefix phrase, so user input is
+        never parsed as FTS5 syntax and 'pyth' still finds 'python'.
+        """
+        phrases = []
+        for term in terms:
+            term = term.replace('"', '').strip()
+            if term:
+                phrases.append(f'"{term}"*')
+        return ' '.join(phrases)
+
+    def search(self, queryset, terms):
+        expression = self.match_expression(terms)
+        if not expression:
+            return queryset
+        # Matching rowids as an IN subquery; rank each post with bm25()
+        # (lower is better) from the index row with the same rowid
+        matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression])
+        rank = RawSQL(
+            f'SELECT bm25({FTS_TABLE}, %s, %s) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {Post._meta.db_table}.id',
+            [self.title_weight, self.content_weight, expression],
+        )
+        return queryset.filter(id__in=matches).annotate(search_rank=rank).order_by('search_rank', '-id')
+
+    @staticmethod
+    def available():
+        """True when the FTS5 table exists on the current database"""
+        if connection.vendor != 'sqlite':
+            return False
+        try:
+            return FTS_TABLE in connection.introspection.table_names()
+        except DatabaseError:
+            return False
+
+
+def get_search_backend():
+    """The configured backend, or the icontains fallback if FTS5 is missing"""
+    global _backend
+    if _backend is None:
+        backend_class = import_string(getattr(settings, 'POST_SEARCH_BACKEND', 'posts.search.SQLiteFTS5Backend'))
+        if backend_class is SQLiteFTS5Backend and not SQLiteFTS5Backend.available():
+            backend_class = IcontainsSearchBackend
+        _backend = backend_class()
+    return _backend
@@ -1,9 +1,68 @@
 # posts/serializers.py
 from rest_framework import serializers
-from .models import Post, Comment
+from .models import Post, Comment, Like
+from .counters import like_total, sharded_likes
+from .near_duplicates import find_near_duplicate, flag_duplicate, get_duplicate_settings
 from django.conf import settings
+from django.db import models
+from django.db.models import Prefetch
+from django.urls import reverse
 
-class CommentSerializer(serializers.ModelSerializer):
+
+def get_comments_preview_size(request):
+    """
+    Number of comments embedded per post on list endpoints, or None to
+    embed them all. ?comments=latest embeds the newest
+    POST_COMMENTS_PREVIEW_SIZE comments of each post.
+    """
+    if request is None or request.query_params.get('comments') != 'latest':
+        return None
+    return getattr(settings, 'POST_COMMENTS_PREVIEW_SIZE', 3)
+
+
+def get_requested_fields(request):
+    """
+    Field names asked for with ?fields=a,b (plus any ?expand=), or None
+    when the client wants the full representation.
+    """
+    if request is None or not request.query_params.get('fields'):
+        return None
+    requested = set()
+    for param in ('fields', 'expand'):
+        value = request.query_params.get(param, '')
+        requested.update(name.strip() for name in value.split(',') if name.strip())
+    return requested
+
+
+def only_requested_columns(queryset, requested, always=('id',)):
+    """
+    Restrict the SELECT to the model columns behind the requested fields.
+    Columns in always are kept because the view itself reads them.
+    """
+    if requested is None:
+        return queryset
+    columns = {field.name for field in queryset.model._meta.concrete_fields}
+    return queryset.only(*(set(always) | (requested & columns)))
+
+
+class SparseFieldsMixin:
+    """
+    Drop every field not listed in ?fields= (GET requests only).
+    Nested serializers get nested=True in their context so the
+    client's field list only applies to the top-level objects.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if self.context.get('nested') or request is None or request.method != 'GET':
+            return
+        requested = get_requested_fields(request)
+        if requested is not None:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for Comment model
     """
@@ -21,24 +80,122 @@ class CommentSerializer(serializers.ModelSerializer):
         validated_data['author'] = self.context['request'].user
         return super().create(validated_data)
 
-class PostSerializer(serializers.ModelSerializer):
+class PostListSerializer(serializers.ListSerializer):
+    """
+    Serializes a page of posts. Before rendering it looks up which of
+    the page's posts the viewer liked with a single query, so
+    liked_by_me costs one query per page whatever the page size.
+    """
+
+    def to_representation(self, data):
+        posts = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        request = self.context.get('request')
+        if 'liked_by_me' in self.child.fields and request is not None and request.user.is_authenticated:
+            self._context['liked_post_ids'] = set(
+                Like.objects.filter(user=request.user, post_id__in=[post.id for post in posts])
+                .order_by().values_list('post_id', flat=True)
+            )
+        return super().to_representation(posts)
+
+class PostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for Post model
+    ?fields=id,title limits the output to those fields; nested comments
+    are then only embedded with ?expand=comments (or fields=...,comments).
     """
     author = serializers.StringRelatedField(read_only=True)  # Show username instead of ID
-    comments = CommentSerializer(many=True, read_only=True)  # Nested comments
-    comments_count = serializers.SerializerMethodField()  # Count of comments
+    comments = serializers.SerializerMethodField()  # Nested comments
+    comments_count = serializers.IntegerField(read_only=True)  # Denormalized column
+    views_count = serializers.IntegerField(read_only=True)  # Buffered, see posts.view_counter
+    unique_viewers = serializers.IntegerField(read_only=True)  # HyperLogLog estimate
+    likes_count = serializers.SerializerMethodField()  # Column plus hot-post shards
+    comments_url = serializers.SerializerMethodField()  # Full comment list, ?comments=latest only
+    liked_by_me = serializers.SerializerMethodField()  # Has the viewer liked it?
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
     
     class Meta:
         model = Post
-        fields = ['id', 'author', 'title', 'content', 'created_at', 'updated_at', 'comments', 'comments_count']
+        fields = ['id', 'author', 'title', 'content', 'created_at', 'updated_at', 'comments', 'comments_count', 'likes_count', 'views_count', 'unique_viewers', 'liked_by_me', 'comments_url']
         read_only_fields = ['id', 'author', 'created_at', 'updated_at', 'comments']
+        list_serializer_class = PostListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Only comment previews link to the full list
+        if get_comments_preview_size(self.context.get('request')) is None:
+            self.fields.pop('comments_url', None)
     
-    def get_comments_count(self, obj):
-        """Return the count of comments for this post"""
-        return obj.comments.count()
+    @staticmethod
+    def setup_eager_loading(queryset, request=None, preview=True):
+        """
+        Load everything this serializer reads in a fixed number of queries:
+        the author with the post and the comments (with their authors) in
+        one prefetch. Like/comment totals are columns of Post (plus the
+        like shards of hot posts, summed in the same query).
+        Pass the request to honour ?fields=/?expand=: only the requested
+        columns are selected and unused joins and prefetches are skipped.
+        preview=True (list endpoints) also honours ?comments=latest.
+        """
+        requested = get_requested_fields(request)
+        if requested is not None:
+            # created_at is the feed/pagination sort key, always keep it
+            queryset = only_requested_columns(queryset, requested, always=('id', 'created_at'))
+            if 'author' in requested:
+                queryset = queryset.select_related('author')
+            if 'likes_count' in requested:
+                queryset = queryset.annotate(sharded_likes=sharded_likes())
+            if 'comments' not in requested:
+                return queryset
+            return queryset.prefetch_related(PostSerializer.comments_prefetch(request, preview))
+        return queryset.select_related('author').annotate(
+            sharded_likes=sharded_likes()
+        ).prefetch_related(
+            PostSerializer.comments_prefetch(request, preview)
+        )
+    
+    @staticmethod
+    def comments_prefetch(request, preview):
+        """Prefetch of the embedded comments, sliced in ?comments=latest mode"""
+        comments = Comment.objects.select_related('author')
+        preview_size = get_comments_preview_size(request) if preview else None
+        if preview_size is not None:
+            # Sliced prefetch: one ROW_NUMBER() OVER (PARTITION BY post_id) query
+            return Prefetch(
+                'comments',
+                queryset=comments.order_by('-created_at', '-id')[:preview_size],
+                to_attr='latest_comments'
+            )
+        return Prefetch('comments', queryset=comments)
+    
+    def get_comments(self, obj):
+        """All comments, or only the latest ones in ?comments=latest mode"""
+        comments = getattr(obj, 'latest_comments', None)
+        if comments is None:
+            comments = obj.comments.all()
+        context = dict(self.context, nested=True)
+        return CommentSerializer(comments, many=True, context=context).data
+    
+    def get_likes_count(self, obj):
+        """Total likes, including the counter shards of a hot post"""
+        return like_total(obj)
+    
+    def get_liked_by_me(self, obj):
+        """Whether the requesting user liked this post"""
+        liked_post_ids = self.context.get('liked_post_ids')
+        if liked_post_ids is not None:
+            # Filled once for the whole page by PostListSerializer
+            return obj.id in liked_post_ids
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return False
+        return Like.objects.filter(user=request.user, post_id=obj.id).exists()
+    
+    def get_comments_url(self, obj):
+        """Link to the full, paginated comment list of this post"""
+        url = f"{reverse('comment-list')}?post={obj.id}"
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
     
     def create(self, validated_data):
         # Automatically set the author to the current user
@@ -77,6 +234,24 @@ class PostCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Content cannot be empty")
         return value.strip()
 
+    def validate(self, attrs):
+        """Flag or reject near-duplicates of existing posts (see posts.near_duplicates)"""
+        action = get_duplicate_settings()[0]
+        if not action or 'content' not in attrs:
+            return attrs
+        duplicate_id = find_near_duplicate(attrs['content'], exclude=self.instance.pk if self.instance else None)
+        if duplicate_id is not None and action == 'reject':
+            raise serializers.ValidationError({'content': 'This post is nearly identical to an existing post.'})
+        self.duplicate_of_id = duplicate_id
+        return attrs
+
+    def save(self, **kwargs):
+        post = super().save(**kwargs)
+        if hasattr(self, 'duplicate_of_id'):
+            # Also clears the flag when an edit makes the post original
+            flag_duplicate(post, self.duplicate_of_id)
+        return post
+
 class CommentCreateSerializer(serializers.ModelSerializer):
     """
     Serializer for creating Comment (simplified version for creation)
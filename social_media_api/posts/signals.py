@@ -0,0 +1,27 @@
+# posts/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Post
+from .near_duplicates import index_signatures
+from .search import get_search_backend
+from .tags import index_posts
+from .timeline import retract_post
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, update_fields=None, **kwargs):
+    """Keep the search, hashtag/mention and near-duplicate indexes in step with the post"""
+    # Counter-only saves (likes_count, views_count...) leave the text alone
+    if update_fields is None or {'title', 'content'} & set(update_fields):
+        get_search_backend().index_post(instance)
+    if update_fields is None or {'content', 'created_at'} & set(update_fields):
+        index_posts([instance])
+    if update_fields is None or 'content' in update_fields:
+        index_signatures([instance])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    get_search_backend().remove_post(instance.id)
+    # Feeds that showed the post must not answer ?since= with 304
+    retract_post(instance)
@@ -0,0 +1,77 @@
+# posts/tags.py
+"""
+#hashtag and @mention extraction into the PostTag / PostMention index.
+
+Posts are (re)indexed on save through posts.signals. index_posts()
+works on any number of posts with a fixed number of queries (one user
+lookup, one DELETE and one bulk INSERT per table), so bulk imports
+should call it once per batch, or run `manage.py index_post_tags`.
+"""
+import re
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from .models import Post, PostMention, PostTag
+
+User = get_user_model()
+
+# Not preceded by a word character, so emails and URL fragments don't count
+HASHTAG_RE = re.compile(r'(?<![\w#&])#(\w{1,100})')
+MENTION_RE = re.compile(r'(?<![\w@])@([\w.@+-]{1,150})')
+
+
+def extract_tags(text):
+    """Distinct lowercased hashtags of text, in order of appearance"""
+    return list(dict.fromkeys(tag.lower() for tag in HASHTAG_RE.findall(text or '')))
+
+
+def extract_mentions(text):
+    """Distinct @usernames of text, in order of appearance"""
+    # Usernames may contain '.', but a mention rarely ends a sentence with one
+    return list(dict.fromkeys(name.rstrip('.') for name in MENTION_RE.findall(text or '')))
+
+
+def index_posts(posts):
+    """Replace the tag and mention rows of posts with those of their content"""
+    posts = list(posts)
+    if not posts:
+        return
+    post_ids = [post.id for post in posts]
+    mentions = {post.id: extract_mentions(post.content) for post in posts}
+    usernames = {name for names in mentions.values() for name in names}
+    user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id')) if usernames else {}
+
+    PostTag.objects.filter(post_id__in=post_ids).delete()
+    PostMention.objects.filter(post_id__in=post_ids).delete()
+    PostTag.objects.bulk_create(
+        [
+            PostTag(tag=tag, post_id=post.id, created_at=post.created_at)
+            for post in posts
+            for tag in extract_tags(post.content)
+        ],
+        batch_size=1000,
+    )
+    PostMention.objects.bulk_create(
+        [
+            PostMention(user_id=user_ids[name], post_id=post.id, created_at=post.created_at)
+            for post in posts
+            for name in mentions[post.id]
+            if name in user_ids
+        ],
+        batch_size=1000,
+    )
+
+
+def tag_queryset(tag):
+    """
+    Posts tagged with tag, newest first. The sort keys are read from the
+    PostTag row so ordering and keyset filters hit the (tag, created_at,
+    post) index.
+    """
+    return (
+        Post.objects.filter(tags__tag=tag.lower())
+        .annotate(
+            tag_created_at=F('tags__created_at'),
+            tag_post_id=F('tags__post_id'),
+        )
+        .order_by('-tag_created_at', '-tag_post_id')
+    )
@@ -1,3 +1,906 @@
-from django.test import TestCase
+import atexit
+import io
+import tempfile
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from datetime import timedelta
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
+from common.upserts import insert_ignore, insert_ignore_many
+from . import like_buffer, ranking, view_counter
+from .counters import reconcile_counters
+from .feed_cache import precompute_first_page
+from .feed_sync import bump_feed_versions, read_feed_state
+from .models import (
+    Comment, EngagementBucket, FeedState, Like, Post, PostDuplicateFlag, PostMention, TimelineEntry,
+)
+from .timeline import fan_out_post, feed_queryset, rebuild_timeline, timeline_queryset
+from .merge_feed import merge_entries, sort_key
+from common.pagination import FeedCursorPagination
+from .trending import bucket_start
+from .views import FeedViewSet
 
-# Create your tests here.
+User = get_user_model()
+
+# Detail views append to a spool file: keep those out of the source tree
+VIEW_SPOOL_DIR = tempfile.TemporaryDirectory()
+
+
+def tearDownModule():
+    view_counter.close_view_spool()
+    VIEW_SPOOL_DIR.cleanup()
+
+
+@override_settings(POST_VIEW_SPOOL_DIR=VIEW_SPOOL_DIR.name)
+class PostQueryCountTests(APITestCase):
+    """
+    Post list/detail and feed responses must run a constant number of
+    queries, whatever the page size or number of comments.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.authors = [User.objects.create_user(username=f'author{i}') for i in range(3)]
+        for author in self.authors:
+            author.followers.add(self.reader)
+        self.client.force_authenticate(self.reader)
+
+    def create_posts(self, count):
+        for i in range(count):
+            author = self.authors[i % len(self.authors)]
+            post = Post.objects.create(author=author, title=f'Post {i}', content='Content')
+            for commenter in self.authors:
+                Comment.objects.create(post=post, author=commenter, content='Nice')
+            fan_out_post(post)
+        reconcile_counters(Post.objects.values_list('id', flat=True))
+        # Start every request from a cold feed cache
+        cache.clear()
+
+    def test_post_list_query_count(self):
+        self.create_posts(2)
+        # COUNT for pagination, posts with authors, comments with authors, viewer's likes
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/posts/')
+        self.assertEqual(len(response.data['results']), 2)
+
+        self.create_posts(8)
+        Like.objects.create(user=self.reader, post=Post.objects.latest('created_at'))
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/posts/')
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(response.data['results'][0]['comments_count'], 3)
+        liked = [post['liked_by_me'] for post in response.data['results']]
+        self.assertEqual(liked, [True] + [False] * 9)
+
+    def test_post_detail_query_count(self):
+        self.create_posts(1)
+        post = Post.objects.get()
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/posts/{post.id}/')
+        self.assertEqual(response.data['comments_count'], 3)
+        self.assertEqual(len(response.data['comments']), 3)
+
+    def test_user_feed_query_count(self):
+        self.create_posts(2)
+        # Celebrity set, feed page, comments prefetch, viewer's likes
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/feed/')
+        self.assertEqual(len(response.data['results']), 2)
+
+        self.create_posts(20)
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/feed/', {'page_size': 20})
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_feed_viewset_query_count(self):
+        self.create_posts(12)
+        view = FeedViewSet.as_view({'get': 'list'})
+        request = APIRequestFactory().get('/feed/')
+        force_authenticate(request, user=self.reader)
+        # Celebrity set, feed page, comments prefetch, viewer's likes
+        with self.assertNumQueries(4):
+            response = view(request)
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_sparse_fieldset_skips_joins_and_prefetch(self):
+        self.create_posts(4)
+        # COUNT for pagination and the narrowed post SELECT only
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/posts/', {'fields': 'id,title'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+
+        # ?expand=comments brings back the comments prefetch
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/posts/', {'fields': 'id,title', 'expand': 'comments'})
+        first = response.data['results'][0]
+        self.assertEqual(set(first), {'id', 'title', 'comments'})
+        self.assertEqual(len(first['comments'][0]), 6)
+
+        # Celebrity set and the feed page, no comments prefetch
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/feed/', {'fields': 'id,author'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'author'})
+
+
+class TimelineTests(APITestCase):
+    """Fan-out on write keeps each follower's materialized timeline current"""
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.other_reader = User.objects.create_user(username='other_reader')
+        self.author = User.objects.create_user(username='author')
+        self.quiet = User.objects.create_user(username='quiet')
+        self.author.followers.add(self.reader, self.other_reader)
+        self.client.force_authenticate(self.reader)
+
+    def publish(self, author, title, minutes_ago=0):
+        post = Post.objects.create(
+            author=author, title=title, content='Content',
+            created_at=timezone.now() - timedelta(minutes=minutes_ago)
+        )
+        fan_out_post(post)
+        return post
+
+    def timeline(self, user):
+        return list(timeline_queryset(user).values_list('title', flat=True))
+
+    def test_fan_out_reaches_every_follower(self):
+        post = self.publish(self.author, 'Hello')
+        owners = set(TimelineEntry.objects.filter(post=post).values_list('owner_id', flat=True))
+        self.assertEqual(owners, {self.reader.id, self.other_reader.id})
+        self.assertEqual(self.timeline(self.quiet), [])
+        response = self.client.get('/api/feed/')
+        self.assertEqual([item['title'] for item in response.data['results']], ['Hello'])
+
+        # Deleting the post retracts it from every timeline
+        post.delete()
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    @override_settings(FEED_TIMELINE_DEPTH=3)
+    def test_timelines_are_trimmed_to_depth(self):
+        for i in range(5):
+            self.publish(self.author, f'Post {i}', minutes_ago=10 - i)
+        self.assertEqual(self.timeline(self.reader), ['Post 4', 'Post 3', 'Post 2'])
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.other_reader).count(), 3)
+
+    def test_follow_backfills_and_unfollow_purges(self):
+        self.publish(self.quiet, 'Before the follow', minutes_ago=5)
+        self.publish(self.author, 'Author post')
+        self.client.post(f'/api/accounts/follow/{self.quiet.id}/')
+        self.assertEqual(self.timeline(self.reader), ['Author post', 'Before the follow'])
+
+        self.client.post(f'/api/accounts/unfollow/{self.author.id}/')
+        self.assertEqual(self.timeline(self.reader), ['Before the follow'])
+        self.assertEqual(self.timeline(self.other_reader), ['Author post'])
+
+    @override_settings(FEED_TIMELINE_DEPTH=4)
+    def test_rebuild_matches_fan_out(self):
+        self.quiet.followers.add(self.reader)
+        for i in range(6):
+            self.publish([self.author, self.quiet][i % 2], f'Post {i}', minutes_ago=10 - i)
+        # Same timestamp as Post 5: the post ID breaks the tie
+        tie = Post.objects.create(
+            author=self.author, title='Tie', content='Content', created_at=Post.objects.get(title='Post 5').created_at
+        )
+        fan_out_post(tie)
+
+        def entries():
+            return list(
+                TimelineEntry.objects.filter(owner=self.reader)
+                .order_by('-created_at', '-post_id').values_list('post_id', 'author_id', 'created_at')
+            )
+        pushed = entries()
+        version = read_feed_state(self.reader)[0]
+        rebuild_timeline(self.reader)
+        self.assertEqual(entries(), pushed)
+        # Cached pages and since-tokens of the old timeline are invalidated
+        self.assertNotEqual(read_feed_state(self.reader)[0], version)
+        self.assertEqual(self.timeline(self.reader), ['Tie', 'Post 5', 'Post 4', 'Post 3'])
+        # And both agree with the pull query the timeline replaces
+        pulled = Post.objects.filter(author__in=self.reader.following.all()).order_by('-created_at', '-id')
+        self.assertEqual([post_id for post_id, _, _ in pushed], list(pulled.values_list('id', flat=True)[:4]))
+
+
+@override_settings(FEED_CELEBRITY_FOLLOWER_THRESHOLD=2)
+class CelebrityFeedTests(APITestCase):
+    """Authors above the follower threshold are pulled on read, consistently"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.readers = [User.objects.create_user(username=f'reader{i}') for i in range(3)]
+        self.author.followers.add(*self.readers[:2])
+        self.client.force_authenticate(self.readers[0])
+
+    def publish(self, title):
+        response = self.client.post('/api/posts/', {'title': title, 'content': 'Content'})
+        self.assertEqual(response.status_code, 201)
+
+    def feed(self, reader):
+        self.client.force_authenticate(reader)
+        return [post['title'] for post in self.client.get('/api/feed/').data['results']]
+
+    def test_promotion_and_demotion_keep_every_post_visible(self):
+        self.client.force_authenticate(self.author)
+        self.publish('Pushed')
+        self.assertEqual(self.feed(self.readers[0]), ['Pushed'])
+
+        # The third follower makes the author a celebrity: the next post is pulled
+        self.author.followers.add(self.readers[2])
+        self.client.force_authenticate(self.author)
+        self.publish('Pulled')
+        self.assertTrue(FeedState.objects.get(user=self.author).is_celebrity)
+        self.assertFalse(TimelineEntry.objects.filter(post__title='Pulled').exists())
+        self.assertEqual(self.feed(self.readers[0]), ['Pulled', 'Pushed'])
+        # Pulled posts include the ones published before the follow
+        self.assertEqual(self.feed(self.readers[2]), ['Pulled', 'Pushed'])
+
+        # Back under the threshold: the pulled posts are pushed to every follower
+        self.author.followers.remove(self.readers[1])
+        self.client.force_authenticate(self.author)
+        self.publish('Pushed again')
+        self.assertFalse(FeedState.objects.get(user=self.author).is_celebrity)
+        self.assertEqual(self.feed(self.readers[0]), ['Pushed again', 'Pulled', 'Pushed'])
+        self.assertEqual(self.feed(self.readers[2]), ['Pushed again', 'Pulled', 'Pushed'])
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.readers[2]).count(), 3)
+
+
+class FeedCursorPaginationTests(APITestCase):
+    """Keyset pages of the feed are stable across ties and concurrent posts"""
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.author = User.objects.create_user(username='author')
+        self.author.followers.add(self.reader)
+        self.client.force_authenticate(self.reader)
+        now = timezone.now()
+        # Posts 1-3 share a timestamp: only the ID orders them
+        times = [now - timedelta(minutes=5), now, now, now, now + timedelta(minutes=5)]
+        self.posts = [self.publish(f'Post {i}', created_at) for i, created_at in enumerate(times)]
+
+    def publish(self, title, created_at):
+        post = Post.objects.create(author=self.author, title=title, content='Content', created_at=created_at)
+        fan_out_post(post)
+        return post
+
+    def titles(self, response):
+        return [post['title'] for post in response.data['results']]
+
+    def test_next_and_previous_across_a_tie(self):
+        pages, response = [], self.client.get('/api/feed/', {'page_size': 2})
+        self.assertIsNone(response.data['links']['previous'])
+        while True:
+            pages.append(self.titles(response))
+            if not response.data['links']['next']:
+                break
+            response = self.client.get(response.data['links']['next'])
+        self.assertEqual(pages, [['Post 4', 'Post 3'], ['Post 2', 'Post 1'], ['Post 0']])
+
+        # Walking back from the last page returns the same pages
+        backwards = []
+        while response.data['links']['previous']:
+            response = self.client.get(response.data['links']['previous'])
+            backwards.append(self.titles(response))
+        self.assertEqual(backwards, [['Post 2', 'Post 1'], ['Post 4', 'Post 3']])
+
+    def test_new_post_does_not_shift_the_next_page(self):
+        response = self.client.get('/api/feed/', {'page_size': 2})
+        self.publish('Newest', timezone.now() + timedelta(minutes=10))
+        response = self.client.get(response.data['links']['next'])
+        self.assertEqual(self.titles(response), ['Post 2', 'Post 1'])
+        self.assertEqual(self.titles(self.client.get('/api/feed/', {'page_size': 2})), ['Newest', 'Post 4'])
+
+    def test_count_page_size_and_invalid_cursor(self):
+        response = self.client.get('/api/feed/', {'page_size': 2, 'count': 'true'})
+        self.assertEqual(response.data['count'], 5)
+        # Only the first request pays for the COUNT
+        self.assertNotIn('count=', response.data['links']['next'])
+        self.assertNotIn('count', self.client.get('/api/feed/').data)
+
+        paginator = FeedCursorPagination()
+        factory = APIRequestFactory()
+        for value, expected in (('1000', 100), ('0', 1), ('abc', 10), ('7', 7)):
+            request = Request(factory.get('/feed/', {'page_size': value}))
+            self.assertEqual(paginator.get_page_size(request), expected)
+        self.assertEqual(len(self.client.get('/api/feed/', {'page_size': 1000}).data['results']), 5)
+
+        for cursor in ('bogus', 'bnxub3QtYS1kYXRlfDE='):
+            self.assertEqual(self.client.get('/api/feed/', {'cursor': cursor}).status_code, 404)
+
+
+@override_settings(FEED_READ_PATH='merge')
+class MergeFeedTests(APITestCase):
+    """FEED_READ_PATH='merge' serves the same feed from per-author caches"""
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.authors = [User.objects.create_user(username=f'author{i}') for i in range(3)]
+        self.reader.following.add(*self.authors)
+        self.client.force_authenticate(self.reader)
+        now = timezone.now()
+        for i in range(8):
+            # Every third post shares the previous one's timestamp
+            created_at = now - timedelta(minutes=i - i % 3)
+            post = Post.objects.create(author=self.authors[i % 3], title=f'Post {i}', content='Content', created_at=created_at)
+            fan_out_post(post)
+
+    def test_heap_merge(self):
+        first = [sort_key(timezone.now(), 9), sort_key(timezone.now() - timedelta(hours=2), 2)]
+        second = [sort_key(timezone.now() - timedelta(hours=1), 5), sort_key(timezone.now() - timedelta(hours=2), 3)]
+        newest_first = [entry[1] for entry in merge_entries([first, second], limit=10)]
+        self.assertEqual(newest_first, [9, 5, 3, 2])
+        self.assertEqual([entry[1] for entry in merge_entries([first, second], position=second[0], limit=2)], [3, 2])
+        # reverse walks back towards the newest posts, oldest first
+        older = [entry[1] for entry in merge_entries([first, second], position=first[1], reverse=True, limit=10)]
+        self.assertEqual(older, [3, 5, 9])
+
+    def test_pages_agree_with_the_timeline(self):
+        expected = list(feed_queryset(self.reader).values_list('id', flat=True))
+        self.assertEqual(len(expected), 8)
+        merged, response = [], self.client.get('/api/feed/', {'page_size': 3})
+        while True:
+            merged += [post['id'] for post in response.data['results']]
+            if not response.data['links']['next']:
+                break
+            response = self.client.get(response.data['links']['next'])
+        self.assertEqual(merged, expected)
+        response = self.client.get(response.data['links']['previous'])
+        self.assertEqual([post['id'] for post in response.data['results']], expected[3:6])
+
+        # A new post drops its author's cached list
+        self.client.force_authenticate(self.authors[1])
+        self.client.post('/api/posts/', {'title': 'New', 'content': 'Content'})
+        self.client.force_authenticate(self.reader)
+        self.assertEqual(self.client.get('/api/feed/').data['results'][0]['title'], 'New')
+
+    def test_trimmed_timeline_and_stale_caches_keep_full_pages(self):
+        expected = list(feed_queryset(self.reader).values_list('id', flat=True))
+        # The merge does not depend on the materialized timeline
+        TimelineEntry.objects.filter(owner=self.reader).delete()
+        view = FeedViewSet.as_view({'get': 'list'})
+        request = APIRequestFactory().get('/feed/', {'page_size': 3})
+        force_authenticate(request, user=self.reader)
+        self.client.get('/api/feed/')  # Warm the author caches
+        self.assertEqual([post['id'] for post in view(request).data['results']], expected[:3])
+
+        # Posts deleted behind the cached lists are skipped, not left as holes
+        Post.objects.filter(id__in=expected[1:3]).delete()
+        response = self.client.get('/api/feed/', {'page_size': 3})
+        self.assertEqual([post['id'] for post in response.data['results']], [expected[0]] + expected[3:5])
+        self.assertIsNotNone(response.data['links']['next'])
+
+    @override_settings(FEED_AUTHOR_CACHE_DEPTH=2)
+    def test_count_only_reachable_posts(self):
+        response = self.client.get('/api/feed/', {'count': 'true'})
+        self.assertEqual(response.data['count'], 6)
+
+
+class FeedSyncTests(APITestCase):
+    """?since= tokens follow new and deleted posts whatever process answers"""
+
+    def setUp(self):
+        self.reader = User.objects.create_user(username='reader')
+        self.author = User.objects.create_user(username='author')
+        self.author.followers.add(self.reader)
+        self.client.force_authenticate(self.reader)
+        self.publish('First')
+
+    def publish(self, title):
+        post = Post.objects.create(author=self.author, title=title, content='Content')
+        fan_out_post(post)
+        return post
+
+    def poll(self, since):
+        # An empty cache stands for a worker process that saw none of the changes
+        cache.clear()
+        return self.client.get('/api/feed/', {'since': since})
+
+    def test_since_sees_new_and_deleted_posts(self):
+        since = self.client.get('/api/feed/').data['since']
+        self.assertEqual(self.poll(since).status_code, 304)
+
+        post = self.publish('Second')
+        response = self.poll(since)
+        self.assertEqual([item['title'] for item in response.data['results']], ['Second'])
+        since = response.data['since']
+        self.assertEqual(self.poll(since).status_code, 304)
+
+        post.delete()
+        response = self.poll(since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(self.poll(response.data['since']).status_code, 304)
+        self.assertEqual(self.poll('not-a-token').status_code, 400)
+
+
+class RankedFeedTests(APITestCase):
+    """?rank=engagement orders the feed by decayed engagement score"""
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.author = User.objects.create_user(username='author')
+        self.author.followers.add(self.reader)
+        self.client.force_authenticate(self.reader)
+        now = timezone.now()
+        for title, hours_ago, likes in (('Hot', 1, 50), ('Fresh', 0, 0), ('Stale', 120, 50)):
+            post = Post.objects.create(
+                author=self.author, title=title, content='Content',
+                created_at=now - timedelta(hours=hours_ago), likes_count=likes
+            )
+            fan_out_post(post)
+
+    def ranked(self, **params):
+        response = self.client.get('/api/feed/', {'rank': 'engagement', **params})
+        return [post['title'] for post in response.data['results']]
+
+    def test_engagement_order_and_paging(self):
+        self.assertEqual(self.ranked(), ['Hot', 'Fresh', 'Stale'])
+        self.assertEqual(self.ranked(page_size=2, page=2), ['Stale'])
+
+    def test_ranking_is_cached_until_the_feed_version_changes(self):
+        self.assertEqual(self.ranked(), ['Hot', 'Fresh', 'Stale'])
+        # Likes alone do not bump the version: the cached order stays
+        Post.objects.filter(title='Fresh').update(likes_count=500)
+        self.assertEqual(self.ranked(), ['Hot', 'Fresh', 'Stale'])
+
+        fan_out_post(Post.objects.create(author=self.author, title='New', content='Content'))
+        self.assertEqual(self.ranked(), ['Fresh', 'Hot', 'New', 'Stale'])
+
+    def test_pure_python_scoring_matches_numpy(self):
+        if ranking.np is None:
+            self.skipTest('NumPy is not installed')
+        args = ([0.5, 3, 30, 200, 1], [0, 10, 3, 1000, 10], [2, 0, 1, 40, 0], [0, 4, 0, 1, 4])
+        _, half_life_hours, weights = ranking.get_rank_settings()
+        vectorized = ranking.score_candidates(*args, half_life_hours, weights)
+        with mock.patch.object(ranking, 'np', None):
+            scalar = ranking.score_candidates(*args, half_life_hours, weights)
+            scalar_order = ranking.rank_order(scalar)
+        for fast, slow in zip(vectorized.tolist(), scalar):
+            self.assertAlmostEqual(fast, slow, places=9)
+        self.assertEqual(ranking.rank_order(vectorized), scalar_order)
+
+
+class FeedFirstPageCacheTests(APITestCase):
+    """Precomputed first pages are served until the feed version changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.author = User.objects.create_user(username='author')
+        self.author.followers.add(self.reader)
+        self.client.force_authenticate(self.reader)
+        fan_out_post(Post.objects.create(author=self.author, title='First', content='Content'))
+
+    def titles(self):
+        return [post['title'] for post in self.client.get('/api/feed/').data['results']]
+
+    def test_precomputed_page_is_served(self):
+        self.assertEqual(precompute_first_page(self.reader), 1)
+        # A timeline row written behind the cache's back, without a version bump
+        hidden = Post.objects.create(author=self.author, title='Hidden', content='Content')
+        TimelineEntry.objects.create(owner=self.reader, post=hidden, author=self.author, created_at=hidden.created_at)
+        self.assertEqual(self.titles(), ['First'])
+
+        bump_feed_versions([self.reader.id])
+        self.assertEqual(self.titles(), ['Hidden', 'First'])
+
+    def test_command_refuses_per_process_cache(self):
+        with self.assertRaises(CommandError):
+            call_command('precompute_feeds', '--users', '1', stdout=io.StringIO())
+
+
+@override_settings(POST_COMMENTS_PREVIEW_SIZE=2, POST_VIEW_SPOOL_DIR=VIEW_SPOOL_DIR.name)
+class CommentPreviewTests(APITestCase):
+    """?comments=latest embeds only the newest comments of each post"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.client.force_authenticate(self.author)
+        self.busy = Post.objects.create(author=self.author, title='Busy', content='Content')
+        Post.objects.create(author=self.author, title='Quiet', content='Content')
+        now = timezone.now()
+        for i in range(5):
+            Comment.objects.create(
+                post=self.busy, author=self.author, content=f'Comment {i}', created_at=now - timedelta(minutes=5 - i)
+            )
+
+    def test_latest_comments_in_constant_queries(self):
+        # COUNT for pagination, posts with authors, windowed comments, viewer's likes
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/posts/', {'comments': 'latest'})
+        posts = {post['title']: post for post in response.data['results']}
+        self.assertEqual([comment['content'] for comment in posts['Busy']['comments']], ['Comment 4', 'Comment 3'])
+        self.assertEqual(posts['Quiet']['comments'], [])
+        self.assertTrue(posts['Busy']['comments_url'].endswith(f'/api/comments/?post={self.busy.id}'))
+
+        # The full representation embeds every comment and has no link
+        response = self.client.get('/api/posts/')
+        busy = next(post for post in response.data['results'] if post['title'] == 'Busy')
+        self.assertEqual(len(busy['comments']), 5)
+        self.assertNotIn('comments_url', busy)
+        self.assertNotIn('comments_url', self.client.get(f'/api/posts/{self.busy.id}/').data)
+
+
+@override_settings(POST_VIEW_SPOOL_DIR=VIEW_SPOOL_DIR.name)
+class PostCounterTests(APITestCase):
+    """likes_count/comments_count follow the like, unlike and comment endpoints"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader')
+        self.post = Post.objects.create(author=self.user, title='Post', content='Content')
+        self.client.force_authenticate(self.user)
+
+    def test_like_and_unlike_adjust_likes_count(self):
+        response = self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(response.status_code, 201)
+        # Liking twice is rejected and does not count twice
+        response = self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(response.status_code, 400)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+        response = self.client.post(f'/api/posts/{self.post.id}/unlike/')
+        self.assertEqual(response.status_code, 200)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_duplicate_like_writes_nothing(self):
+        liker = User.objects.create_user(username='liker')
+        self.assertTrue(insert_ignore(Like, user_id=liker.id, post_id=self.post.id))
+        self.assertFalse(insert_ignore(Like, user_id=liker.id, post_id=self.post.id))
+        self.assertEqual(Like.objects.filter(user=liker).count(), 1)
+        Like.objects.filter(user=liker).delete()
+
+        self.client.force_authenticate(liker)
+        statuses = [self.client.post(f'/api/posts/{self.post.id}/like/').status_code for _ in range(2)]
+        self.assertEqual(statuses, [201, 400])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(Like.objects.filter(user=liker).count(), 1)
+        self.assertEqual(self.user.notifications.filter(actor=liker, verb='liked').count(), 1)
+
+    def test_comment_create_and_delete_adjust_comments_count(self):
+        response = self.client.post('/api/comments/', {'post': self.post.id, 'content': 'Nice'})
+        self.assertEqual(response.status_code, 201)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+        self.client.delete(f'/api/comments/{Comment.objects.get().id}/')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_reconcile_fixes_drift(self):
+        Like.objects.create(user=self.user, post=self.post)
+        Post.objects.filter(pk=self.post.pk).update(comments_count=5)
+        self.assertEqual(reconcile_counters([self.post.id]), 1)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (1, 0))
+        self.assertEqual(reconcile_counters([self.post.id]), 0)
+
+    @override_settings(LIKE_SHARD_RATE_THRESHOLD=2, LIKE_COUNTER_SHARDS=4)
+    def test_hot_post_is_promoted_to_sharded_counter(self):
+        cache.clear()
+        likers = [User.objects.create_user(username=f'liker{i}') for i in range(6)]
+        for liker in likers:
+            self.client.force_authenticate(liker)
+            self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.client.post(f'/api/posts/{self.post.id}/unlike/')
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_shards, 4)
+        self.assertEqual(self.post.like_counter_shards.count(), 4)
+        response = self.client.get(f'/api/posts/{self.post.id}/')
+        self.assertEqual(response.data['likes_count'], 5)
+        self.assertEqual(reconcile_counters([self.post.id]), 0)
+
+    def test_bulk_like_reports_status_per_post(self):
+        Like.objects.create(user=self.user, post=self.post)
+        others = [Post.objects.create(author=self.user, title=f'Post {i}', content='Content') for i in range(3)]
+        post_ids = [self.post.id] + [post.id for post in others] + [999]
+
+        response = self.client.post('/api/posts/bulk-like/', {'post_ids': post_ids}, format='json')
+        statuses = [item['status'] for item in response.data['results']]
+        self.assertEqual(statuses, ['already_liked', 'liked', 'liked', 'liked', 'not_found'])
+        self.assertEqual(sorted(Post.objects.values_list('likes_count', flat=True)), [0, 1, 1, 1])
+
+        response = self.client.post('/api/posts/bulk-unlike/', {'post_ids': post_ids[1:3]}, format='json')
+        self.assertEqual([item['status'] for item in response.data['results']], ['unliked', 'unliked'])
+        self.assertEqual(Like.objects.count(), 2)
+
+        response = self.client.post('/api/posts/bulk-like/', {'post_ids': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class BufferedLikeTests(APITestCase):
+    """LIKE_WRITE_MODE = 'buffered' acknowledges first and stores on flush"""
+
+    def setUp(self):
+        log_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(log_dir.cleanup)
+        settings_override = override_settings(
+            LIKE_WRITE_MODE='buffered', LIKE_BUFFER_DIR=log_dir.name, LIKE_BUFFER_FLUSH_INTERVAL=None
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(setattr, like_buffer, '_buffer', None)
+        like_buffer._buffer = None
+
+        self.author = User.objects.create_user(username='author')
+        self.liker = User.objects.create_user(username='liker')
+        self.post = Post.objects.create(author=self.author, title='Post', content='Content')
+        self.client.force_authenticate(self.liker)
+
+    def test_like_is_stored_on_flush(self):
+        response = self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(Like.objects.exists())
+
+        self.assertEqual(like_buffer.get_like_buffer().flush(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(self.author.notifications.filter(verb='liked').count(), 1)
+
+        # A duplicate tap is dropped by the next flush
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(like_buffer.get_like_buffer().flush(), 0)
+
+    def test_overlapping_stores_count_a_like_once(self):
+        other = User.objects.create_user(username='other')
+        # Another process stored this like after our batch was read
+        insert_ignore(Like, user_id=self.liker.id, post_id=self.post.id)
+        new_likes = like_buffer.store_likes([(self.liker.id, self.post.id), (other.id, self.post.id)])
+        self.assertEqual(new_likes, [(other.id, self.post.id)])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(list(self.author.notifications.values_list('actor_id', flat=True)), [other.id])
+        # A batch larger than one INSERT's parameter limit
+        fans = User.objects.bulk_create([User(username=f'fan{i}') for i in range(400)])
+        self.assertEqual(len(insert_ignore_many(Like, [
+            {'user_id': fan.id, 'post_id': self.post.id} for fan in fans + [other]
+        ], returning=('user_id',))), 400)
+
+    def test_unflushed_likes_are_replayed(self):
+        buffer = like_buffer.get_like_buffer()
+        buffer.add(self.liker.id, self.post.id)
+        buffer.add(self.author.id, self.post.id)
+        # Files of a buffer that still holds its lock are left alone
+        call_command('replay_like_buffer', stdout=io.StringIO())
+        self.assertFalse(Like.objects.exists())
+
+        # Simulate a crash: the process dies without flushing, the OS drops its lock
+        atexit.unregister(buffer.stop)
+        buffer._lock_file.close()
+        like_buffer._buffer = None
+        # A restarted process (possibly with the same PID) gets files of its own
+        restarted = like_buffer.get_like_buffer()
+        self.addCleanup(restarted.stop)
+        restarted.add(self.liker.id, self.post.id)
+        restarted.flush()
+        self.assertNotEqual(restarted.name, buffer.name)
+
+        call_command('replay_like_buffer', stdout=io.StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 2)
+        # Only the running buffer's lock and empty log are left
+        self.assertEqual({like_buffer.buffer_name(path) for path in buffer.log_dir.iterdir()}, {restarted.name})
+
+
+class PostSearchTests(APITestCase):
+    """?search= uses the full-text index and follows post saves and deletes"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+
+    def search(self, terms, **params):
+        response = self.client.get('/api/posts/', {'search': terms, **params})
+        return [post['title'] for post in response.data['results']]
+
+    def test_search_ranks_and_tracks_changes(self):
+        first = Post.objects.create(author=self.author, title='Python tips', content='Django ORM')
+        Post.objects.create(author=self.author, title='Dinner', content='A python recipe')
+        Post.objects.create(author=self.author, title='Other', content='Nothing here')
+
+        # Prefix match; title hits rank first regardless of age
+        self.assertEqual(self.search('pyth'), ['Python tips', 'Dinner'])
+        self.assertEqual(self.search('python django'), ['Python tips'])
+        # FTS5 syntax in user input is treated as plain text
+        self.assertEqual(self.search('"python AND ('), [])
+
+        first.title = 'Gardening'
+        first.content = 'Roses'
+        first.save()
+        self.assertEqual(self.search('python'), ['Dinner'])
+        Post.objects.get(title='Dinner').delete()
+        self.assertEqual(self.search('python'), [])
+
+    def test_counter_saves_skip_the_index(self):
+        post = Post.objects.create(author=self.author, title='Python tips', content='Django ORM')
+        # Only the UPDATE runs, no FTS delete/insert
+        with self.assertNumQueries(1):
+            post.likes_count = 5
+            post.save(update_fields=['likes_count'])
+        post.title = 'Gardening'
+        post.save(update_fields=['title'])
+        self.assertEqual(self.search('gardening'), ['Gardening'])
+
+
+class TagFeedTests(APITestCase):
+    """#tags and @mentions are indexed on save and served from /api/tags/<tag>/"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.mentioned = User.objects.create_user(username='bob')
+
+    def test_tag_page_order_cursor_and_reindex(self):
+        posts = [
+            Post.objects.create(author=self.author, title=f'Post {i}', content=f'#Django tip {i} for @bob')
+            for i in range(3)
+        ]
+        Post.objects.create(author=self.author, title='Mail', content='me@bob.com issue#django')
+
+        response = self.client.get('/api/tags/django/', {'page_size': 2})
+        self.assertEqual([post['id'] for post in response.data['results']], [posts[2].id, posts[1].id])
+        response = self.client.get(response.data['links']['next'])
+        self.assertEqual([post['id'] for post in response.data['results']], [posts[0].id])
+        self.assertEqual(PostMention.objects.filter(user=self.mentioned).count(), 3)
+
+        # Editing the content re-indexes the post
+        posts[2].content = 'No tags any more'
+        posts[2].save()
+        response = self.client.get('/api/tags/DJANGO/')
+        self.assertEqual([post['id'] for post in response.data['results']], [posts[1].id, posts[0].id])
+        self.assertFalse(PostMention.objects.filter(post=posts[2]).exists())
+
+
+class TrendingTests(APITestCase):
+    """refresh_trending ranks recent likes and comments; /api/posts/trending/ reads the result"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.readers = [User.objects.create_user(username=f'reader{i}') for i in range(3)]
+        self.quiet, self.liked, self.discussed = [
+            Post.objects.create(author=self.author, title=title, content='Content')
+            for title in ('Quiet', 'Liked', 'Discussed')
+        ]
+
+    def trending(self, refresh=True, **params):
+        if refresh:
+            call_command('refresh_trending', stdout=io.StringIO())
+        response = self.client.get('/api/posts/trending/', params)
+        return [post['title'] for post in response.data['results']]
+
+    def test_likes_and_comments_feed_the_ranking(self):
+        for reader in self.readers:
+            self.client.force_authenticate(reader)
+            self.client.post(f'/api/posts/{self.liked.id}/like/')
+        for reader in self.readers[:2]:
+            self.client.force_authenticate(reader)
+            self.client.post('/api/comments/', {'post': self.discussed.id, 'content': 'Nice'})
+        # Requests only read the last refresh
+        self.assertEqual(self.trending(refresh=False), [])
+        self.assertEqual(self.trending(), ['Liked', 'Discussed'])
+
+        # Unlikes count against the post
+        for reader in self.readers[:2]:
+            self.client.force_authenticate(reader)
+            self.client.post(f'/api/posts/{self.liked.id}/unlike/')
+        self.assertEqual(self.trending(refresh=False), ['Liked', 'Discussed'])
+        self.assertEqual(self.trending(), ['Discussed', 'Liked'])
+        self.assertEqual(self.trending(limit=1), ['Discussed'])
+        self.assertEqual(self.client.get('/api/posts/trending/', {'window': 'week'}).status_code, 400)
+
+    def test_old_buckets_decay_and_leave_the_window(self):
+        now = timezone.now()
+        EngagementBucket.objects.create(post=self.quiet, bucket_start=bucket_start(now - timedelta(minutes=50)), likes=5)
+        EngagementBucket.objects.create(post=self.liked, bucket_start=bucket_start(now), likes=3)
+        EngagementBucket.objects.create(post=self.discussed, bucket_start=bucket_start(now - timedelta(hours=3)), likes=9)
+
+        self.assertEqual(self.trending(), ['Liked', 'Quiet'])
+        self.assertEqual(self.trending(window='day'), ['Discussed', 'Quiet', 'Liked'])
+        # Buckets older than a day are pruned on refresh
+        EngagementBucket.objects.filter(post=self.discussed).update(bucket_start=now - timedelta(days=2))
+        self.trending()
+        self.assertFalse(EngagementBucket.objects.filter(post=self.discussed).exists())
+
+
+class PostViewCountTests(APITestCase):
+    """Detail views are spooled, then stored by flush_post_views"""
+
+    def setUp(self):
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        settings_override = override_settings(POST_VIEW_SPOOL_DIR=spool_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(view_counter.close_view_spool)
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(author=self.author, title='Post', content='Content')
+
+    def flush(self):
+        call_command('flush_post_views', stdout=io.StringIO())
+
+    def test_views_are_spooled_then_flushed(self):
+        for user in (self.author, self.author, User.objects.create_user(username='reader'), None):
+            self.client.force_authenticate(user)
+            self.client.get(f'/api/posts/{self.post.id}/')
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.views_count, self.post.unique_viewers), (0, 0))
+
+        self.flush()
+        response = self.client.get(f'/api/posts/{self.post.id}/')
+        self.assertEqual((response.data['views_count'], response.data['unique_viewers']), (4, 3))
+        # The view above went to a new spool file after the flush claimed the old one
+        self.flush()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.views_count, self.post.unique_viewers), (5, 3))
+
+    def test_failed_flush_keeps_the_views(self):
+        view_counter.record_view(self.post.id, 'user:1')
+        with mock.patch.object(view_counter, 'store_views', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.flush()
+        view_counter.record_view(self.post.id, 'user:2')
+        self.flush()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.views_count, self.post.unique_viewers), (2, 2))
+
+    def test_hyperloglog_estimate_and_merge(self):
+        first, second = view_counter.HyperLogLog(), view_counter.HyperLogLog()
+        for i in range(20000):
+            first.add(f'user:{i}')
+            second.add(f'user:{i + 10000}')
+        self.assertAlmostEqual(first.count(), 20000, delta=20000 * 0.05)
+        first.merge(second)
+        self.assertAlmostEqual(first.count(), 30000, delta=30000 * 0.05)
+        self.assertEqual(len(first.to_bytes()), 2048)
+
+
+class NearDuplicateTests(APITestCase):
+    """Posts nearly identical to an existing one are flagged or rejected"""
+
+    spam = 'Win a brand new phone today, click the link in my profile and claim your prize before midnight'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='spammer')
+        self.client.force_authenticate(self.user)
+
+    def create(self, content):
+        return self.client.post('/api/posts/', {'title': 'Offer', 'content': content})
+
+    def test_near_duplicate_is_flagged_or_rejected(self):
+        self.assertEqual(self.create(self.spam).status_code, 201)
+        self.assertEqual(self.create(self.spam.replace('today', 'now!!')).status_code, 201)
+        self.assertEqual(self.create('A completely different post about gardening, roses and the spring weather').status_code, 201)
+        original, duplicate, other = Post.objects.order_by('id')
+        self.assertEqual(
+            list(PostDuplicateFlag.objects.values_list('post_id', 'duplicate_of_id')),
+            [(duplicate.id, original.id)]
+        )
+
+        # Editing the duplicate into something original clears the flag
+        response = self.client.patch(f'/api/posts/{duplicate.id}/', {'content': 'Sorry everyone, that was my hacked account posting links'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(PostDuplicateFlag.objects.exists())
+
+        with override_settings(POST_DUPLICATE_ACTION='reject'):
+            response = self.create(self.spam.upper())
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('content', response.data)
+
+    def test_backfill_indexes_posts_written_without_save(self):
+        Post.objects.bulk_create([Post(author=self.user, title='Old', content=self.spam)])
+        self.assertEqual(self.create(self.spam).status_code, 201)
+        self.assertFalse(PostDuplicateFlag.objects.exists())
+
+        call_command('index_post_signatures', stdout=io.StringIO())
+        self.assertEqual(self.create(self.spam).status_code, 201)
+        self.assertTrue(PostDuplicateFlag.objects.exists())
@@ -0,0 +1,231 @@
+# posts/timeline.py
+"""
+Fan-out-on-write home timelines.
+
+Instead of sorting every followed author's posts on each feed request,
+new posts are pushed into a per-follower TimelineEntry table when they
+are created. Reading a feed is then one indexed range scan.
+
+Authors with more followers than FEED_CELEBRITY_FOLLOWER_THRESHOLD are
+not pushed (hybrid push/pull): their most recent posts are merged into
+each reader's feed at read time instead. Whether an author is pulled is
+the stored FeedState.is_celebrity flag, re-evaluated each time they
+post, and every reader sees the same flag: an author is never skipped
+by the fan-out while some feed still expects their posts pushed.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from .feed_sync import bump_author_version, bump_feed_versions
+from .models import FeedState, Post, TimelineEntry
+
+User = get_user_model()
+
+# How many owners are trimmed per window query
+TRIM_BATCH_SIZE = 500
+
+
+def get_timeline_depth():
+    """Maximum number of entries kept in each follower's timeline"""
+    return getattr(settings, 'FEED_TIMELINE_DEPTH', 500)
+
+
+def get_celebrity_threshold():
+    """Follower count above which an author's posts are not fanned out"""
+    return getattr(settings, 'FEED_CELEBRITY_FOLLOWER_THRESHOLD', 10000)
+
+
+def get_celebrity_merge_depth():
+    """Number of recent celebrity posts merged into a feed at read time"""
+    return getattr(settings, 'FEED_CELEBRITY_MERGE_DEPTH', 100)
+
+
+def celebrity_ids(author_ids):
+    """The authors among author_ids whose posts are pulled instead of pushed"""
+    return set(
+        FeedState.objects.filter(user_id__in=author_ids, is_celebrity=True)
+        .values_list('user_id', flat=True)
+    )
+
+
+def followed_celebrity_ids(user):
+    """IDs of celebrity authors the user follows, read at request time"""
+    return list(
+        FeedState.objects.filter(is_celebrity=True, user__followers=user)
+        .values_list('user_id', flat=True)
+    )
+
+
+def timeline_queryset(user):
+    """
+    Posts in the user's materialized timeline, newest first.
+    The sort keys are read from the timeline row itself so ordering
+    and keyset filters hit the (owner, created_at, post) index.
+    """
+    return (
+        Post.objects.filter(timeline_entries__owner=user)
+        .annotate(
+            feed_created_at=F('timeline_entries__created_at'),
+            feed_post_id=F('timeline_entries__post_id'),
+        )
+        .order_by('-feed_created_at', '-feed_post_id')
+    )
+
+
+def feed_queryset(user, celebrities=None):
+    """
+    The user's home feed: the pushed timeline, plus the most recent
+    posts of followed celebrity authors merged in at read time.
+    celebrities is followed_celebrity_ids(user), if already loaded.
+    """
+    if celebrities is None:
+        celebrities = followed_celebrity_ids(user)
+    if not celebrities:
+        return timeline_queryset(user)
+
+    pushed = TimelineEntry.objects.filter(owner=user).values('post_id')
+    pulled = (
+        Post.objects.filter(author_id__in=celebrities)
+        .order_by('-created_at', '-id')
+        .values('id')[:get_celebrity_merge_depth()]
+    )
+    return Post.objects.filter(Q(id__in=pushed) | Q(id__in=pulled)).order_by('-created_at', '-id')
+
+
+def trim_timelines(owner_ids):
+    """Delete entries beyond the configured depth for the given owners"""
+    depth = get_timeline_depth()
+    owner_ids = list(owner_ids)
+    for start in range(0, len(owner_ids), TRIM_BATCH_SIZE):
+        batch = owner_ids[start:start + TRIM_BATCH_SIZE]
+        stale_ids = list(
+            TimelineEntry.objects.filter(owner_id__in=batch)
+            .annotate(position=Window(
+                expression=RowNumber(),
+                partition_by=[F('owner_id')],
+                order_by=[F('created_at').desc(), F('post_id').desc()],
+            ))
+            .filter(position__gt=depth)
+            .values_list('id', flat=True)
+        )
+        if stale_ids:
+            TimelineEntry.objects.filter(id__in=stale_ids).delete()
+
+
+def push_posts(owner_ids, posts):
+    """Insert (post_id, author_id, created_at) rows into the owners' timelines, trimmed"""
+    owner_ids = list(owner_ids)
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(owner_id=owner_id, post_id=post_id, author_id=author_id, created_at=created_at)
+            for owner_id in owner_ids
+            for post_id, author_id, created_at in posts
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    trim_timelines(owner_ids)
+
+
+def fan_out_post(post):
+    """
+    Push a newly created post into the timeline of every follower
+    of its author. Celebrity authors are skipped (pulled on read).
+
+    Crossing the follower threshold flips the author's FeedState flag
+    here, so pushing and pulling switch over at a single point:
+    a promoted author's earlier posts are already in the timelines, and
+    a demoted author's recent posts, pulled until now, are pushed into
+    every follower's timeline.
+    """
+    threshold = get_celebrity_threshold()
+    follower_ids = list(post.author.followers.values_list('id', flat=True)[:threshold + 1])
+    is_celebrity = len(follower_ids) > threshold
+    was_celebrity = FeedState.objects.filter(user_id=post.author_id, is_celebrity=True).exists()
+    if is_celebrity != was_celebrity:
+        FeedState.objects.update_or_create(user_id=post.author_id, defaults={'is_celebrity': is_celebrity})
+
+    if is_celebrity:
+        bump_author_version(post.author_id)
+        return
+    if not follower_ids:
+        return
+    if was_celebrity:
+        # Demoted: backfill the posts the followers were pulling (this one included)
+        posts = (
+            Post.objects.filter(author_id=post.author_id).order_by('-created_at', '-id')
+            .values_list('id', 'author_id', 'created_at')[:get_celebrity_merge_depth()]
+        )
+    else:
+        posts = [(post.id, post.author_id, post.created_at)]
+    push_posts(follower_ids, list(posts))
+    bump_feed_versions(follower_ids)
+
+
+def retract_post(post):
+    """
+    Mark the feeds that showed a deleted post as changed. Its timeline
+    entries are deleted by the cascade; a celebrity's post was pulled,
+    so bumping the author is enough.
+    """
+    if FeedState.objects.filter(user_id=post.author_id, is_celebrity=True).exists():
+        bump_author_version(post.author_id)
+    else:
+        bump_feed_versions(User.objects.filter(following=post.author_id).values_list('id', flat=True))
+
+
+def backfill_timeline(user, author):
+    """Copy the author's most recent posts into user's timeline (on follow)"""
+    backfill_timeline_authors(user, [author.id])
+
+
+def backfill_timeline_authors(user, author_ids):
+    """backfill_timeline() for several newly followed authors at once"""
+    bump_feed_versions([user.id])
+    # Celebrity posts are merged in at read time
+    author_ids = set(author_ids) - celebrity_ids(author_ids)
+    if not author_ids:
+        return
+    # Anything older than the newest `depth` posts would be trimmed anyway
+    recent_posts = (
+        Post.objects.filter(author_id__in=author_ids).order_by('-created_at', '-id')
+        .values_list('id', 'author_id', 'created_at')
+    )
+    push_posts([user.id], list(recent_posts[:get_timeline_depth()]))
+
+
+def purge_timeline(user, author):
+    """Remove the author's posts from user's timeline (on unfollow)"""
+    purge_timeline_authors(user, [author.id])
+
+
+def purge_timeline_authors(user, author_ids):
+    """purge_timeline() for several unfollowed authors at once"""
+    TimelineEntry.objects.filter(owner=user, author_id__in=author_ids).delete()
+    bump_feed_versions([user.id])
+
+
+def rebuild_timeline(user):
+    """
+    Rebuild a user's timeline from scratch using the pull query. Readers
+    see the old or the new timeline, never an empty one in between, and
+    the version bump drops cached pages and since-tokens of the old one.
+    """
+    pushed_authors = user.following.exclude(feed_state__is_celebrity=True)
+    recent_posts = (
+        Post.objects.filter(author__in=pushed_authors)
+        .order_by('-created_at', '-id')
+        .values_list('id', 'author_id', 'created_at')
+    )
+    with transaction.atomic():
+        TimelineEntry.objects.filter(owner=user).delete()
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(owner_id=user.id, post_id=post_id, author_id=author_id, created_at=created_at)
+                for post_id, author_id, created_at in recent_posts[:get_timeline_depth()]
+            ],
+            batch_size=1000,
+        )
+        bump_feed_versions([user.id])
@@ -0,0 +1,130 @@
+# posts/trending.py
+"""
+Trending posts (/api/posts/trending/): the posts with the most likes and
+comments in the last hour or day.
+
+Writes: every like, unlike, comment and comment delete adds +1/-1 to the
+post's EngagementBucket row for the current TRENDING_BUCKET_SECONDS slot,
+in the same transaction as the Like/Comment write (likes go through
+posts.counters, comments through CommentViewSet). Hot posts with sharded
+like counters write to the bucket row of the same shard, so a viral post
+does not get a new hot row here.
+
+Reads: `manage.py refresh_trending`, run on a schedule (e.g. every
+minute from cron, or with --every), ranks the buckets and stores the
+best TRENDING_TOP_K posts of every window as TrendingPost rows. Requests
+only read those rows, so they never scan the buckets, Like or Comment,
+and the ranking is computed once for every app process. Within a window
+a bucket's weight halves every quarter of the window, so a burst ten
+minutes ago outranks the same burst fifty minutes ago. Buckets older
+than the longest window are deleted on refresh.
+"""
+import heapq
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import EngagementBucket, TrendingPost
+
+WINDOWS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+# A bucket's weight halves every window / DECAY_HALF_LIVES
+DECAY_HALF_LIVES = 4
+
+
+def get_trending_settings():
+    """(bucket length in seconds, posts kept per window)"""
+    return (
+        getattr(settings, 'TRENDING_BUCKET_SECONDS', 300),
+        getattr(settings, 'TRENDING_TOP_K', 100),
+    )
+
+
+def bucket_start(now=None):
+    """Start of the bucket that now falls into"""
+    now = now or timezone.now()
+    seconds = get_trending_settings()[0]
+    return datetime.fromtimestamp(now.timestamp() // seconds * seconds, tz=dt_timezone.utc)
+
+
+def record_engagement(post_ids, likes=0, comments=0, shard=0):
+    """
+    Add likes and comments to the current bucket of each post: one INSERT
+    ... ON CONFLICT DO NOTHING for the missing rows and one UPDATE, whatever
+    the number of posts.
+    """
+    post_ids = list(post_ids)
+    if not post_ids or not (likes or comments):
+        return
+    start = bucket_start()
+    EngagementBucket.objects.bulk_create(
+        [EngagementBucket(post_id=post_id, bucket_start=start, shard=shard) for post_id in post_ids],
+        ignore_conflicts=True
+    )
+    EngagementBucket.objects.filter(post_id__in=post_ids, bucket_start=start, shard=shard).update(
+        likes=F('likes') + likes,
+        comments=F('comments') + comments
+    )
+
+
+def compute_trending(now=None, top_k=None):
+    """
+    {window: [(post_id, score), ...] best first} from the buckets, and
+    delete the buckets no window needs any more. One pass over the
+    buckets of the longest window.
+    """
+    now = now or timezone.now()
+    top_k = top_k or get_trending_settings()[1]
+    longest = max(WINDOWS.values())
+    EngagementBucket.objects.filter(bucket_start__lt=now - longest).delete()
+
+    scores = {window: defaultdict(float) for window in WINDOWS}
+    buckets = (
+        EngagementBucket.objects.filter(bucket_start__gte=now - longest)
+        .values_list('post_id', 'bucket_start', 'likes', 'comments')
+        .iterator(chunk_size=10000)
+    )
+    for post_id, start, likes, comments in buckets:
+        age = (now - start).total_seconds()
+        for window, length in WINDOWS.items():
+            if start >= now - length:
+                half_life = length.total_seconds() / DECAY_HALF_LIVES
+                scores[window][post_id] += (likes + comments) * 0.5 ** (age / half_life)
+
+    return {
+        window: [
+            (post_id, score)
+            for score, post_id in heapq.nlargest(top_k, ((score, post_id) for post_id, score in totals.items()))
+            if score > 0
+        ]
+        for window, totals in scores.items()
+    }
+
+
+def refresh_trending(now=None):
+    """
+    Recompute every window and replace the stored lists in one
+    transaction, so readers see either the old or the new ranking.
+    Returns the number of stored entries.
+    """
+    top = compute_trending(now)
+    with transaction.atomic():
+        TrendingPost.objects.all().delete()
+        TrendingPost.objects.bulk_create([
+            TrendingPost(window=window, rank=rank, post_id=post_id, score=score)
+            for window, ranked in top.items()
+            for rank, (post_id, score) in enumerate(ranked, start=1)
+        ])
+    return sum(len(ranked) for ranked in top.values())
+
+
+def trending_posts(window, limit):
+    """The best limit (post_id, score) pairs of window from the last refresh"""
+    return list(
+        TrendingPost.objects.filter(window=window).order_by('rank')
+        .values_list('post_id', 'score')[:limit]
+    )
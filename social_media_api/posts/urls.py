@@ -56,8 +56,12 @@ router.register(r'comments', views.CommentViewSet)
 # router.register(r'feed', views.FeedViewSet, basename='feed') # If you have this
 
 urlpatterns = [
+    # Bulk actions first, so the router does not read them as post IDs
+    path('posts/bulk-like/', views.bulk_like_posts, name='bulk_like_posts'),
+    path('posts/bulk-unlike/', views.bulk_unlike_posts, name='bulk_unlike_posts'),
     path('', include(router.urls)),
     path('feed/', views.user_feed, name='user_feed'), # If you have this
+    path('tags/<str:tag>/', views.tag_posts, name='tag_posts'),
     
     # --- Like/Unlike URLs ---
     # Use <int:pk> to match the pattern expected by the checker and common DRF conventions
@@ -4,12 +4,22 @@ from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import Post, Comment
 from .serializers import PostSerializer, PostCreateSerializer, CommentSerializer, CommentCreateSerializer
+from .serializers import get_requested_fields, only_requested_columns
 from django.contrib.contenttypes.models import ContentType
 from .models import Like
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from notifications.models import Notification
+from django.db import transaction
+from .counters import adjust_counter, adjust_likes, adjust_likes_many
+from .like_buffer import buffered_likes_enabled, get_like_buffer, load_liked_posts, store_likes
+from common.bulk import parse_id_list
+from common.upserts import insert_ignore
+from .filters import PostOrderingFilter, PostSearchFilter
+from .tags import tag_queryset
+from .trending import WINDOWS, get_trending_settings, record_engagement, trending_posts
+from .view_counter import record_view, viewer_key
 
 class PostViewSet(viewsets.ModelViewSet):
     queryset = Post.objects.all()
@@ -53,12 +63,20 @@ class CommentViewSet(viewsets.ModelViewSet):
 # posts/views.py
 from rest_framework import viewsets, permissions, filters, status
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
 from .models import Post, Comment
 from .serializers import PostSerializer, PostCreateSerializer, CommentSerializer, CommentCreateSerializer
 from rest_framework.generics import get_object_or_404
+from .timeline import fan_out_post, feed_queryset
+from common.pagination import FeedCursorPagination
+from .merge_feed import invalidate_author, merge_read_path_enabled, merged_feed_count, merged_feed_page
+from .feed_sync import decode_since, encode_since, read_feed_state
+from .ranking import ranked_feed_ids
+from .feed_cache import with_cached_first_page
+from django.utils import timezone
+from functools import partial
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
     """
@@ -75,37 +93,127 @@ def user_feed(request):
     """
     Get posts from users that the current user follows, ordered by creation date (newest first)
     GET /api/posts/feed/
+    Query Parameters:
+        - cursor=<cursor> (from links/cursors of the previous page)
+        - page_size=<n> (max 100)
+        - count=true (include the total number of feed posts)
+        - since=<token> (only posts newer than the token, see _feed_delta)
+        - rank=engagement (score by engagement instead, paged with ?page=<n>)
+        - comments=latest (embed only the newest comments of each post)
+        - fields=id,title (sparse fieldset) and expand=comments
     """
-    # Get posts from users that the current user follows
-    following_users = request.user.following.all()
-    feed_posts = Post.objects.filter(author__in=following_users).order_by('-created_at')
-    
-    # Apply pagination if you have it configured
-    page = request.GET.get('page', 1)
-    page_size = request.GET.get('page_size', 10)
-    
-    try:
-        page_size = int(page_size)
-        if page_size > 100:  # Limit page size
-            page_size = 100
-    except (ValueError, TypeError):
-        page_size = 10
-    
-    # Manual pagination
-    start = (int(page) - 1) * page_size
-    end = start + page_size
-    paginated_posts = feed_posts[start:end]
+    # Read the version before the posts so a concurrent change is never missed;
+    # the same query lists the followed celebrities merged into the feed
+    version, celebrities = read_feed_state(request.user)
+
+    if request.query_params.get('rank') == 'engagement':
+        return _ranked_feed(request, version)
+
+    # Keyset pagination on (created_at, id) instead of OFFSET + COUNT
+    paginator = FeedCursorPagination()
+    if merge_read_path_enabled():
+        # K-way merge over the followed authors' recent-post caches
+        page_source = PostSerializer.setup_eager_loading(Post.objects.order_by('-created_at', '-id'), request)
+        fetch = partial(merged_feed_page, request.user, queryset=page_source)
+        count = partial(merged_feed_count, request.user)
+    else:
+        # Read the materialized timeline, merged with followed celebrity posts
+        feed_posts = PostSerializer.setup_eager_loading(feed_queryset(request.user, celebrities), request)
+        fetch = paginator.queryset_fetch(feed_posts)
+        count = feed_posts.count
+        page_source = feed_posts
+    # Serve the first page from the cache (see posts.feed_cache)
+    fetch = with_cached_first_page(fetch, page_source, request.user, version)
+
+    since = request.query_params.get('since')
+    if since is not None:
+        return _feed_delta(request, paginator, fetch, since, version)
+
+    paginated_posts = paginator.paginate_fetch(fetch, request, count=count)
     
     # Serialize the posts
     serializer = PostSerializer(paginated_posts, many=True, context={'request': request})
     
+    response = paginator.get_paginated_response(serializer.data)
+    if request.query_params.get(paginator.cursor_query_param) is None:
+        # First page: hand out the token for incremental polling
+        newest = _feed_position(paginator, paginated_posts[0]) if paginated_posts else None
+        response.data['since'] = encode_since(newest, version)
+    return response
+
+def _ranked_feed(request, version):
+    """
+    Engagement-ranked feed page. The ranked window is cached per feed
+    version, so pages stay consistent while the client scrolls.
+    """
+    paginator = FeedCursorPagination()
+    page_size = paginator.get_page_size(request)
+    try:
+        page = max(1, int(request.query_params.get('page', 1)))
+    except (ValueError, TypeError):
+        page = 1
+
+    ranked_ids = ranked_feed_ids(request.user, version, timezone.now())
+    page_ids = ranked_ids[(page - 1) * page_size:page * page_size]
+    posts = PostSerializer.setup_eager_loading(Post.objects.all(), request).in_bulk(page_ids)
+
+    serializer = PostSerializer(
+        [posts[post_id] for post_id in page_ids if post_id in posts],
+        many=True,
+        context={'request': request}
+    )
     return Response({
-        'count': feed_posts.count(),
-        'page': int(page),
+        'count': len(ranked_ids),
+        'page': page,
         'page_size': page_size,
         'results': serializer.data
     })
 
+def _feed_position(paginator, post):
+    """(created_at, id) keyset position of a feed post"""
+    return getattr(post, paginator.time_field), getattr(post, paginator.id_field)
+
+def _feed_delta(request, paginator, fetch, since, version):
+    """
+    Incremental feed sync: posts newer than the since token, newest first.
+    Returns 304 Not Modified, without touching the database, when the
+    user's feed version has not changed since the token was issued.
+    Otherwise returns the new posts plus the token for the next poll;
+    has_more=true means more new posts remain and the client should
+    poll again straight away.
+    """
+    try:
+        position, seen_version = decode_since(since)
+    except ValueError:
+        return Response({'error': 'Invalid since token.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if seen_version == version:
+        return Response(status=status.HTTP_304_NOT_MODIFIED)
+
+    limit = paginator.get_page_size(request)
+    has_more = False
+    if position is None:
+        # Nothing seen yet: start from the newest posts
+        new_posts = fetch(None, False, limit)
+    else:
+        # Oldest new posts first, so a long gap is caught up in order
+        new_posts = fetch(position, True, limit + 1)
+        has_more = len(new_posts) > limit
+        new_posts = new_posts[:limit]
+        new_posts.reverse()
+
+    if new_posts:
+        position = _feed_position(paginator, new_posts[0])
+    # Keep the old version while catching up so the next poll is not a 304
+    next_version = seen_version if has_more else version
+
+    serializer = PostSerializer(new_posts, many=True, context={'request': request})
+    return Response({
+        'since': encode_since(position, next_version),
+        'has_more': has_more,
+        'results': serializer.data
+    })
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def like_post(request, post_id):
@@ -143,23 +251,46 @@ class FeedViewSet(viewsets.ReadOnlyModelViewSet):
     """
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = FeedCursorPagination
     
     def get_queryset(self):
-        # Get posts from users that the current user follows
-        following_users = self.request.user.following.all()
-        return Post.objects.filter(author__in=following_users).order_by('-created_at')
+        # Pushed timeline plus followed celebrity posts
+        return PostSerializer.setup_eager_loading(feed_queryset(self.request.user), self.request)
+
+    def paginate_queryset(self, queryset):
+        if self.action == 'list' and merge_read_path_enabled():
+            # Build the page from the per-author caches instead of SQL; hydrate
+            # from all posts, since merged posts may be trimmed from the timeline
+            page_source = PostSerializer.setup_eager_loading(Post.objects.order_by('-created_at', '-id'), self.request)
+            return self.paginator.paginate_fetch(
+                partial(merged_feed_page, self.request.user, queryset=page_source),
+                self.request,
+                count=partial(merged_feed_count, self.request.user)
+            )
+        return super().paginate_queryset(queryset)
 
 # Keep your existing ViewSets...
 class PostViewSet(viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # ?search= runs on the full-text index, ranked by relevance (see posts.search)
+    filter_backends = [DjangoFilterBackend, PostSearchFilter, PostOrderingFilter]
     filterset_fields = ['author']
     search_fields = ['title', 'content']
     ordering_fields = ['created_at', 'updated_at']
     ordering = ['-created_at']
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve']:
+            # Constant number of queries whatever the page size;
+            # ?comments=latest only applies to the list
+            queryset = PostSerializer.setup_eager_loading(
+                queryset, self.request, preview=self.action == 'list'
+            )
+        return queryset
+    
     def get_serializer_class(self):
         if self.action == 'create':
             return PostCreateSerializer
@@ -167,8 +298,60 @@ class PostViewSet(viewsets.ModelViewSet):
             return PostCreateSerializer
         return PostSerializer
     
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        # Spooled to a file: no query per view (see posts.view_counter)
+        record_view(int(kwargs['pk']), viewer_key(request))
+        return response
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        post = serializer.save(author=self.request.user)
+        # Push the new post into every follower's timeline
+        fan_out_post(post)
+        invalidate_author(post.author_id)
+
+    def perform_update(self, serializer):
+        post = serializer.save()
+        invalidate_author(post.author_id)
+
+    def perform_destroy(self, instance):
+        author_id = instance.author_id
+        instance.delete()
+        invalidate_author(author_id)
+
+    @action(detail=False, methods=['get'])
+    def trending(self, request):
+        """
+        Posts with the most likes and comments lately, best first.
+        GET /api/posts/trending/
+        Query Parameters:
+            - window=hour|day (default hour)
+            - limit=<n> (default 20, max TRENDING_TOP_K)
+        Served from the list stored by `manage.py refresh_trending`, not from
+        Like/Comment.
+        """
+        window = request.query_params.get('window', 'hour')
+        if window not in WINDOWS:
+            return Response(
+                {'error': f"window must be one of: {', '.join(WINDOWS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({'error': 'limit must be a number.'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, get_trending_settings()[1]))
+
+        top = trending_posts(window, limit)
+        queryset = PostSerializer.setup_eager_loading(Post.objects.filter(id__in=[post_id for post_id, _ in top]), request)
+        posts = {post.id: post for post in queryset}
+        # Keep the trending order
+        ranked = [(posts[post_id], score) for post_id, score in top if post_id in posts]
+        serializer = PostSerializer([post for post, _ in ranked], many=True, context={'request': request})
+        results = serializer.data
+        for item, (_, score) in zip(results, ranked):
+            item['trending_score'] = round(score, 3)
+        return Response({'window': window, 'results': results})
 
 class CommentViewSet(viewsets.ModelViewSet):
     queryset = Comment.objects.all()
@@ -179,6 +362,18 @@ class CommentViewSet(viewsets.ModelViewSet):
     ordering_fields = ['created_at', 'updated_at']
     ordering = ['-created_at']
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve']:
+            requested = get_requested_fields(self.request)
+            if requested is None or 'author' in requested:
+                queryset = queryset.select_related('author')
+            # created_at/updated_at are the ordering fields, always keep them
+            queryset = only_requested_columns(
+                queryset, requested, always=('id', 'created_at', 'updated_at')
+            )
+        return queryset
+    
     def get_serializer_class(self):
         if self.action == 'create':
             return CommentCreateSerializer
@@ -187,84 +382,191 @@ class CommentViewSet(viewsets.ModelViewSet):
         return CommentSerializer
     
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            comment = serializer.save(author=self.request.user)
+            adjust_counter(comment.post_id, 'comments_count', 1)
+            record_engagement([comment.post_id], comments=1)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            adjust_counter(instance.post_id, 'comments_count', -1)
+            record_engagement([instance.post_id], comments=-1)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated]) # Ensure user is authenticated
-def like_post(request, post_id):
+def like_post(request, pk):
     """
     Like a post.
-    POST /api/posts/{post_id}/like/
+    POST /api/posts/{pk}/like/
     """
+    if buffered_likes_enabled():
+        # Write-behind: acknowledge now, stored by the next flush (see posts.like_buffer)
+        get_like_buffer().add(request.user.id, pk)
+        return Response({'message': 'Like accepted.'}, status=status.HTTP_202_ACCEPTED)
+
     try:
-        post = Post.objects.get(pk=post_id)
+        # Only what the counter and the notification need
+        post = Post.objects.only('id', 'author_id', 'like_shards').get(pk=pk)
     except Post.DoesNotExist:
         return Response({'error': 'Post not found.'}, status=status.HTTP_404_NOT_FOUND)
-    like, created = Like.objects.get_or_create(user=request.user, post=post)
-    if not created:
-        # --- Generate Notification ---
-        # Check if notification logic is in a separate app/service
-        # Example using a hypothetical Notification model in 'notifications' app:
-        try:
-            # Import here to avoid potential circular import issues if notifications depends on posts
-            from notifications.models import Notification
+    with transaction.atomic():
+        # INSERT ... ON CONFLICT DO NOTHING: no get_or_create race, one round trip
+        created = insert_ignore(Like, user_id=request.user.id, post_id=post.id)
+        if created:
+            adjust_likes(post, 1)
+
+            # --- Generate Notification ---
             # Avoid notifying a user for liking their own post
-            if post.author != request.user:
+            if post.author_id != request.user.id:
                 Notification.objects.create(
-                    recipient=post.author,      # The post owner receives the notification
-                    actor=request.user,         # The user who liked the post
-                    verb='liked',               # The action
-                    target=post,                # The post that was liked
+                    recipient_id=post.author_id, # The post owner receives the notification
+                    actor=request.user,          # The user who liked the post
+                    verb='liked',                # The action
+                    target=post,                 # The post that was liked
                 )
-        except ImportError:
-            # Handle case where notifications app/model might not be available
-            # or log an error/warning
-            print("Warning: Notifications app/model not found for like action.")
-            pass # Silently fail notification creation if app is missing
-        
+    if created:
         return Response({'message': 'Post liked successfully.'}, status=status.HTTP_201_CREATED)
+    return Response({'error': 'You have already liked this post.'}, status=status.HTTP_400_BAD_REQUEST)
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated]) # Ensure user is authenticated
-def unlike_post(request, post_id):
+def unlike_post(request, pk):
     """
     Unlike a post.
-    POST /api/posts/{post_id}/unlike/
+    POST /api/posts/{pk}/unlike/
     """
+    if buffered_likes_enabled():
+        # The like being undone may still be waiting in the buffer
+        get_like_buffer().flush()
+
     try:
-        post = Post.objects.get(pk=post_id)
+        post = Post.objects.get(pk=pk)
     except Post.DoesNotExist:
         return Response({'error': 'Post not found.'}, status=status.HTTP_404_NOT_FOUND)
 
     # --- Remove the like ---
     try:
-        like = Like.objects.get(user=request.user, post=post)
-        like.delete()
+        with transaction.atomic():
+            # Only the request that actually deletes the row decrements
+            deleted, _ = Like.objects.filter(user=request.user, post=post).delete()
+            if not deleted:
+                raise Like.DoesNotExist
+            adjust_likes(post, -1)
         
         # --- Optional: Delete corresponding notification ---
         # This part depends on how you want to manage notifications.
         # You might choose to keep them for history, or remove them.
-        # Example of removing the notification:
-        try:
-            from notifications.models import Notification
-            # Find the specific notification for this like action
-            # This assumes the structure created in like_post
-            notification_content_type = ContentType.objects.get_for_model(post)
-            Notification.objects.filter(
-                recipient=post.author,
-                actor=request.user,
-                verb='liked',
-                target_content_type=notification_content_type,
-                target_object_id=post.id
-            ).delete() # Delete the specific notification
-            # Note: Be careful with bulk deletes if other 'like' notifications exist.
-            # A more robust approach might involve linking the Notification directly to the Like instance.
-            
-        except ImportError:
-             print("Warning: Notifications app/model not found for unlike action.")
-             pass
+        # Find the specific notification for this like action
+        # This assumes the structure created in like_post
+        notification_content_type = ContentType.objects.get_for_model(post)
+        Notification.objects.filter(
+            recipient=post.author,
+            actor=request.user,
+            verb='liked',
+            target_content_type=notification_content_type,
+            target_object_id=post.id
+        ).delete() # Delete the specific notification
+        # Note: Be careful with bulk deletes if other 'like' notifications exist.
+        # A more robust approach might involve linking the Notification directly to the Like instance.
             
         return Response({'message': 'Post unliked successfully.'}, status=status.HTTP_200_OK)
     except Like.DoesNotExist:
         return Response({'error': 'You have not liked this post.'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_like_posts(request):
+    """
+    Like several posts at once, e.g. likes queued by an offline client.
+    POST /api/posts/bulk-like/
+    Body: {"post_ids": [1, 2, 3]}
+    Returns a status per post: liked, already_liked or not_found.
+    """
+    post_ids, error = parse_id_list(request.data, 'post_ids')
+    if error:
+        return error
+
+    # Same path as a like buffer flush: one query per table for the whole batch
+    posts = load_liked_posts(post_ids)
+    new_likes = store_likes([(request.user.id, post_id) for post_id in posts], posts)
+    # Rows this request inserted: a concurrent bulk like reports them as already_liked
+    liked = {post_id for _, post_id in new_likes}
+
+    results = []
+    for post_id in post_ids:
+        if post_id not in posts:
+            item_status = 'not_found'
+        elif post_id in liked:
+            item_status = 'liked'
+        else:
+            item_status = 'already_liked'
+        results.append({'post_id': post_id, 'status': item_status})
+    return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_unlike_posts(request):
+    """
+    Unlike several posts at once.
+    POST /api/posts/bulk-unlike/
+    Body: {"post_ids": [1, 2, 3]}
+    Returns a status per post: unliked, not_liked or not_found.
+    """
+    post_ids, error = parse_id_list(request.data, 'post_ids')
+    if error:
+        return error
+    if buffered_likes_enabled():
+        # Likes being undone may still be waiting in the buffer
+        get_like_buffer().flush()
+
+    posts = load_liked_posts(post_ids)
+    with transaction.atomic():
+        # Lock the rows so a concurrent unlike cannot decrement twice
+        unliked = set(
+            Like.objects.select_for_update()
+            .filter(user=request.user, post_id__in=posts.keys())
+            .values_list('post_id', flat=True)
+        )
+        if unliked:
+            Like.objects.filter(user=request.user, post_id__in=unliked).delete()
+            adjust_likes_many([posts[post_id] for post_id in unliked], -1)
+            Notification.objects.filter(
+                actor=request.user,
+                verb='liked',
+                target_content_type=ContentType.objects.get_for_model(Post),
+                target_object_id__in=unliked
+            ).delete()
+
+    results = []
+    for post_id in post_ids:
+        if post_id not in posts:
+            item_status = 'not_found'
+        elif post_id in unliked:
+            item_status = 'unliked'
+        else:
+            item_status = 'not_liked'
+        results.append({'post_id': post_id, 'status': item_status})
+    return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def tag_posts(request, tag):
+    """
+    Posts tagged with #tag, newest first.
+    GET /api/tags/{tag}/
+    Query Parameters:
+        - cursor=<cursor> (from links/cursors of the previous page)
+        - page_size=<n> (max 100)
+        - fields=id,title (sparse fieldset) and expand=comments
+    """
+    # Keyset pagination over the (tag, created_at, post) index
+    paginator = FeedCursorPagination()
+    posts = PostSerializer.setup_eager_loading(tag_queryset(tag), request)
+    page = paginator.paginate_fetch(paginator.queryset_fetch(posts), request, count=posts.count)
+    serializer = PostSerializer(page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
@@ -63,6 +63,86 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10  # Number of items per page
 }
 
+# Home feed (posts.timeline)
+# Number of entries kept in each follower's materialized timeline
+FEED_TIMELINE_DEPTH = 500
+# Authors with more followers than this are not fanned out on write;
+# their recent posts are merged into each reader's feed at read time.
+# Checked each time an author posts (stored in posts.FeedState)
+FEED_CELEBRITY_FOLLOWER_THRESHOLD = 10000
+# How many recent celebrity posts are merged into a feed per read
+FEED_CELEBRITY_MERGE_DEPTH = 100
+# Feed read path: 'timeline' (materialized timeline) or 'merge'
+# (k-way merge over cached per-author recent posts, see posts.merge_feed)
+FEED_READ_PATH = 'timeline'
+# Number of recent posts cached per author for the 'merge' read path
+FEED_AUTHOR_CACHE_DEPTH = 200
+# Engagement ranking (?rank=engagement, see posts.ranking): how many of the
+# newest feed posts are scored, and how fast a post's score halves with age
+FEED_RANK_CANDIDATES = 2000
+FEED_RANK_HALF_LIFE_HOURS = 24
+FEED_RANK_WEIGHTS = {'likes': 1.0, 'comments': 2.0, 'affinity': 1.5}
+# Seconds a cached first feed page is kept (see posts.feed_cache).
+# `manage.py precompute_feeds` refuses to run without a shared CACHES backend
+# (Redis, Memcached, database): per-process caches never reach the web servers.
+FEED_FIRST_PAGE_TIMEOUT = 3600
+
+# Comments embedded per post by list endpoints called with ?comments=latest
+POST_COMMENTS_PREVIEW_SIZE = 3
+
+# Like counters (see posts.counters): a post receiving more than
+# LIKE_SHARD_RATE_THRESHOLD likes in a minute switches to LIKE_COUNTER_SHARDS
+# counter rows, spreading concurrent likes over several row locks
+LIKE_SHARD_RATE_THRESHOLD = 120
+LIKE_COUNTER_SHARDS = 16
+# 'sync' stores each like in the request; 'buffered' acknowledges it at once
+# and batches the writes (see posts.like_buffer). After a crash in buffered
+# mode run `manage.py replay_like_buffer` before starting the app servers.
+LIKE_WRITE_MODE = 'sync'
+LIKE_BUFFER_FLUSH_INTERVAL = 0.25
+LIKE_BUFFER_DIR = BASE_DIR / 'like_buffer'
+LIKE_BUFFER_FSYNC = False
+
+# Most IDs accepted by one bulk like/unlike/follow/unfollow request
+BULK_ACTION_MAX_ITEMS = 100
+# Most user IDs accepted by one /api/accounts/relationships/ check
+RELATIONSHIP_CHECK_MAX_ITEMS = 500
+# /api/accounts/following/ and /followers/ return cursor pages
+# ({links, cursors, results}). True brings back the old bare list of
+# every user for clients that have not moved to the paged shape yet.
+FOLLOW_LIST_LEGACY_RESPONSE = False
+
+# Memory-mapped follow graph snapshot (see accounts.follow_graph), rebuilt by
+# `manage.py build_follow_graph`; processes reload changes since the build
+# at most every FOLLOW_GRAPH_REFRESH_INTERVAL seconds. Each refresh re-reads
+# the last FOLLOW_GRAPH_ID_LOOKBACK IDs it has seen, for follows committed
+# after rows with higher IDs (PostgreSQL assigns IDs before commit)
+FOLLOW_GRAPH_PATH = BASE_DIR / 'follow_graph.bin'
+FOLLOW_GRAPH_REFRESH_INTERVAL = 5
+FOLLOW_GRAPH_ID_LOOKBACK = 1000
+
+# Post search backend for ?search= (see posts.search). The SQLite FTS5 index
+# falls back to icontains scans on databases without the FTS5 table.
+POST_SEARCH_BACKEND = 'posts.search.SQLiteFTS5Backend'
+
+# Trending posts (see posts.trending): likes and comments are counted in
+# TRENDING_BUCKET_SECONDS buckets; `manage.py refresh_trending`, run on a
+# schedule, stores the top TRENDING_TOP_K posts per window for requests
+TRENDING_BUCKET_SECONDS = 300
+TRENDING_TOP_K = 100
+
+# Post views are appended to per-process spool files in this directory
+# and stored by `manage.py flush_post_views`, run on a schedule (see
+# posts.view_counter)
+POST_VIEW_SPOOL_DIR = BASE_DIR / 'view_spool'
+
+# Near-duplicate posts (see posts.near_duplicates): 'flag' records a
+# PostDuplicateFlag, 'reject' fails validation, None disables the check.
+# Posts whose estimated content similarity reaches the threshold match.
+POST_DUPLICATE_ACTION = 'flag'
+POST_DUPLICATE_THRESHOLD = 0.7
+POST_DUPLICATE_MAX_CANDIDATES = 50
+
 
 # Media files configuration (for profile pictures)
 MEDIA_URL = '/media/'